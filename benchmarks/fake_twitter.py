@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import random
+import re
+from socketserver import ThreadingMixIn
+import threading
+import time
+from urllib.parse import parse_qs, urlencode
+
+from twingo2.transport import SharedHTTPAdapter
+
+
+FIRST_TWITTER_ID = 1000000
+"""偽のTwitterが払い出すTwitter IDの開始値"""
+
+
+class FakeTwitter:
+    """
+    OAuth1のトークン発行とユーザー情報の取得(verify_credentials、users/show)のみを実装した偽のTwitter。
+    プロセス内のスレッドで動作し、応答の遅延とエラーの発生率を指定できる。
+    """
+
+    def __init__(self, users=100, latency=0.0, error_rate=0.0, seed=None):
+        """
+        FakeTwitterを構築する。
+
+        :param users: ログインするユーザーの数(この数を超えたログインは既存ユーザーの再ログインとなる)
+        :type users: int
+        :param latency: 1リクエストあたりの応答の遅延(秒)
+        :type latency: float
+        :param error_rate: 503を返却する確率
+        :type error_rate: float
+        :param seed: エラーを発生させる乱数のシード
+        :type seed: int
+        """
+        # 内部状態を初期化する
+        self.users = users
+        self.latency = latency
+        self.error_rate = error_rate
+        self.counts = {}
+        self._random = random.Random(seed)
+        self._request_tokens = {}
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def port(self):
+        """
+        待ち受けているポート番号。
+
+        :return: ポート番号
+        :rtype: int
+        """
+        return self._server.server_address[1]
+
+    def start(self):
+        """
+        待ち受けを開始する。
+        """
+        # 空いているポートで待ち受ける
+        self._server = _ThreadingHTTPServer(('127.0.0.1', 0), _make_handler(self))
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """
+        待ち受けを終了する。
+        """
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def make_adapter(self, **kwargs):
+        """
+        api.twitter.comへのリクエストを偽のTwitterに転送するHTTPアダプターを生成する。
+
+        :param kwargs: HTTPAdapterの引数
+        :type kwargs: dict
+        :return: HTTPアダプター
+        :rtype: FakeTwitterAdapter
+        """
+        return FakeTwitterAdapter('http://127.0.0.1:%d' % self.port, **kwargs)
+
+    def handle(self, method, path, authorization):
+        """
+        リクエストを処理する。
+
+        :param method: HTTPメソッド
+        :type method: str
+        :param path: パス
+        :type path: str
+        :param authorization: Authorizationヘッダー
+        :type authorization: str
+        :return: ステータスコード、Content-Type、レスポンスボディ
+        :rtype: tuple
+        """
+        # 呼び出し回数を記録する
+        endpoint = path.split('?', 1)[0]
+        with self._lock:
+            self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+            failed = self._random.random() < self.error_rate
+
+        # 遅延とエラーを再現する
+        if self.latency:
+            time.sleep(self.latency)
+        if failed:
+            return 503, 'application/json', json.dumps({'errors': [{'code': 130, 'message': 'Over capacity'}]})
+
+        # エンドポイントごとに処理する
+        token = _parse_oauth_param(authorization, 'oauth_token')
+        query = parse_qs(path.split('?', 1)[1]) if '?' in path else {}
+        if method == 'POST' and endpoint == '/oauth/request_token':
+            return 200, 'application/x-www-form-urlencoded', self._issue_request_token()
+        if method == 'POST' and endpoint == '/oauth/access_token':
+            return self._issue_access_token(token)
+        if method == 'GET' and endpoint == '/1.1/account/verify_credentials.json':
+            twitter_id, _, _ = (token or '').partition('-')
+            return self._show_user(twitter_id)
+        if method == 'GET' and endpoint == '/1.1/users/show.json':
+            return self._show_user(''.join(query.get('screen_name', [])).replace('user', '', 1))
+        return 404, 'application/json', json.dumps({'errors': [{'code': 34, 'message': 'Not found'}]})
+
+    def _issue_request_token(self):
+        """
+        リクエストトークンを発行する。
+        ログインするユーザーはリクエストトークンの発行順に割り当てる。
+
+        :return: レスポンスボディ
+        :rtype: str
+        """
+        with self._lock:
+            twitter_id = FIRST_TWITTER_ID + self._sequence % self.users
+            request_token = 'request-%d' % self._sequence
+            self._sequence += 1
+            self._request_tokens[request_token] = twitter_id
+        return urlencode({
+            'oauth_token': request_token,
+            'oauth_token_secret': 'request-secret',
+            'oauth_callback_confirmed': 'true',
+        })
+
+    def _issue_access_token(self, request_token):
+        """
+        アクセストークンを発行する。
+
+        :param request_token: リクエストトークン
+        :type request_token: str
+        :return: ステータスコード、Content-Type、レスポンスボディ
+        :rtype: tuple
+        """
+        with self._lock:
+            twitter_id = self._request_tokens.pop(request_token, None)
+        if twitter_id is None:
+            return 401, 'text/plain', 'Invalid request token.'
+        return 200, 'application/x-www-form-urlencoded', urlencode({
+            'oauth_token': '%d-access' % twitter_id,
+            'oauth_token_secret': 'access-secret',
+            'user_id': twitter_id,
+            'screen_name': 'user%d' % twitter_id,
+        })
+
+    def _show_user(self, twitter_id):
+        """
+        Twitter IDに対応するユーザー情報を返却する。
+
+        :param twitter_id: Twitter ID
+        :type twitter_id: str
+        :return: ステータスコード、Content-Type、レスポンスボディ
+        :rtype: tuple
+        """
+        if not twitter_id.isdigit():
+            return 401, 'application/json', json.dumps({'errors': [{'code': 89, 'message': 'Invalid token'}]})
+        twitter_id = int(twitter_id)
+        return 200, 'application/json', json.dumps({
+            'id': twitter_id,
+            'id_str': str(twitter_id),
+            'screen_name': 'user%d' % twitter_id,
+            'name': 'User %d' % twitter_id,
+            'description': '',
+            'location': '',
+            'url': None,
+            'profile_image_url': 'http://example.com/%d.png' % twitter_id,
+        })
+
+
+class FakeTwitterAdapter(SharedHTTPAdapter):
+    """
+    api.twitter.comへのリクエストを偽のTwitterに転送するHTTPアダプター。
+    """
+
+    def __init__(self, base_url, **kwargs):
+        """
+        FakeTwitterAdapterを構築する。
+
+        :param base_url: 偽のTwitterのURL
+        :type base_url: str
+        :param kwargs: HTTPAdapterの引数
+        :type kwargs: dict
+        """
+        super().__init__(**kwargs)
+        self._base_url = base_url
+
+    def send(self, request, **kwargs):
+        """
+        転送先のURLに書き換えて送信する。
+
+        :param request: リクエスト
+        :type request: requests.PreparedRequest
+        :param kwargs: HTTPAdapter.send()の引数
+        :type kwargs: dict
+        :return: レスポンス
+        :rtype: requests.Response
+        """
+        # OAuthの署名は元のURLで計算済みのため、送信先のみを書き換える
+        request.url = re.sub(r'^https://api\.twitter\.com', self._base_url, request.url)
+        return super().send(request, **kwargs)
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """
+    リクエストごとにスレッドを生成するHTTPサーバー。
+    """
+
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def _make_handler(fake_twitter):
+    """
+    偽のTwitterに処理を委ねるリクエストハンドラーを生成する。
+
+    :param fake_twitter: 偽のTwitter
+    :type fake_twitter: FakeTwitter
+    :return: リクエストハンドラーのクラス
+    :rtype: type
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            self._respond('GET')
+
+        def do_POST(self):
+            self._respond('POST')
+
+        def _respond(self, method):
+            # リクエストボディを読み捨ててKeep-Aliveを維持する
+            length = int(self.headers.get('Content-Length') or 0)
+            if length:
+                self.rfile.read(length)
+            status, content_type, body = fake_twitter.handle(method, self.path, self.headers.get('Authorization'))
+            data = body.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def _parse_oauth_param(authorization, name):
+    """
+    OAuthのAuthorizationヘッダーから指定されたパラメーターを取り出す。
+
+    :param authorization: Authorizationヘッダー
+    :type authorization: str
+    :param name: パラメーター名
+    :type name: str
+    :return: パラメーターの値(存在しない場合はNone)
+    :rtype: str
+    """
+    match = re.search(r'%s="([^"]*)"' % name, authorization or '')
+    return match.group(1) if match else None
@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+偽のTwitterを相手にログイン処理の性能を計測するベンチマーク。
+
+    $ python -m benchmarks.login --logins 1000 --concurrency 8 --latency 0.05 --output result.json
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+
+def percentile(values, rate):
+    """
+    最近傍順位法によりパーセンタイルを求める。
+
+    :param values: 値のリスト
+    :type values: list
+    :param rate: 求めるパーセンタイル(0〜100)
+    :type rate: float
+    :return: パーセンタイル(値が存在しない場合はNone)
+    :rtype: float
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(-(-rate * len(ordered) // 100)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies, queries):
+    """
+    所要時間とクエリ数を集計する。
+
+    :param latencies: 所要時間(秒)のリスト
+    :type latencies: list
+    :param queries: クエリ数のリスト
+    :type queries: list
+    :return: 集計結果
+    :rtype: dict
+    """
+    def to_ms(value):
+        return None if value is None else round(value * 1000, 3)
+
+    return {
+        'count': len(latencies),
+        'latency_ms': {
+            'mean': to_ms(sum(latencies) / len(latencies)) if latencies else None,
+            'p50': to_ms(percentile(latencies, 50)),
+            'p99': to_ms(percentile(latencies, 99)),
+            'max': to_ms(max(latencies)) if latencies else None,
+        },
+        'queries': {
+            'mean': round(sum(queries) / len(queries), 3) if queries else None,
+            'max': max(queries) if queries else None,
+        },
+    }
+
+
+class Worker:
+    """
+    ログインからログイン後のリクエストまでを繰り返すワーカー。
+    """
+
+    def __init__(self, requests_per_login):
+        """
+        Workerを構築する。
+
+        :param requests_per_login: ログイン後に送信するリクエストの数
+        :type requests_per_login: int
+        """
+        # 集計結果を初期化する
+        self.requests_per_login = requests_per_login
+        self.login_latencies = []
+        self.login_queries = []
+        self.request_latencies = []
+        self.request_queries = []
+        self.failures = {}
+        self._lock = threading.Lock()
+
+    def run_once(self):
+        """
+        1回のログインとログイン後のリクエストを実行する。
+        """
+        from django.db import connection
+        from django.test import Client
+        from django.test.utils import CaptureQueriesContext
+
+        # ログインを開始し、偽のTwitterが発行したリクエストトークンで承認済みとしてコールバックする
+        client = Client()
+        started_at = time.perf_counter()
+        with CaptureQueriesContext(connection) as captured:
+            response = client.get('/twingo2/login/')
+            if response.status_code == 302:
+                query = parse_qs(urlparse(response['Location']).query)
+                response = client.get('/twingo2/callback/', {
+                    'oauth_token': query['oauth_token'][0],
+                    'oauth_verifier': 'verifier',
+                })
+        login_latency = time.perf_counter() - started_at
+        if response.status_code != 302:
+            self._record_failure('login_%d' % response.status_code)
+            return
+        with self._lock:
+            self.login_latencies.append(login_latency)
+            self.login_queries.append(len(captured))
+
+        # ログイン後のリクエストを送信する
+        for _ in range(self.requests_per_login):
+            started_at = time.perf_counter()
+            with CaptureQueriesContext(connection) as captured:
+                response = client.get('/whoami/')
+            request_latency = time.perf_counter() - started_at
+            if response.status_code != 200:
+                self._record_failure('request_%d' % response.status_code)
+                continue
+            with self._lock:
+                self.request_latencies.append(request_latency)
+                self.request_queries.append(len(captured))
+
+    def _record_failure(self, reason):
+        """
+        失敗を記録する。
+
+        :param reason: 失敗の原因
+        :type reason: str
+        """
+        with self._lock:
+            self.failures[reason] = self.failures.get(reason, 0) + 1
+
+
+def run(options):
+    """
+    ベンチマークを実行する。
+
+    :param options: コマンドラインオプション
+    :type options: argparse.Namespace
+    :return: 計測結果
+    :rtype: dict
+    """
+    import django
+    from django.conf import settings
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    import twingo2
+    from twingo2 import transport
+
+    from benchmarks.fake_twitter import FakeTwitter
+
+    # Djangoを初期化し、ベンチマーク用のデータベースを作成する
+    django.setup()
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+    # Twitterへの通信をすべて偽のTwitterに転送する
+    fake_twitter = FakeTwitter(
+        users=options.users, latency=options.latency, error_rate=options.error_rate, seed=options.seed
+    )
+    fake_twitter.start()
+    transport.install()
+    transport.get_transport().adapter = fake_twitter.make_adapter(
+        pool_connections=getattr(settings, 'TWITTER_POOL_CONNECTIONS', 4),
+        pool_maxsize=getattr(settings, 'TWITTER_POOL_MAXSIZE', None) or 10,
+    )
+
+    try:
+        # ワーカーを並行して実行する
+        worker = Worker(options.requests_per_login)
+        started_at = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options.concurrency) as executor:
+            futures = [executor.submit(_run_in_thread, worker) for _ in range(options.logins)]
+            for future in futures:
+                future.result()
+        elapsed = time.perf_counter() - started_at
+    finally:
+        fake_twitter.stop()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+    # 計測結果をまとめる
+    return {
+        'benchmark': 'login',
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'environment': {
+            'twingo2': twingo2.__version__,
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+        },
+        'config': {
+            'logins': options.logins,
+            'concurrency': options.concurrency,
+            'users': options.users,
+            'requests_per_login': options.requests_per_login,
+            'latency': options.latency,
+            'error_rate': options.error_rate,
+            'seed': options.seed,
+        },
+        'elapsed_seconds': round(elapsed, 3),
+        'logins_per_second': round(len(worker.login_latencies) / elapsed, 3) if elapsed else None,
+        'logins': summarize(worker.login_latencies, worker.login_queries),
+        'requests': summarize(worker.request_latencies, worker.request_queries),
+        'failures': worker.failures,
+        'twitter_requests': dict(sorted(fake_twitter.counts.items())),
+    }
+
+
+def _run_in_thread(worker):
+    """
+    ワーカースレッドで1回のログインを実行し、データベース接続を閉じる。
+
+    :param worker: ワーカー
+    :type worker: Worker
+    """
+    from django.db import connection
+
+    try:
+        worker.run_once()
+    finally:
+        connection.close()
+
+
+def main(argv=None):
+    """
+    コマンドラインからベンチマークを実行する。
+
+    :param argv: コマンドライン引数
+    :type argv: list
+    """
+    # 引数を解析する
+    parser = argparse.ArgumentParser(description='Benchmark the twingo2 login pipeline against a fake Twitter.')
+    parser.add_argument('--logins', type=int, default=200, help='Number of logins (default: 200).')
+    parser.add_argument('--concurrency', type=int, default=4, help='Number of concurrent clients (default: 4).')
+    parser.add_argument('--users', type=int, default=50, help='Number of distinct Twitter users (default: 50).')
+    parser.add_argument(
+        '--requests-per-login', type=int, default=5,
+        help='Authenticated requests sent after each login (default: 5).'
+    )
+    parser.add_argument('--latency', type=float, default=0.0, help='Fake Twitter response delay in seconds.')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Probability of a 503 from fake Twitter.')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed for injected errors.')
+    parser.add_argument('--output', default='-', help='File to write the JSON result to (default: stdout).')
+    options = parser.parse_args(argv)
+
+    # ベンチマークを実行して結果を出力する
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+    result = json.dumps(run(options), indent=2, sort_keys=True)
+    if options.output == '-':
+        sys.stdout.write(result + '\n')
+    else:
+        with open(options.output, 'w') as f:
+            f.write(result + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import tempfile
+
+from tests.settings import *  # noqa
+
+
+DEBUG = False
+
+ROOT_URLCONF = 'benchmarks.urls'
+
+# 並行してログインできるようにファイルのデータベースを使用する
+DATABASES['default']['TEST'] = {
+    'NAME': os.path.join(tempfile.gettempdir(), 'twingo2_benchmark.sqlite3'),
+}
+
+TWITTER_POOL_MAXSIZE = 32
+
+TWITTER_TIMEOUT = 10
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from django.conf.urls import include, patterns, url
+from django.contrib.auth.decorators import login_required
+from django.http import HttpResponse
+
+
+urlpatterns = patterns('',
+    (r'^twingo2/', include('twingo2.urls')),
+    url(r'^whoami/$', 'benchmarks.urls.whoami', name='whoami'),
+)
+
+
+@login_required
+def whoami(request):
+    """
+    ログイン中のユーザー名を返却する。
+    """
+    return HttpResponse(request.user.screen_name)
@@ -29,6 +29,8 @@ setup(
     author='Jun-ya HASEBA',
     author_email='7pairs@gmail.com',
     url='https://github.com/7pairs/twingo2',
-    packages=find_packages(exclude=['tests']),
-    install_requires=['tweepy>=3.0'],
+    packages=find_packages(exclude=['tests', 'benchmarks']),
+    package_data={'twingo2': ['templates/admin/twingo2/user/*.html']},
+    install_requires=['Django>=1.8', 'tweepy>=3.0'],
+    extras_require={'encryption': ['cryptography>=2.0'], 'images': ['Pillow>=4.0']},
 )
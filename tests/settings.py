@@ -56,7 +56,15 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'test.db'),
-    }
+    },
+    'shard0': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'test_shard0.db'),
+    },
+    'shard1': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'test_shard1.db'),
+    },
 }
 
 LANGUAGE_CODE = 'ja'
@@ -86,3 +94,5 @@ AUTH_USER_MODEL = 'twingo2.User'
 
 CONSUMER_KEY = 'consumer_key'
 CONSUMER_SECRET = 'consumer_secret'
+
+USER_ADMIN_ENABLED = True
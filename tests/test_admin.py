@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import datetime
+from mock import patch
+
+import factory
+
+from django.contrib import admin
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+
+from twingo2.admin import UserAdmin, estimate_count
+from twingo2.models import User
+
+
+class UserFactory(factory.DjangoModelFactory):
+    """
+    Userのテストデータを作成するファクトリー。
+    """
+
+    class Meta:
+        model = User
+
+    twitter_id = factory.Sequence(lambda x: x + 1)
+    screen_name = factory.Sequence(lambda x: 'screen_name_%02d' % x)
+    name = factory.Sequence(lambda x: 'name_%02d' % x)
+    is_active = True
+    is_superuser = False
+    is_staff = False
+    last_login = datetime.datetime.now()
+
+
+class UserAdminTest(TestCase):
+    """
+    admin.pyに対するテストコード。
+    """
+
+    def setUp(self):
+        """
+        初期処理を実行する。
+        """
+        # 管理者と一般ユーザーを作成する
+        self.admin_user = UserFactory(screen_name='admin', is_superuser=True, is_staff=True)
+        self.users = [UserFactory() for _ in range(5)]
+        self.model_admin = UserAdmin(User, admin.site)
+        self.model_admin.list_per_page = 2
+        self.factory = RequestFactory()
+
+    def get_changelist(self, **params):
+        """
+        一覧画面を表示し、ChangeListを取得する。
+
+        :param params: クエリパラメーター
+        :type params: dict
+        :return: ChangeList
+        :rtype: twingo2.admin.KeysetChangeList
+        """
+        request = self.factory.get('/admin/twingo2/user/', params)
+        request.user = self.admin_user
+        response = self.model_admin.changelist_view(request)
+        response.render()
+        return response.context_data['cl']
+
+    def post_action(self, action, users):
+        """
+        一括操作を実行する。
+
+        :param action: 操作の名前
+        :type action: str
+        :param users: 選択するユーザーのリスト
+        :type users: list
+        """
+        request = self.factory.post('/admin/twingo2/user/', {
+            'action': action,
+            ACTION_CHECKBOX_NAME: [user.pk for user in users],
+            'index': 0,
+        })
+        request.user = self.admin_user
+        request._dont_enforce_csrf_checks = True
+        with patch.object(self.model_admin, 'message_user'):
+            self.model_admin.changelist_view(request)
+
+    def test_estimate_count_01(self):
+        """
+        [対象] estimate_count() : No.01
+        [条件] 上限より少ない件数のクエリセットを指定する。
+        [結果] 件数が返却される。
+        """
+        self.assertEqual(6, estimate_count(User.objects.all()))
+
+    def test_estimate_count_02(self):
+        """
+        [対象] estimate_count() : No.02
+        [条件] 上限より多い件数のクエリセットを指定する。
+        [結果] 上限が返却される。
+        """
+        self.assertEqual(3, estimate_count(User.objects.all(), limit=3))
+
+    def test_changelist_view_01(self):
+        """
+        [対象] changelist_view() : No.01
+        [条件] ページを指定せずに一覧画面を表示する。
+        [結果] IDの降順に1ページ目が表示され、次のページへのリンクには最後のIDが含まれる。
+        """
+        cl = self.get_changelist()
+
+        expected = sorted(User.objects.values_list('pk', flat=True), reverse=True)
+        self.assertEqual(expected[:2], [user.pk for user in cl.result_list])
+        self.assertEqual(6, cl.result_count)
+        self.assertFalse(cl.has_previous)
+        self.assertIn('after=%d' % expected[1], cl.next_page_url)
+
+    def test_changelist_view_02(self):
+        """
+        [対象] changelist_view() : No.02
+        [条件] 最後のページの直前のIDを指定して一覧画面を表示する。
+        [結果] 残りのユーザーが表示され、次のページへのリンクは表示されない。
+        """
+        expected = sorted(User.objects.values_list('pk', flat=True), reverse=True)
+        cl = self.get_changelist(after=expected[3])
+
+        self.assertEqual(expected[4:], [user.pk for user in cl.result_list])
+        self.assertTrue(cl.has_previous)
+        self.assertIsNone(cl.next_page_url)
+
+    def test_changelist_view_03(self):
+        """
+        [対象] changelist_view() : No.03
+        [条件] 絞り込みの条件と検索語を指定して一覧画面を表示する。
+        [結果] 条件に一致するユーザーのみが表示される。
+        """
+        cl = self.get_changelist(is_staff__exact=1)
+        self.assertEqual([self.admin_user.pk], [user.pk for user in cl.result_list])
+
+        cl = self.get_changelist(q=self.users[0].screen_name)
+        self.assertEqual([self.users[0].pk], [user.pk for user in cl.result_list])
+
+    def test_deactivate_users_01(self):
+        """
+        [対象] deactivate_users() : No.01
+        [条件] 操作しているユーザーを含む複数のユーザーを選択して無効にする。
+        [結果] 操作しているユーザー以外が無効になる。
+        """
+        self.post_action('deactivate_users', self.users[:4] + [self.admin_user])
+
+        self.assertEqual(
+            [self.admin_user.pk, self.users[4].pk],
+            sorted(User.objects.filter(is_active=True).values_list('pk', flat=True))
+        )
+
+    @override_settings(USER_ADMIN_BATCH_SIZE=2)
+    def test_update_in_batches_01(self):
+        """
+        [対象] _update_in_batches() : No.01
+        [条件] バッチの件数を超えるユーザーを更新する。
+        [結果] ユーザーを読み込まずに、バッチごとの主キーの取得とUPDATEで更新される。
+        """
+        with self.assertNumQueries(5):
+            updated = self.model_admin._update_in_batches(
+                User.objects.filter(pk__in=[user.pk for user in self.users[:4]]), is_active=False
+            )
+
+        self.assertEqual(4, updated)
+        self.assertEqual(2, User.objects.filter(is_active=True).count())
+
+    def test_activate_users_01(self):
+        """
+        [対象] activate_users() : No.01
+        [条件] 無効なユーザーを選択して有効にする。
+        [結果] 選択したユーザーが有効になる。
+        """
+        User.objects.filter(pk=self.users[0].pk).update(is_active=False)
+
+        self.post_action('activate_users', [self.users[0]])
+
+        self.assertTrue(User.objects.get(pk=self.users[0].pk).is_active)
+
+    def test_promote_to_staff_01(self):
+        """
+        [対象] promote_to_staff() : No.01
+        [条件] 一般ユーザーを選択して管理画面の操作権限を付与する。
+        [結果] 選択したユーザーのみに権限が付与される。
+        """
+        self.post_action('promote_to_staff', self.users[:2])
+
+        self.assertEqual(
+            sorted([self.admin_user.pk, self.users[0].pk, self.users[1].pk]),
+            sorted(User.objects.filter(is_staff=True).values_list('pk', flat=True))
+        )
+
+    def test_change_view_01(self):
+        """
+        [対象] change_view() : No.01
+        [条件] 管理画面操作権限のみを持つユーザーが、自分自身に管理者権限と無効化を指定して変更画面を送信する。
+        [結果] 権限と有効フラグは変更されない。
+        """
+        staff = UserFactory(is_staff=True)
+        request = self.factory.post('/admin/twingo2/user/%d/' % staff.pk, {
+            'screen_name': 'changed',
+            'name': staff.name,
+            'is_active': '',
+            'is_staff': 'on',
+            'is_superuser': 'on',
+            'last_login_0': '2015-01-01',
+            'last_login_1': '00:00:00',
+        })
+        request.user = staff
+        request._dont_enforce_csrf_checks = True
+        with patch.object(self.model_admin, 'message_user'):
+            response = self.model_admin.change_view(request, str(staff.pk))
+
+        staff = User.objects.get(pk=staff.pk)
+        self.assertEqual(302, response.status_code)
+        self.assertEqual('changed', staff.screen_name)
+        self.assertFalse(staff.is_superuser)
+        self.assertTrue(staff.is_active)
+
+    def test_promote_to_staff_02(self):
+        """
+        [対象] promote_to_staff() : No.02
+        [条件] 管理画面操作権限のみを持つユーザーが一般ユーザーに権限を付与する。
+        [結果] 一括操作は実行されず、権限は付与されない。
+        """
+        self.admin_user = UserFactory(is_staff=True)
+
+        self.post_action('promote_to_staff', self.users[:1])
+
+        self.assertFalse(User.objects.get(pk=self.users[0].pk).is_staff)
@@ -17,15 +17,18 @@
 #
 
 import datetime
-from mock import patch
+from mock import Mock, patch
 
 import factory
 from tweepy.error import TweepError
 
+from django.core.cache import cache
 from django.test import TestCase
 from django.test.utils import override_settings
 
-from twingo2.models import User
+from twingo2.cache import access_token_cache, user_cache
+from twingo2.circuit import CircuitOpenError
+from twingo2.models import AccessToken, User
 
 
 class TwitterUser:
@@ -204,6 +207,291 @@ class BackendsTest(TestCase):
 
         self.assertIsNone(actual)
 
+    @override_settings(PROFILE_REFRESH_INTERVAL=3600)
+    @patch('twingo2.backends.API')
+    @patch('twingo2.backends.OAuthHandler')
+    def test_authenticate_06(self, oauth_handler, api):
+        """
+        [対象] authenticate() : No.06
+        [条件] 更新間隔を過ぎた既存ユーザーのプロフィールがTwitterで変更されている。
+        [結果] 変更されたフィールドのみが更新される。
+        """
+        user = UserFactory()
+        User.objects.filter(pk=user.pk).update(updated_at=user.updated_at - datetime.timedelta(hours=2))
+        api.return_value.me.return_value = TwitterUser(
+            id=user.twitter_id,
+            screen_name='7pairs',
+            name=user.name,
+            description=user.description,
+            location=user.location,
+            url=None,
+            profile_image_url=user.profile_image_url
+        )
+
+        twitter_backend = self._get_target_object()
+        with patch.object(User, 'save', autospec=True, side_effect=User.save) as save:
+            actual = twitter_backend.authenticate(('key', 'secret'))
+
+        user = User.objects.get(pk=user.pk)
+        self.assertEqual(user, actual)
+        self.assertEqual('7pairs', user.screen_name)
+        self.assertEqual('', user.url)
+        self.assertEqual(['screen_name', 'url', 'updated_at', 'profile_checked_at'], save.call_args[1]['update_fields'])
+
+    @override_settings(PROFILE_REFRESH_INTERVAL=3600)
+    @patch('twingo2.backends.API')
+    @patch('twingo2.backends.OAuthHandler')
+    def test_authenticate_07(self, oauth_handler, api):
+        """
+        [対象] authenticate() : No.07
+        [条件] 更新間隔内の既存ユーザーのプロフィールがTwitterで変更されている。
+        [結果] プロフィールは更新されない。
+        """
+        user = UserFactory()
+        api.return_value.me.return_value = TwitterUser(id=user.twitter_id, screen_name='7pairs')
+
+        twitter_backend = self._get_target_object()
+        with self.assertNumQueries(1):
+            actual = twitter_backend.authenticate(('key', 'secret'))
+
+        self.assertEqual(user, actual)
+        self.assertEqual(user.screen_name, User.objects.get(pk=user.pk).screen_name)
+
+    @override_settings(PROFILE_REFRESH_INTERVAL=3600)
+    @patch('twingo2.backends.API')
+    @patch('twingo2.backends.OAuthHandler')
+    def test_authenticate_08(self, oauth_handler, api):
+        """
+        [対象] authenticate() : No.08
+        [条件] 更新間隔を過ぎた既存ユーザーのプロフィールがTwitterで変更されていない。
+        [結果] プロフィール確認日時のみが更新され、次回のログインではTwitterに問い合わせない。
+        """
+        user = UserFactory()
+        User.objects.filter(pk=user.pk).update(updated_at=user.updated_at - datetime.timedelta(hours=2))
+        api.return_value.me.return_value = TwitterUser(
+            id=user.twitter_id,
+            screen_name=user.screen_name,
+            name=user.name,
+            description=user.description,
+            location=user.location,
+            url=user.url,
+            profile_image_url=user.profile_image_url
+        )
+
+        twitter_backend = self._get_target_object()
+        with self.assertNumQueries(2):
+            actual = twitter_backend.authenticate(('key', 'secret'))
+        twitter_backend.authenticate(('key', 'secret'), twitter_id=user.twitter_id)
+
+        self.assertEqual(user, actual)
+        self.assertEqual(1, api.return_value.me.call_count)
+        self.assertIsNotNone(User.objects.get(pk=user.pk).profile_checked_at)
+
+    @override_settings(TWITTER_DEGRADED_MODE=True)
+    @patch('twingo2.backends.twitter_breaker')
+    @patch('twingo2.backends.API')
+    @patch('twingo2.backends.OAuthHandler')
+    def test_authenticate_09(self, oauth_handler, api, twitter_breaker):
+        """
+        [対象] authenticate() : No.09
+        [条件] 縮退運転を有効にし、サーキットブレーカーが遮断中の状態で既存ユーザーがログインする。
+        [結果] Twitterに問い合わせずに該当ユーザーのUserオブジェクトが返却される。
+        """
+        user = UserFactory(twitter_id=1402804142)
+        twitter_breaker.__enter__.side_effect = CircuitOpenError()
+
+        twitter_backend = self._get_target_object()
+        actual = twitter_backend.authenticate(('1402804142-token', 'secret'))
+
+        self.assertEqual(user, actual)
+        self.assertFalse(api.return_value.me.called)
+
+    @override_settings(TWITTER_DEGRADED_MODE=True)
+    @patch('twingo2.backends.API')
+    @patch('twingo2.backends.OAuthHandler')
+    def test_authenticate_10(self, oauth_handler, api):
+        """
+        [対象] authenticate() : No.10
+        [条件] 縮退運転を有効にし、Twitterがタイムアウトした状態で未登録のユーザーがログインする。
+        [結果] ユーザーは作成されず、Noneが返却される。
+        """
+        api.return_value.me.side_effect = TweepError('reason', Mock(status_code=503))
+
+        twitter_backend = self._get_target_object()
+        actual = twitter_backend.authenticate(('1402804142-token', 'secret'))
+
+        self.assertIsNone(actual)
+        self.assertFalse(User.objects.exists())
+
+    @patch('twingo2.backends.twitter_breaker')
+    @patch('twingo2.backends.API')
+    @patch('twingo2.backends.OAuthHandler')
+    def test_authenticate_11(self, oauth_handler, api, twitter_breaker):
+        """
+        [対象] authenticate() : No.11
+        [条件] 縮退運転を有効にせず、サーキットブレーカーが遮断中の状態で既存ユーザーがログインする。
+        [結果] Noneが返却される。
+        """
+        UserFactory(twitter_id=1402804142)
+        twitter_breaker.__enter__.side_effect = CircuitOpenError()
+
+        twitter_backend = self._get_target_object()
+        actual = twitter_backend.authenticate(('1402804142-token', 'secret'))
+
+        self.assertIsNone(actual)
+
+    @override_settings(ACCESS_TOKEN_CACHE_TIMEOUT=3600)
+    @patch('twingo2.backends.API')
+    @patch('twingo2.backends.OAuthHandler')
+    def test_authenticate_12(self, oauth_handler, api):
+        """
+        [対象] authenticate() : No.12
+        [条件] アクセストークンのキャッシュを有効にし、同じアクセストークンで2回ログインする。
+        [結果] 2回目はTwitterに問い合わせず、1回のクエリで該当ユーザーのUserオブジェクトが返却される。
+        """
+        cache.clear()
+        user = UserFactory()
+        api.return_value.me.return_value = TwitterUser(id=user.twitter_id)
+
+        twitter_backend = self._get_target_object()
+        twitter_backend.authenticate(('key', 'secret'))
+        with self.assertNumQueries(1):
+            actual = twitter_backend.authenticate(('key', 'secret'))
+
+        self.assertEqual(user, actual)
+        self.assertEqual(1, api.return_value.me.call_count)
+
+    @override_settings(ACCESS_TOKEN_CACHE_TIMEOUT=3600)
+    @patch('twingo2.backends.API')
+    @patch('twingo2.backends.OAuthHandler')
+    def test_authenticate_13(self, oauth_handler, api):
+        """
+        [対象] authenticate() : No.13
+        [条件] アクセストークンのキャッシュを有効にし、ログイン後に無効化されたユーザーが同じアクセストークンでログインする。
+        [結果] Noneが返却され、キャッシュから削除される。
+        """
+        cache.clear()
+        user = UserFactory()
+        api.return_value.me.return_value = TwitterUser(id=user.twitter_id)
+
+        twitter_backend = self._get_target_object()
+        twitter_backend.authenticate(('key', 'secret'))
+        User.objects.filter(pk=user.pk).update(is_active=False)
+        actual = twitter_backend.authenticate(('key', 'secret'))
+
+        self.assertIsNone(actual)
+        self.assertIsNone(access_token_cache.get(('key', 'secret')))
+
+    @override_settings(ACCESS_TOKEN_CACHE_TIMEOUT=3600)
+    @patch('twingo2.backends.API')
+    @patch('twingo2.backends.OAuthHandler')
+    def test_authenticate_14(self, oauth_handler, api):
+        """
+        [対象] authenticate() : No.14
+        [条件] 既存ユーザーのTwitter IDを指定してログインする。
+        [結果] Twitterに問い合わせず、1回のクエリで該当ユーザーのUserオブジェクトが返却され、アクセストークンがキャッシュされる。
+        """
+        cache.clear()
+        user = UserFactory()
+
+        twitter_backend = self._get_target_object()
+        with self.assertNumQueries(1):
+            actual = twitter_backend.authenticate(('key', 'secret'), twitter_id=user.twitter_id)
+
+        self.assertEqual(user, actual)
+        self.assertFalse(api.return_value.me.called)
+        self.assertEqual(user.twitter_id, access_token_cache.get(('key', 'secret')))
+
+    @patch('twingo2.backends.API')
+    @patch('twingo2.backends.OAuthHandler')
+    def test_authenticate_15(self, oauth_handler, api):
+        """
+        [対象] authenticate() : No.15
+        [条件] 未登録のTwitter IDを指定してログインする。
+        [結果] Twitterに問い合わせてUserが作成される。
+        """
+        api.return_value.me.return_value = TwitterUser(
+            id=1402804142, screen_name='7pairs', name='ちぃといつ', description='', location='', url='',
+            profile_image_url=''
+        )
+
+        twitter_backend = self._get_target_object()
+        actual = twitter_backend.authenticate(('key', 'secret'), twitter_id=1402804142)
+
+        self.assertEqual(1402804142, actual.twitter_id)
+        self.assertEqual(1, api.return_value.me.call_count)
+
+    @override_settings(PROFILE_REFRESH_INTERVAL=3600)
+    @patch('twingo2.backends.API')
+    @patch('twingo2.backends.OAuthHandler')
+    def test_authenticate_16(self, oauth_handler, api):
+        """
+        [対象] authenticate() : No.16
+        [条件] プロフィールの更新が必要な既存ユーザーのTwitter IDを指定してログインする。
+        [結果] Twitterに問い合わせてプロフィールが更新される。
+        """
+        user = UserFactory()
+        User.objects.filter(pk=user.pk).update(updated_at=user.updated_at - datetime.timedelta(hours=2))
+        api.return_value.me.return_value = TwitterUser(
+            id=user.twitter_id, screen_name='new_screen_name', name=user.name, description=user.description,
+            location=user.location, url=user.url, profile_image_url=user.profile_image_url
+        )
+
+        twitter_backend = self._get_target_object()
+        actual = twitter_backend.authenticate(('key', 'secret'), twitter_id=user.twitter_id)
+
+        self.assertEqual('new_screen_name', actual.screen_name)
+        self.assertEqual(1, api.return_value.me.call_count)
+
+    @patch('twingo2.backends.API')
+    @patch('twingo2.backends.OAuthHandler')
+    def test_authenticate_17(self, oauth_handler, api):
+        """
+        [対象] authenticate() : No.17
+        [条件] 無効なユーザーのTwitter IDを指定してログインする。
+        [結果] Twitterに問い合わせずにNoneが返却される。
+        """
+        user = DisableUserFactory()
+
+        twitter_backend = self._get_target_object()
+        actual = twitter_backend.authenticate(('key', 'secret'), twitter_id=user.twitter_id)
+
+        self.assertIsNone(actual)
+        self.assertFalse(api.return_value.me.called)
+
+    @override_settings(TOKEN_ENCRYPTION_KEYS=['8ImC3AIUj2eme1NQtyfS_bJ8wE-GR5_cO-vjH36zRqg='])
+    @patch('twingo2.backends.API')
+    @patch('twingo2.backends.OAuthHandler')
+    def test_authenticate_18(self, oauth_handler, api):
+        """
+        [対象] authenticate() : No.18
+        [条件] アクセストークンの暗号化保存を有効にしてログインする。
+        [結果] アクセストークンが保存される。
+        """
+        user = UserFactory()
+        api.return_value.me.return_value = TwitterUser(id=user.twitter_id)
+
+        twitter_backend = self._get_target_object()
+        twitter_backend.authenticate(('key', 'secret'))
+
+        self.assertEqual(('key', 'secret'), AccessToken.objects.get(user=user).get_access_token())
+
+    @patch('twingo2.backends.API')
+    @patch('twingo2.backends.OAuthHandler')
+    def test_authenticate_19(self, oauth_handler, api):
+        """
+        [対象] authenticate() : No.19
+        [条件] アクセストークンの暗号化保存を有効にせずにログインする。
+        [結果] アクセストークンは保存されない。
+        """
+        user = UserFactory()
+        api.return_value.me.return_value = TwitterUser(id=user.twitter_id)
+
+        twitter_backend = self._get_target_object()
+        twitter_backend.authenticate(('key', 'secret'))
+
+        self.assertFalse(AccessToken.objects.exists())
+
     def test_get_user_01(self):
         """
         [対象] get_user() : No.01
@@ -242,3 +530,40 @@ class BackendsTest(TestCase):
         actual = twitter_backend.get_user(user.id)
 
         self.assertIsNone(actual)
+
+    @override_settings(USER_CACHE_TIMEOUT=60)
+    def test_get_user_04(self):
+        """
+        [対象] get_user() : No.04
+        [条件] キャッシュを有効にして同じユーザーを2回取得する。
+        [結果] 2回目はデータベースにアクセスせずに該当ユーザーのUserオブジェクトが返却される。
+        """
+        user_cache.clear()
+        cache.clear()
+        user = UserFactory()
+
+        twitter_backend = self._get_target_object()
+        twitter_backend.get_user(user.id)
+        with self.assertNumQueries(0):
+            actual = twitter_backend.get_user(user.id)
+
+        self.assertEqual(user, actual)
+
+    @override_settings(USER_CACHE_TIMEOUT=60)
+    def test_get_user_05(self):
+        """
+        [対象] get_user() : No.05
+        [条件] キャッシュを有効にして取得したユーザーを無効化する。
+        [結果] Noneが返却される。
+        """
+        user_cache.clear()
+        cache.clear()
+        user = UserFactory()
+
+        twitter_backend = self._get_target_object()
+        twitter_backend.get_user(user.id)
+        user.is_active = False
+        user.save()
+        actual = twitter_backend.get_user(user.id)
+
+        self.assertIsNone(actual)
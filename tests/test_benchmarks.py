@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from mock import patch
+
+import requests
+from tweepy import API
+import tweepy.binder
+
+from django.test import TestCase
+
+from twingo2 import transport
+from twingo2.twitter import OAuthHandler
+
+from benchmarks.fake_twitter import FIRST_TWITTER_ID, FakeTwitter
+from benchmarks.login import percentile, summarize
+
+
+class FakeTwitterTest(TestCase):
+    """
+    benchmarks.fake_twitter.FakeTwitterに対するテストコード。
+    """
+
+    def setUp(self):
+        """
+        初期処理を実行する。
+        """
+        # 偽のTwitterを起動する
+        self.fake_twitter = FakeTwitter(users=2)
+        self.fake_twitter.start()
+        self.session = requests.Session()
+        self.session.mount('https://', self.fake_twitter.make_adapter())
+
+    def tearDown(self):
+        """
+        終了処理を実行する。
+        """
+        # 偽のTwitterを停止する
+        self.session.close()
+        self.fake_twitter.stop()
+
+    @patch.object(tweepy.binder, 'requests', tweepy.binder.requests)
+    def test_handle_01(self):
+        """
+        [対象] handle() : No.01
+        [条件] tweepyでリクエストトークン、アクセストークン、ユーザー情報を順に取得する。
+        [結果] 払い出されたTwitter IDのユーザー情報が返却される。
+        """
+        fake_transport = transport.Transport(1, 1, False)
+        fake_transport.adapter = self.fake_twitter.make_adapter()
+        with patch.object(transport, '_transport', fake_transport):
+            transport.install()
+            oauth_handler = OAuthHandler('consumer_key', 'consumer_secret', 'http://testserver/callback/')
+            oauth_handler.get_authorization_url()
+            oauth_handler.get_access_token('verifier')
+            twitter_user = API(oauth_handler).me()
+
+        self.assertEqual(FIRST_TWITTER_ID, twitter_user.id)
+        self.assertEqual('user%d' % FIRST_TWITTER_ID, twitter_user.screen_name)
+        self.assertEqual(1, self.fake_twitter.counts['/oauth/access_token'])
+
+    def test_handle_02(self):
+        """
+        [対象] handle() : No.02
+        [条件] エラーの発生率を1とする。
+        [結果] 503が返却される。
+        """
+        self.fake_twitter.error_rate = 1.0
+
+        response = self.session.post('https://api.twitter.com/oauth/request_token')
+        self.assertEqual(503, response.status_code)
+
+
+class LoginBenchmarkTest(TestCase):
+    """
+    benchmarks.loginに対するテストコード。
+    """
+
+    def test_percentile_01(self):
+        """
+        [対象] percentile() : No.01
+        [条件] 100件の値を指定する。
+        [結果] 最近傍順位法によるパーセンタイルが返却される。
+        """
+        values = list(range(100, 0, -1))
+
+        self.assertEqual(50, percentile(values, 50))
+        self.assertEqual(99, percentile(values, 99))
+        self.assertEqual(100, percentile(values, 100))
+
+    def test_summarize_01(self):
+        """
+        [対象] summarize() : No.01
+        [条件] 値を指定しない。
+        [結果] 件数が0の集計結果が返却される。
+        """
+        actual = summarize([], [])
+
+        self.assertEqual(0, actual['count'])
+        self.assertIsNone(actual['latency_ms']['p50'])
+        self.assertIsNone(actual['queries']['mean'])
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from mock import patch
+
+import tweepy.binder
+
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from twingo2 import transport
+from twingo2.backends import TwitterBackend
+from twingo2.cache import user_cache
+from twingo2.circuit import twitter_breaker
+from twingo2.models import User
+from twingo2.testing import BudgetTestMixin
+
+from benchmarks.fake_twitter import FIRST_TWITTER_ID, FakeTwitter
+
+
+ACCESS_TOKEN = ('%d-access' % FIRST_TWITTER_ID, 'access-secret')
+"""偽のTwitterがFIRST_TWITTER_IDのユーザーに発行するアクセストークン"""
+
+
+class BudgetTest(BudgetTestMixin, TestCase):
+    """
+    認証処理のクエリ数とTwitterへのリクエスト数に対するテストコード。
+    値が増えた場合はログインのたびにその分のコストが増えるため、意図した変更でない限り修正しないこと。
+    """
+
+    def setUp(self):
+        """
+        初期処理を実行する。
+        """
+        # Twitterへの通信を偽のTwitterに転送する
+        self.fake_twitter = FakeTwitter(users=1)
+        self.fake_twitter.start()
+        fake_transport = transport.Transport(1, 1, False)
+        fake_transport.adapter = self.fake_twitter.make_adapter()
+        self.patchers = [
+            patch.object(transport, '_transport', fake_transport),
+            patch.object(tweepy.binder, 'requests', tweepy.binder.requests),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+        transport.install()
+
+        # キャッシュとサーキットブレーカーを初期化する
+        cache.clear()
+        user_cache.clear()
+        twitter_breaker.record_success()
+
+    def tearDown(self):
+        """
+        終了処理を実行する。
+        """
+        # 偽のTwitterを停止する
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+        self.fake_twitter.stop()
+
+    def test_authenticate_01(self):
+        """
+        [対象] authenticate() : No.01
+        [条件] 未登録のユーザーが初めてログインする。
+        [結果] ユーザーの取得と作成の2クエリ、ユーザー情報の取得の2リクエストで完了する。
+        """
+        with self.assertBudget(queries=2, requests=2):
+            user = TwitterBackend().authenticate(ACCESS_TOKEN)
+
+        self.assertEqual(FIRST_TWITTER_ID, user.twitter_id)
+
+    def test_authenticate_02(self):
+        """
+        [対象] authenticate() : No.02
+        [条件] ADMIN_TWITTER_IDに含まれるユーザーが初めてログインする。
+        [結果] 一般ユーザーと同じ2クエリ、2リクエストで管理者が作成される。
+        """
+        with self.settings(ADMIN_TWITTER_ID=(FIRST_TWITTER_ID,)):
+            with self.assertBudget(queries=2, requests=2):
+                user = TwitterBackend().authenticate(ACCESS_TOKEN)
+
+        self.assertTrue(user.is_superuser)
+
+    def test_authenticate_03(self):
+        """
+        [対象] authenticate() : No.03
+        [条件] 登録済みのユーザーがTwitter IDを伴わずに再ログインする。
+        [結果] 1クエリ、2リクエストで完了する。
+        """
+        TwitterBackend().authenticate(ACCESS_TOKEN)
+
+        with self.assertBudget(queries=1, requests=2):
+            TwitterBackend().authenticate(ACCESS_TOKEN)
+
+    def test_authenticate_04(self):
+        """
+        [対象] authenticate() : No.04
+        [条件] 登録済みのユーザーがアクセストークンの取得時に返却されたTwitter IDとともに再ログインする。
+        [結果] 1クエリで完了し、Twitterには問い合わせない。
+        """
+        TwitterBackend().authenticate(ACCESS_TOKEN)
+
+        with self.assertBudget(queries=1, requests=0):
+            TwitterBackend().authenticate(ACCESS_TOKEN, twitter_id=FIRST_TWITTER_ID)
+
+    @override_settings(ACCESS_TOKEN_CACHE_TIMEOUT=3600)
+    def test_authenticate_05(self):
+        """
+        [対象] authenticate() : No.05
+        [条件] アクセストークンのキャッシュを有効にし、同じアクセストークンで再ログインする。
+        [結果] 1クエリで完了し、Twitterには問い合わせない。
+        """
+        TwitterBackend().authenticate(ACCESS_TOKEN)
+
+        with self.assertBudget(queries=1, requests=0):
+            TwitterBackend().authenticate(ACCESS_TOKEN)
+
+    def test_authenticate_06(self):
+        """
+        [対象] authenticate() : No.06
+        [条件] 無効化されたユーザーがTwitter IDとともにログインする。
+        [結果] 1クエリで認証に失敗し、Twitterには問い合わせない。
+        """
+        user = TwitterBackend().authenticate(ACCESS_TOKEN)
+        User.objects.filter(pk=user.pk).update(is_active=False)
+
+        with self.assertBudget(queries=1, requests=0):
+            self.assertIsNone(TwitterBackend().authenticate(ACCESS_TOKEN, twitter_id=FIRST_TWITTER_ID))
+
+    def test_authenticate_07(self):
+        """
+        [対象] authenticate() : No.07
+        [条件] 無効化されたユーザーがTwitter IDを伴わずにログインする。
+        [結果] 1クエリ、2リクエストで認証に失敗する。
+        """
+        user = TwitterBackend().authenticate(ACCESS_TOKEN)
+        User.objects.filter(pk=user.pk).update(is_active=False)
+
+        with self.assertBudget(queries=1, requests=2):
+            self.assertIsNone(TwitterBackend().authenticate(ACCESS_TOKEN))
+
+    def test_authenticate_08(self):
+        """
+        [対象] authenticate() : No.08
+        [条件] USER_SEARCH_INDEX_ENABLEDを有効にして、未登録のユーザーが初めてログインする。
+        [結果] トークン索引の一括登録の1クエリのみが増え、3クエリ、2リクエストで完了する。
+        """
+        with self.settings(USER_SEARCH_INDEX_ENABLED=True):
+            with self.assertBudget(queries=3, requests=2):
+                TwitterBackend().authenticate(ACCESS_TOKEN)
+
+    def test_get_user_01(self):
+        """
+        [対象] get_user() : No.01
+        [条件] キャッシュを無効にしてリクエストごとにユーザーを取得する。
+        [結果] 1クエリで完了し、Twitterには問い合わせない。
+        """
+        user = TwitterBackend().authenticate(ACCESS_TOKEN)
+
+        with self.assertBudget(queries=1, requests=0):
+            TwitterBackend().get_user(user.pk)
+
+    @override_settings(USER_CACHE_TIMEOUT=60)
+    def test_get_user_02(self):
+        """
+        [対象] get_user() : No.02
+        [条件] キャッシュを有効にして同じユーザーを2回取得する。
+        [結果] 2回目はクエリを実行しない。
+        """
+        user = TwitterBackend().authenticate(ACCESS_TOKEN)
+        TwitterBackend().get_user(user.pk)
+
+        with self.assertBudget(queries=0, requests=0):
+            TwitterBackend().get_user(user.pk)
+
+    def test_twitter_login_01(self):
+        """
+        [対象] twitter_login() → twitter_callback() : No.01
+        [条件] 未登録のユーザーが画面からログインする。
+        [結果] リクエストトークン、アクセストークン、ユーザー情報の取得の4リクエストで完了する。
+        """
+        with self.assertBudget(requests=4):
+            self._login()
+
+    def test_twitter_login_02(self):
+        """
+        [対象] twitter_login() → twitter_callback() : No.02
+        [条件] 登録済みのユーザーが画面から再ログインする。
+        [結果] リクエストトークンとアクセストークンの取得の2リクエストで完了する。
+        """
+        self._login()
+        self.client.logout()
+
+        with self.assertBudget(requests=2):
+            self._login()
+
+    def _login(self):
+        """
+        画面からログインする。
+        """
+        response = self.client.get(reverse('twingo2_login'))
+        oauth_token = response['Location'].split('oauth_token=')[1]
+        response = self.client.get(reverse('twingo2_callback'), {
+            'oauth_token': oauth_token, 'oauth_verifier': 'verifier',
+        })
+        self.assertRedirects(response, '/', fetch_redirect_response=False)
+
+
+class BudgetTestMixinTest(BudgetTestMixin, TestCase):
+    """
+    testing.BudgetTestMixinに対するテストコード。
+    """
+
+    def test_assert_budget_01(self):
+        """
+        [対象] assertBudget() : No.01
+        [条件] 指定した数より多くのクエリを実行する。
+        [結果] 実行したクエリを含むAssertionErrorが送出される。
+        """
+        with self.assertRaisesRegex(AssertionError, 'twingo2_user'):
+            with self.assertBudget(queries=0):
+                User.objects.count()
+
+    def test_assert_budget_02(self):
+        """
+        [対象] assertBudget() : No.02
+        [条件] HTTPリクエスト数のみを指定し、クエリを実行する。
+        [結果] クエリ数は検証されない。
+        """
+        with self.assertBudget(requests=0):
+            User.objects.count()
@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import datetime
+from mock import Mock, patch
+
+import factory
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from twingo2.cache import AccessTokenCache, LocalCache, screen_name_cache, user_cache
+from twingo2.models import User
+
+
+class UserFactory(factory.DjangoModelFactory):
+    """
+    Userのテストデータを作成するファクトリー。
+    """
+
+    class Meta:
+        model = User
+
+    twitter_id = factory.Sequence(lambda x: x)
+    screen_name = factory.Sequence(lambda x: 'screen_name_%02d' % x)
+    name = factory.Sequence(lambda x: 'name_%02d' % x)
+    description = factory.Sequence(lambda x: 'description_%02d' % x)
+    location = factory.Sequence(lambda x: 'location_%02d' % x)
+    url = factory.Sequence(lambda x: 'http://dummy.com/user_%02d.html' % x)
+    profile_image_url = factory.Sequence(lambda x: 'http://dummy.com/user_%02d.jpg' % x)
+    is_active = True
+    is_superuser = False
+    is_staff = False
+    last_login = datetime.datetime.now()
+
+
+class LocalCacheTest(TestCase):
+    """
+    cache.LocalCacheに対するテストコード。
+    """
+
+    def test_get_01(self):
+        """
+        [対象] get() : No.01
+        [条件] 有効期間内の値を取得する。
+        [結果] 設定した値が返却される。
+        """
+        local_cache = LocalCache(10)
+        local_cache.set('key', 'value', 60)
+
+        self.assertEqual('value', local_cache.get('key'))
+
+    @patch('twingo2.cache.time')
+    def test_get_02(self, time):
+        """
+        [対象] get() : No.02
+        [条件] 有効期間を過ぎた値を取得する。
+        [結果] デフォルト値が返却される。
+        """
+        time.monotonic.return_value = 100
+        local_cache = LocalCache(10)
+        local_cache.set('key', 'value', 60)
+        time.monotonic.return_value = 160
+
+        self.assertEqual('default', local_cache.get('key', 'default'))
+
+    def test_set_01(self):
+        """
+        [対象] set() : No.01
+        [条件] 最大数を超えて値を設定する。
+        [結果] 最も長く使用されていない値が破棄される。
+        """
+        local_cache = LocalCache(2)
+        local_cache.set('key_1', 'value_1', 60)
+        local_cache.set('key_2', 'value_2', 60)
+        local_cache.get('key_1')
+        local_cache.set('key_3', 'value_3', 60)
+
+        self.assertEqual('value_1', local_cache.get('key_1'))
+        self.assertIsNone(local_cache.get('key_2'))
+        self.assertEqual('value_3', local_cache.get('key_3'))
+
+
+class UserCacheTest(TestCase):
+    """
+    cache.UserCacheに対するテストコード。
+    """
+
+    def setUp(self):
+        """
+        初期処理を実行する。
+        """
+        # キャッシュを初期化する
+        user_cache.clear()
+        cache.clear()
+
+    def test_get_01(self):
+        """
+        [対象] get() : No.01
+        [条件] USER_CACHE_TIMEOUTを設定しない。
+        [結果] 毎回loaderが呼び出される。
+        """
+        loader = Mock(return_value='user')
+
+        user_cache.get(1, loader)
+        actual = user_cache.get(1, loader)
+
+        self.assertEqual('user', actual)
+        self.assertEqual(2, loader.call_count)
+
+    @override_settings(USER_CACHE_TIMEOUT=60)
+    def test_get_02(self):
+        """
+        [対象] get() : No.02
+        [条件] USER_CACHE_TIMEOUTを設定する。
+        [結果] 2回目以降はloaderが呼び出されない。
+        """
+        user = UserFactory()
+        loader = Mock(return_value=user)
+
+        user_cache.get(user.id, loader)
+        actual = user_cache.get(user.id, loader)
+
+        self.assertEqual(user, actual)
+        self.assertEqual(1, loader.call_count)
+
+    @override_settings(USER_CACHE_TIMEOUT=60)
+    def test_get_03(self):
+        """
+        [対象] get() : No.03
+        [条件] プロセス内のキャッシュが破棄された状態で取得する。
+        [結果] 共有キャッシュから取得され、loaderが呼び出されない。
+        """
+        user = UserFactory()
+        loader = Mock(return_value=user)
+
+        user_cache.get(user.id, loader)
+        user_cache.clear()
+        actual = user_cache.get(user.id, loader)
+
+        self.assertEqual(user, actual)
+        self.assertEqual(1, loader.call_count)
+
+    @override_settings(USER_CACHE_TIMEOUT=60)
+    def test_get_04(self):
+        """
+        [対象] get() : No.04
+        [条件] loaderがNoneを返却する。
+        [結果] Noneはキャッシュされず、毎回loaderが呼び出される。
+        """
+        loader = Mock(return_value=None)
+
+        user_cache.get(1, loader)
+        actual = user_cache.get(1, loader)
+
+        self.assertIsNone(actual)
+        self.assertEqual(2, loader.call_count)
+
+    @override_settings(USER_CACHE_TIMEOUT=60)
+    def test_invalidate_01(self):
+        """
+        [対象] invalidate() : No.01
+        [条件] キャッシュ済みのユーザーを無効化して保存する。
+        [結果] キャッシュが破棄され、次回はloaderが呼び出される。
+        """
+        user = UserFactory()
+        loader = Mock(return_value=user)
+        user_cache.get(user.id, loader)
+
+        user.is_active = False
+        user.save()
+        user_cache.get(user.id, loader)
+
+        self.assertEqual(2, loader.call_count)
+
+    @override_settings(USER_CACHE_TIMEOUT=60)
+    def test_invalidate_02(self):
+        """
+        [対象] invalidate() : No.02
+        [条件] キャッシュ済みのユーザーを削除する。
+        [結果] キャッシュが破棄され、次回はloaderが呼び出される。
+        """
+        user = UserFactory()
+        user_id = user.id
+        loader = Mock(return_value=user)
+        user_cache.get(user_id, loader)
+
+        user.delete()
+        user_cache.get(user_id, loader)
+
+        self.assertEqual(2, loader.call_count)
+
+    @override_settings(USER_CACHE_TIMEOUT=60)
+    def test_invalidate_03(self):
+        """
+        [対象] invalidate() : No.03
+        [条件] loaderの実行中にキャッシュを破棄する。
+        [結果] loaderが取得した値はキャッシュされず、次回もloaderが呼び出される。
+        """
+        user = UserFactory()
+
+        def loader(user_id):
+            user_cache.invalidate(user_id)
+            return user
+        loader = Mock(side_effect=loader)
+
+        user_cache.get(user.id, loader)
+        user_cache.get(user.id, loader)
+
+        self.assertEqual(2, loader.call_count)
+
+    @override_settings(USER_CACHE_TIMEOUT=60)
+    def test_invalidate_04(self):
+        """
+        [対象] invalidate() : No.04
+        [条件] コミット前の更新としてキャッシュを破棄する。
+        [結果] USER_CACHE_PENDING_TIMEOUTの間はキャッシュされず、毎回loaderが呼び出される。
+        """
+        user = UserFactory()
+        loader = Mock(return_value=user)
+        user_cache.get(user.id, loader)
+
+        user_cache.invalidate(user.id, pending=True)
+        user_cache.get(user.id, loader)
+        user_cache.get(user.id, loader)
+
+        self.assertEqual(3, loader.call_count)
+
+
+class AccessTokenCacheTest(TestCase):
+    """
+    cache.AccessTokenCacheに対するテストコード。
+    """
+
+    def setUp(self):
+        """
+        初期処理を実行する。
+        """
+        # キャッシュを初期化する
+        cache.clear()
+
+    @override_settings(ACCESS_TOKEN_CACHE_TIMEOUT=3600)
+    def test_get_01(self):
+        """
+        [対象] get() : No.01
+        [条件] 格納したアクセストークンを指定する。
+        [結果] Twitter IDが返却され、キャッシュのキーにはアクセストークンが含まれない。
+        """
+        access_token_cache = AccessTokenCache()
+        access_token_cache.set(('1402804142-key', 'secret'), 1402804142)
+
+        self.assertEqual(1402804142, access_token_cache.get(('1402804142-key', 'secret')))
+        self.assertIsNone(access_token_cache.get(('1402804142-key', 'other')))
+        key = access_token_cache._make_key(('1402804142-key', 'secret'))
+        self.assertNotIn('key', key.replace('twingo2:access_token:', ''))
+        self.assertNotIn('secret', key)
+
+    def test_get_02(self):
+        """
+        [対象] get() : No.02
+        [条件] ACCESS_TOKEN_CACHE_TIMEOUTを設定しない。
+        [結果] 格納されず、Noneが返却される。
+        """
+        access_token_cache = AccessTokenCache()
+        access_token_cache.set(('key', 'secret'), 1402804142)
+
+        self.assertIsNone(access_token_cache.get(('key', 'secret')))
+
+
+class ScreenNameCacheTest(TestCase):
+    """
+    cache.ScreenNameCacheに対するテストコード。
+    """
+
+    def setUp(self):
+        """
+        初期処理を実行する。
+        """
+        # キャッシュを初期化する
+        cache.clear()
+
+    @override_settings(SCREEN_NAME_CACHE_TIMEOUT=60)
+    def test_get_many_01(self):
+        """
+        [対象] get_many() : No.01
+        [条件] 一部のみキャッシュ済みのユーザー名を指定する。
+        [結果] キャッシュに存在しないユーザー名のみがloaderに渡される。
+        """
+        user_1 = UserFactory(screen_name='chii')
+        user_2 = UserFactory(screen_name='itsu')
+        screen_name_cache.get_many(['chii'], lambda names: {'chii': user_1})
+
+        loader = Mock(return_value={'itsu': user_2})
+        actual = screen_name_cache.get_many(['chii', 'itsu', 'unknown'], loader)
+
+        self.assertEqual({'chii': user_1, 'itsu': user_2}, actual)
+        loader.assert_called_once_with(['itsu', 'unknown'])
+
+    @override_settings(SCREEN_NAME_CACHE_TIMEOUT=60)
+    def test_get_many_02(self):
+        """
+        [対象] get_many() : No.02
+        [条件] キャッシュ済みのユーザーのユーザー名を変更する。
+        [結果] 変更前と変更後のユーザー名のいずれもloaderが呼び出される。
+        """
+        user = UserFactory(screen_name='chii')
+        screen_name_cache.get_many(['chii'], lambda names: {'chii': user})
+
+        user.update_profile(screen_name='itsu')
+        loader = Mock(return_value={})
+        screen_name_cache.get_many(['chii', 'itsu'], loader)
+
+        loader.assert_called_once_with(['chii', 'itsu'])
+
+    def test_get_many_03(self):
+        """
+        [対象] get_many() : No.03
+        [条件] SCREEN_NAME_CACHE_TIMEOUTを設定しない。
+        [結果] 毎回loaderが呼び出される。
+        """
+        loader = Mock(return_value={})
+        screen_name_cache.get_many(['chii'], loader)
+        screen_name_cache.get_many(['chii'], loader)
+
+        self.assertEqual(2, loader.call_count)
+
+    @override_settings(SCREEN_NAME_CACHE_TIMEOUT=60)
+    def test_invalidate_01(self):
+        """
+        [対象] invalidate() : No.01
+        [条件] キャッシュ済みのユーザーを無効化して保存する。
+        [結果] キャッシュが破棄され、次回はloaderが呼び出される。
+        """
+        user = UserFactory(screen_name='chii')
+        screen_name_cache.get_many(['chii'], lambda names: {'chii': user})
+
+        user.is_active = False
+        user.save()
+        loader = Mock(return_value={})
+        screen_name_cache.get_many(['chii'], loader)
+
+        loader.assert_called_once_with(['chii'])
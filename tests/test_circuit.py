@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from mock import Mock, patch
+
+import requests
+from requests_oauthlib.oauth1_session import TokenRequestDenied
+from tweepy.error import TweepError
+
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from twingo2.circuit import CircuitBreaker, CircuitOpenError, is_unavailable_error
+
+
+def _wrap(error):
+    """
+    tweepyと同様に例外をTweepErrorで包む。
+
+    :param error: 元の例外
+    :type error: Exception
+    :return: TweepError
+    :rtype: tweepy.error.TweepError
+    """
+    try:
+        try:
+            raise error
+        except Exception as e:
+            raise TweepError(e)
+    except TweepError as e:
+        return e
+
+
+class IsUnavailableErrorTest(TestCase):
+    """
+    circuit.is_unavailable_error()に対するテストコード。
+    """
+
+    def test_is_unavailable_error_01(self):
+        """
+        [対象] is_unavailable_error() : No.01
+        [条件] 通信エラーまたはタイムアウトを包んだTweepErrorを指定する。
+        [結果] Trueが返却される。
+        """
+        self.assertTrue(is_unavailable_error(_wrap(requests.ConnectionError())))
+        self.assertTrue(is_unavailable_error(_wrap(requests.Timeout())))
+
+    def test_is_unavailable_error_02(self):
+        """
+        [対象] is_unavailable_error() : No.02
+        [条件] 5xxまたは429のレスポンスを持つTweepErrorを指定する。
+        [結果] Trueが返却される。
+        """
+        self.assertTrue(is_unavailable_error(TweepError('reason', Mock(status_code=503))))
+        self.assertTrue(is_unavailable_error(TweepError('reason', Mock(status_code=429))))
+
+    def test_is_unavailable_error_03(self):
+        """
+        [対象] is_unavailable_error() : No.03
+        [条件] 認証エラーを示すTweepErrorを指定する。
+        [結果] Falseが返却される。
+        """
+        self.assertFalse(is_unavailable_error(TweepError('reason', Mock(status_code=401))))
+        self.assertFalse(is_unavailable_error(_wrap(TokenRequestDenied('denied', 401))))
+        self.assertFalse(is_unavailable_error(TweepError('reason')))
+
+
+@override_settings(TWITTER_BREAKER_THRESHOLD=2, TWITTER_BREAKER_RESET_TIMEOUT=30)
+class CircuitBreakerTest(TestCase):
+    """
+    circuit.CircuitBreakerに対するテストコード。
+    """
+
+    def _fail(self, breaker):
+        """
+        Twitterが応答できない状態での通信を模擬する。
+
+        :param breaker: サーキットブレーカー
+        :type breaker: twingo2.circuit.CircuitBreaker
+        """
+        # タイムアウトを発生させる
+        with self.assertRaises(requests.Timeout):
+            with breaker:
+                raise requests.Timeout()
+
+    def test_enter_01(self):
+        """
+        [対象] __enter__() : No.01
+        [条件] 連続失敗回数が閾値に達する。
+        [結果] 以降の通信はCircuitOpenErrorにより遮断される。
+        """
+        breaker = CircuitBreaker()
+        self._fail(breaker)
+        self.assertFalse(breaker.is_open)
+        self._fail(breaker)
+
+        self.assertTrue(breaker.is_open)
+        with self.assertRaises(CircuitOpenError):
+            with breaker:
+                self.fail('must not be called')
+
+    def test_enter_02(self):
+        """
+        [対象] __enter__() : No.02
+        [条件] 失敗の間に成功した通信を挟む。
+        [結果] 遮断されない。
+        """
+        breaker = CircuitBreaker()
+        self._fail(breaker)
+        with breaker:
+            pass
+        self._fail(breaker)
+
+        self.assertFalse(breaker.is_open)
+
+    @patch('twingo2.circuit.time')
+    def test_allow_01(self, time):
+        """
+        [対象] allow() : No.01
+        [条件] 遮断から一定時間が経過する。
+        [結果] 1件のみ試行が許可され、成功すると遮断が解除される。
+        """
+        time.monotonic.return_value = 100.0
+        breaker = CircuitBreaker()
+        self._fail(breaker)
+        self._fail(breaker)
+        self.assertEqual(30, breaker.retry_after)
+        time.monotonic.return_value = 130.0
+
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertFalse(breaker.is_open)
+
+    @patch('twingo2.circuit.time')
+    def test_allow_02(self, time):
+        """
+        [対象] allow() : No.02
+        [条件] 遮断から一定時間が経過した後の試行に失敗する。
+        [結果] 再び遮断される。
+        """
+        time.monotonic.return_value = 100.0
+        breaker = CircuitBreaker()
+        self._fail(breaker)
+        self._fail(breaker)
+        time.monotonic.return_value = 130.0
+
+        self._fail(breaker)
+
+        self.assertTrue(breaker.is_open)
+        self.assertFalse(breaker.allow())
@@ -0,0 +1,786 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from contextlib import contextmanager
+import datetime
+import json
+from mock import MagicMock, patch
+import os
+import tempfile
+
+import factory
+from tweepy.error import TweepError
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.backends.sqlite3.base import SQLiteCursorWrapper
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils.six import StringIO
+
+from twingo2 import encryption
+from twingo2.models import AccessToken, User, UserSearchToken
+
+
+class TwitterUser:
+    """
+    Twitterのユーザー情報を格納するテスト用クラス。
+    """
+
+    def __init__(self, **kwargs):
+        """
+        TwitterUserを構築する。
+
+        :param kwargs: 設定するプロパティ名とその値
+        :type kwargs: dict
+        """
+        # プロパティを設定する
+        for k, v in kwargs.items():
+            setattr(self, k, v)
+
+
+class FakeAPI:
+    """
+    users/lookupを模したテスト用のAPIクラス。
+    """
+
+    def __init__(self, twitter_ids):
+        """
+        FakeAPIを構築する。
+
+        :param twitter_ids: Twitterに存在するものとして扱うTwitter IDのリスト
+        :type twitter_ids: list
+        """
+        # Twitterのユーザー情報を生成する
+        self.users = [TwitterUser(
+            id=twitter_id,
+            screen_name='screen_%d' % twitter_id,
+            name='name_%d' % twitter_id,
+            description=None,
+            location='location_%d' % twitter_id,
+            url=None,
+            profile_image_url='http://dummy.com/%d.jpg' % twitter_id
+        ) for twitter_id in twitter_ids]
+        self.calls = []
+
+    def lookup_users(self, user_ids=None, screen_names=None):
+        """
+        Twitterのユーザー情報を一括取得する。
+
+        :param user_ids: Twitter IDのリスト
+        :type user_ids: list
+        :param screen_names: ユーザー名のリスト
+        :type screen_names: list
+        :return: Twitterのユーザー情報のリスト
+        :rtype: list
+        """
+        # 呼び出し履歴を記録し、該当するユーザーを返却する
+        self.calls.append(user_ids or screen_names)
+        return [u for u in self.users if u.id in (user_ids or ()) or u.screen_name in (screen_names or ())]
+
+
+class UserFactory(factory.DjangoModelFactory):
+    """
+    Userのテストデータを作成するファクトリー。
+    """
+
+    class Meta:
+        model = User
+
+    twitter_id = factory.Sequence(lambda x: x + 1)
+    screen_name = factory.Sequence(lambda x: 'screen_name_%02d' % x)
+    name = factory.Sequence(lambda x: 'name_%02d' % x)
+    description = factory.Sequence(lambda x: 'description_%02d' % x)
+    location = factory.Sequence(lambda x: 'location_%02d' % x)
+    url = factory.Sequence(lambda x: 'http://dummy.com/user_%02d.html' % x)
+    profile_image_url = factory.Sequence(lambda x: 'http://dummy.com/user_%02d.jpg' % x)
+    is_active = True
+    is_superuser = False
+    is_staff = False
+    last_login = datetime.datetime.now()
+
+
+@contextmanager
+def record_query_params():
+    """
+    SQLiteで実行したクエリごとにバインドしたパラメーターの数を記録する。
+
+    :return: パラメーターの数のリスト
+    :rtype: list
+    """
+    counts = []
+    execute = SQLiteCursorWrapper.execute
+
+    def counting_execute(cursor, query, params=None):
+        counts.append(len(params or ()))
+        return execute(cursor, query, params)
+
+    with patch.object(SQLiteCursorWrapper, 'execute', counting_execute):
+        yield counts
+
+
+def create_users(count):
+    """
+    テスト用のユーザーを一括作成する。
+
+    :param count: 作成する件数
+    :type count: int
+    :return: 作成したユーザーのリスト
+    :rtype: list
+    """
+    User.objects.bulk_create([
+        User(twitter_id=i, screen_name='screen_%d' % i, name='name_%d' % i, is_active=True,
+             last_login=datetime.datetime.now())
+        for i in range(1, count + 1)
+    ])
+    return list(User.objects.order_by('pk'))
+
+
+class ImportCommandTest(TestCase):
+    """
+    twingo2_importコマンドに対するテストコード。
+    """
+
+    def _write_input(self, lines):
+        """
+        入力ファイルを作成する。
+
+        :param lines: 入力ファイルの各行
+        :type lines: list
+        :return: 入力ファイルのパス
+        :rtype: str
+        """
+        # 一時ファイルに書き込む
+        fd, path = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as f:
+            f.write('\n'.join(lines))
+        self.addCleanup(os.remove, path)
+        return path
+
+    @patch('twingo2.management.commands.twingo2_import.get_app_api')
+    def test_handle_01(self, get_app_api):
+        """
+        [対象] handle() : No.01
+        [条件] 250件のTwitter IDを指定する。
+        [結果] 100件ずつTwitterに問い合わせ、すべてのユーザーが登録される。
+        """
+        get_app_api.return_value = FakeAPI(range(1, 251))
+        path = self._write_input([str(i) for i in range(1, 251)])
+
+        out = StringIO()
+        call_command('twingo2_import', path, batch_size=30, stdout=out)
+
+        self.assertEqual([100, 100, 50], [len(c) for c in get_app_api.return_value.calls])
+        self.assertEqual(250, User.objects.count())
+        self.assertIn('250 users imported.', out.getvalue())
+        user = User.objects.get(twitter_id=10)
+        self.assertEqual('screen_10', user.screen_name)
+        self.assertEqual('', user.url)
+        self.assertFalse(user.has_usable_password())
+        self.assertTrue(user.is_active)
+        self.assertFalse(user.is_superuser)
+
+    @override_settings(ADMIN_TWITTER_ID=(2,))
+    @patch('twingo2.management.commands.twingo2_import.get_app_api')
+    def test_handle_02(self, get_app_api):
+        """
+        [対象] handle() : No.02
+        [条件] 登録済みのユーザー、重複、存在しないユーザー、管理者を含む一覧を指定する。
+        [結果] 未登録のユーザーのみが登録され、管理者は管理者権限付きで登録される。
+        """
+        UserFactory(twitter_id=1, screen_name='registered')
+        get_app_api.return_value = FakeAPI([1, 2, 3])
+        path = self._write_input(['# comment', '1', '2', '', '3', '3', '4'])
+
+        out = StringIO()
+        call_command('twingo2_import', path, stdout=out)
+
+        self.assertIn('2 users imported.', out.getvalue())
+        self.assertEqual('registered', User.objects.get(twitter_id=1).screen_name)
+        self.assertTrue(User.objects.get(twitter_id=2).is_superuser)
+        self.assertTrue(User.objects.get(twitter_id=2).is_staff)
+        self.assertFalse(User.objects.get(twitter_id=3).is_superuser)
+        self.assertFalse(User.objects.filter(twitter_id=4).exists())
+
+    @patch('twingo2.management.commands.twingo2_import.get_app_api')
+    def test_handle_03(self, get_app_api):
+        """
+        [対象] handle() : No.03
+        [条件] ユーザー名の一覧を指定する。
+        [結果] ユーザー名で問い合わせ、ユーザーが登録される。
+        """
+        get_app_api.return_value = FakeAPI([1, 2])
+        path = self._write_input(['@screen_1', 'screen_2'])
+
+        call_command('twingo2_import', path, screen_name=True, stdout=StringIO())
+
+        self.assertEqual([['screen_1', 'screen_2']], get_app_api.return_value.calls)
+        self.assertEqual(2, User.objects.count())
+
+    @patch('twingo2.management.commands.twingo2_import.get_app_api')
+    def test_handle_04(self, get_app_api):
+        """
+        [対象] handle() : No.04
+        [条件] 数値でないTwitter IDを指定する。
+        [結果] CommandErrorが送出される。
+        """
+        get_app_api.return_value = FakeAPI([1])
+        path = self._write_input(['7pairs'])
+
+        with self.assertRaises(CommandError):
+            call_command('twingo2_import', path, stdout=StringIO())
+
+    @patch('twingo2.management.commands.twingo2_import.get_app_api')
+    def test_handle_05(self, get_app_api):
+        """
+        [対象] handle() : No.05
+        [条件] Twitterからエラーが返却される。
+        [結果] CommandErrorが送出される。
+        """
+        get_app_api.return_value.lookup_users.side_effect = TweepError('reason')
+        path = self._write_input(['1'])
+
+        with self.assertRaises(CommandError):
+            call_command('twingo2_import', path, stdout=StringIO())
+
+
+class SyncProfilesCommandTest(TestCase):
+    """
+    twingo2_sync_profilesコマンドに対するテストコード。
+    """
+
+    def setUp(self):
+        """
+        初期処理を実行する。
+        """
+        # Twitterと同じプロフィールのユーザーを作成する
+        self.api = FakeAPI(range(1, 251))
+        for twitter_user in self.api.users:
+            UserFactory(
+                twitter_id=twitter_user.id,
+                screen_name=twitter_user.screen_name,
+                name=twitter_user.name,
+                description='',
+                location=twitter_user.location,
+                url='',
+                profile_image_url=twitter_user.profile_image_url
+            )
+
+        # チェックポイントファイルのパスを決定する
+        fd, self.checkpoint = tempfile.mkstemp()
+        os.close(fd)
+        os.remove(self.checkpoint)
+
+    def tearDown(self):
+        """
+        終了処理を実行する。
+        """
+        # チェックポイントファイルを削除する
+        if os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
+
+    @patch('twingo2.management.commands.twingo2_sync_profiles.get_app_api')
+    def test_handle_01(self, get_app_api):
+        """
+        [対象] handle() : No.01
+        [条件] 一部のユーザーのプロフィールがTwitterで変更されている。
+        [結果] 100件ずつTwitterに問い合わせ、変更されたユーザーのみが更新される。
+        """
+        self.api.users[0].screen_name = 'changed_1'
+        self.api.users[150].location = 'changed_151'
+        del self.api.users[200]
+        get_app_api.return_value = self.api
+
+        updated_at = User.objects.get(twitter_id=2).updated_at
+
+        out = StringIO()
+        with self.assertNumQueries(7):
+            call_command('twingo2_sync_profiles', rate=1000, stdout=out)
+
+        self.assertEqual([100, 100, 50], [len(c) for c in self.api.calls])
+        self.assertIn('250 users checked, 2 users updated.', out.getvalue())
+        self.assertEqual('changed_1', User.objects.get(twitter_id=1).screen_name)
+        self.assertEqual('changed_151', User.objects.get(twitter_id=151).location)
+        self.assertEqual('screen_151', User.objects.get(twitter_id=151).screen_name)
+        self.assertEqual(updated_at, User.objects.get(twitter_id=2).updated_at)
+        self.assertEqual(0, User.objects.filter(twitter_id__lte=250, profile_checked_at__isnull=True).exclude(twitter_id=201).count())
+        self.assertIsNone(User.objects.get(twitter_id=201).profile_checked_at)
+
+    @patch('twingo2.management.commands.twingo2_sync_profiles.get_app_api')
+    def test_handle_02(self, get_app_api):
+        """
+        [対象] handle() : No.02
+        [条件] チェックポイントファイルに処理済みの位置が記録されている。
+        [結果] 続きから処理され、完了後にチェックポイントファイルが削除される。
+        """
+        get_app_api.return_value = self.api
+        with open(self.checkpoint, 'w') as f:
+            f.write(str(User.objects.get(twitter_id=200).pk))
+
+        out = StringIO()
+        call_command('twingo2_sync_profiles', checkpoint=self.checkpoint, rate=1000, stdout=out)
+
+        self.assertEqual([list(range(201, 251))], self.api.calls)
+        self.assertIn('50 users checked, 0 users updated.', out.getvalue())
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    @patch('twingo2.management.commands.twingo2_sync_profiles.get_app_api')
+    def test_handle_03(self, get_app_api):
+        """
+        [対象] handle() : No.03
+        [条件] 2回目の問い合わせでTwitterからエラーが返却される。
+        [結果] CommandErrorが送出され、チェックポイントファイルに1回目の処理済みの位置が記録される。
+        """
+        get_app_api.return_value.lookup_users.side_effect = [self.api.users[:100], TweepError('reason')]
+
+        with self.assertRaises(CommandError):
+            call_command('twingo2_sync_profiles', checkpoint=self.checkpoint, rate=1000, stdout=StringIO())
+
+        with open(self.checkpoint) as f:
+            self.assertEqual(str(User.objects.get(twitter_id=100).pk), f.read())
+
+    def test_handle_04(self):
+        """
+        [対象] handle() : No.04
+        [条件] 0以下のリクエスト数の上限を指定する。
+        [結果] CommandErrorが送出される。
+        """
+        with self.assertRaises(CommandError):
+            call_command('twingo2_sync_profiles', rate=0, stdout=StringIO())
+
+    @patch('twingo2.management.commands.twingo2_sync_profiles.get_app_api')
+    def test_handle_05(self, get_app_api):
+        """
+        [対象] handle() : No.05
+        [条件] すべてのユーザーの複数のフィールドがTwitterで変更されている。
+        [結果] 1つのクエリにバインドするパラメーターが999個以下に分割されて更新される。
+        """
+        for twitter_user in self.api.users:
+            twitter_user.screen_name = 'changed_%d' % twitter_user.id
+            twitter_user.name = 'changed_%d' % twitter_user.id
+            twitter_user.location = 'changed_%d' % twitter_user.id
+            twitter_user.profile_image_url = 'http://example.com/changed_%d.png' % twitter_user.id
+        get_app_api.return_value = self.api
+
+        out = StringIO()
+        with record_query_params() as counts:
+            call_command('twingo2_sync_profiles', rate=1000, stdout=out)
+
+        self.assertIn('250 users checked, 250 users updated.', out.getvalue())
+        self.assertLessEqual(max(counts), 999)
+        self.assertEqual(250, User.objects.filter(screen_name__startswith='changed_', profile_checked_at__isnull=False).count())
+
+
+class RotateTokenKeysCommandTest(TestCase):
+    """
+    twingo2_rotate_token_keysコマンドに対するテストコード。
+    """
+
+    OLD_KEY = '8ImC3AIUj2eme1NQtyfS_bJ8wE-GR5_cO-vjH36zRqg='
+    NEW_KEY = 'wC3UB33-kjz4PeN85hOM7Q0YC0n_vRlTkBHp-1Iahks='
+
+    def test_handle_01(self):
+        """
+        [対象] handle() : No.01
+        [条件] 古い暗号鍵で暗号化されたアクセストークンを含む状態で、新しい暗号鍵を先頭に追加して実行する。
+        [結果] 古い暗号鍵で暗号化されたアクセストークンのみがバッチごとに暗号化し直される。
+        """
+        with self.settings(TOKEN_ENCRYPTION_KEYS=[self.OLD_KEY]):
+            for i in range(1, 6):
+                AccessToken.objects.save_token(UserFactory(twitter_id=i), ('key_%d' % i, 'secret_%d' % i))
+        with self.settings(TOKEN_ENCRYPTION_KEYS=[self.NEW_KEY, self.OLD_KEY]):
+            AccessToken.objects.save_token(UserFactory(twitter_id=6), ('key_6', 'secret_6'))
+
+            stdout = StringIO()
+            with self.assertNumQueries(7):
+                call_command('twingo2_rotate_token_keys', batch_size=2, stdout=stdout)
+
+        self.assertEqual('5 tokens re-encrypted.', stdout.getvalue().strip())
+        with self.settings(TOKEN_ENCRYPTION_KEYS=[self.NEW_KEY]):
+            for access_token in AccessToken.objects.select_related('user'):
+                self.assertEqual(encryption.get_key_id(self.NEW_KEY), access_token.key_id)
+                i = access_token.user.twitter_id
+                self.assertEqual(('key_%d' % i, 'secret_%d' % i), access_token.get_access_token())
+
+    def test_handle_02(self):
+        """
+        [対象] handle() : No.02
+        [条件] TOKEN_ENCRYPTION_KEYSを設定せずに実行する。
+        [結果] CommandErrorが送出される。
+        """
+        with self.assertRaises(CommandError):
+            call_command('twingo2_rotate_token_keys', stdout=StringIO())
+
+    def test_handle_03(self):
+        """
+        [対象] handle() : No.03
+        [条件] 読み込んだ後、更新する前にログインによりアクセストークンが保存し直される。
+        [結果] 保存し直されたアクセストークンは上書きされない。
+        """
+        with self.settings(TOKEN_ENCRYPTION_KEYS=[self.OLD_KEY]):
+            for i in range(1, 3):
+                AccessToken.objects.save_token(UserFactory(twitter_id=i), ('key_%d' % i, 'secret_%d' % i))
+        user = User.objects.get(twitter_id=1)
+        rotate = encryption.rotate
+
+        def rotate_after_login(encrypted_token):
+            # 最初の暗号化の直前に並行してログインしたものとする
+            if not AccessToken.objects.filter(user=user, key_id=encryption.get_primary_key_id()).exists():
+                AccessToken.objects.save_token(user, ('new_key', 'new_secret'))
+            return rotate(encrypted_token)
+
+        stdout = StringIO()
+        with self.settings(TOKEN_ENCRYPTION_KEYS=[self.NEW_KEY, self.OLD_KEY]):
+            with patch('twingo2.encryption.rotate', side_effect=rotate_after_login):
+                call_command('twingo2_rotate_token_keys', stdout=stdout)
+
+            self.assertEqual('1 tokens re-encrypted.', stdout.getvalue().strip())
+            self.assertEqual(('new_key', 'new_secret'), AccessToken.objects.get(user=user).get_access_token())
+            self.assertEqual(('key_2', 'secret_2'), AccessToken.objects.get(user__twitter_id=2).get_access_token())
+
+    def test_handle_04(self):
+        """
+        [対象] handle() : No.04
+        [条件] SQLiteで、999件を超えるアクセストークンをデフォルトの件数で暗号化し直す。
+        [結果] 1つのクエリにバインドするパラメーターが999個以下に分割され、すべて暗号化し直される。
+        """
+        with self.settings(TOKEN_ENCRYPTION_KEYS=[self.OLD_KEY]):
+            encrypted_token, key_id = encryption.encrypt(json.dumps(['key', 'secret']))
+        AccessToken.objects.bulk_create([
+            AccessToken(user=user, encrypted_token=encrypted_token, key_id=key_id) for user in create_users(1100)
+        ])
+
+        stdout = StringIO()
+        with self.settings(TOKEN_ENCRYPTION_KEYS=[self.NEW_KEY, self.OLD_KEY]):
+            with record_query_params() as counts:
+                call_command('twingo2_rotate_token_keys', stdout=stdout)
+
+        self.assertEqual('1100 tokens re-encrypted.', stdout.getvalue().strip())
+        self.assertLessEqual(max(counts), 999)
+        self.assertFalse(AccessToken.objects.filter(key_id=key_id).exists())
+
+
+class RebuildSearchIndexCommandTest(TestCase):
+    """
+    twingo2_rebuild_search_indexコマンドに対するテストコード。
+    """
+
+    def test_handle_01(self):
+        """
+        [対象] handle() : No.01
+        [条件] トークン索引を持たないユーザーが存在する状態で、USER_SEARCH_INDEX_ENABLEDを有効にして実行する。
+        [結果] すべてのユーザーのトークン索引がバッチごとに作成される。
+        """
+        for i in range(1, 4):
+            UserFactory(twitter_id=i, screen_name='user_%d' % i)
+
+        stdout = StringIO()
+        with self.settings(USER_SEARCH_INDEX_ENABLED=True):
+            call_command('twingo2_rebuild_search_index', batch_size=2, stdout=stdout)
+
+            self.assertEqual('3 users indexed.', stdout.getvalue().strip())
+            self.assertEqual(['user_2'], [user.screen_name for user in User.objects.search('user_2')])
+        tokens = set(UserSearchToken.objects.filter(user__twitter_id=1).values_list('token', flat=True))
+        self.assertTrue({'user_1', 'user', '1'} <= tokens)
+
+    def test_handle_02(self):
+        """
+        [対象] handle() : No.02
+        [条件] USER_SEARCH_INDEX_ENABLEDを設定せずに実行する。
+        [結果] CommandErrorが送出される。
+        """
+        with self.assertRaises(CommandError):
+            call_command('twingo2_rebuild_search_index', stdout=StringIO())
+
+
+class CreateTrigramIndexesCommandTest(TestCase):
+    """
+    twingo2_create_trigram_indexesコマンドに対するテストコード。
+    """
+
+    @patch('twingo2.management.commands.twingo2_create_trigram_indexes.connections')
+    def test_handle_01(self, connections):
+        """
+        [対象] handle() : No.01
+        [条件] PostgreSQLのデータベースを指定する。
+        [結果] pg_trgmの拡張機能と、検索対象のフィールドの索引がCONCURRENTLYで作成される。
+        """
+        connection = MagicMock(vendor='postgresql', in_atomic_block=False)
+        connection.ops.quote_name = lambda name: '"%s"' % name
+        connections.__getitem__.return_value = connection
+
+        call_command('twingo2_create_trigram_indexes', stdout=StringIO())
+
+        cursor = connection.cursor.return_value.__enter__.return_value
+        self.assertEqual([
+            'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS "twingo2_user_screen_name_trgm" ON "twingo2_user" '
+            'USING gin (UPPER("screen_name"::text) gin_trgm_ops)',
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS "twingo2_user_name_trgm" ON "twingo2_user" '
+            'USING gin (UPPER("name"::text) gin_trgm_ops)',
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS "twingo2_user_description_trgm" ON "twingo2_user" '
+            'USING gin (UPPER("description"::text) gin_trgm_ops)',
+        ], [c[0][0] for c in cursor.execute.call_args_list])
+
+    def test_handle_02(self):
+        """
+        [対象] handle() : No.02
+        [条件] PostgreSQL以外のデータベースで実行する。
+        [結果] CommandErrorが送出される。
+        """
+        with self.assertRaises(CommandError):
+            call_command('twingo2_create_trigram_indexes', stdout=StringIO())
+
+
+class ExportCommandTest(TestCase):
+    """
+    twingo2_exportとtwingo2_import_dumpコマンドに対するテストコード。
+    """
+
+    def setUp(self):
+        """
+        初期処理を実行する。
+        """
+        # 出力先のディレクトリを作成する
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """
+        終了処理を実行する。
+        """
+        # 出力先のディレクトリを削除する
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+        os.rmdir(self.directory)
+
+    def export_and_import(self, name, **options):
+        """
+        ユーザーを出力し、すべて削除してから登録し直す。
+
+        :param name: ダンプファイル名
+        :type name: str
+        :param options: コマンドラインオプション
+        :type options: dict
+        :return: 出力前のユーザーのリストと、登録し直した後のユーザーのリスト
+        :rtype: tuple
+        """
+        # 空文字列、記号、改行を含むユーザーを作成する
+        UserFactory(twitter_id=1, description='', url='', is_staff=True)
+        UserFactory(twitter_id=2, name='ちぃといつ', description='"quoted", comma\nnewline')
+        UserFactory(twitter_id=3, is_active=False)
+        fields = ('twitter_id', 'screen_name', 'name', 'description', 'is_active', 'is_staff', 'last_login',
+                  'created_at', 'updated_at')
+        expected = list(User.objects.order_by('twitter_id').values_list(*fields))
+
+        # 出力して登録し直す
+        path = os.path.join(self.directory, name)
+        call_command('twingo2_export', path, batch_size=2, stderr=StringIO(), **options)
+        User.objects.all().delete()
+        stdout = StringIO()
+        call_command('twingo2_import_dump', path, batch_size=2, stdout=stdout, **options)
+
+        self.assertEqual('3 users imported.', stdout.getvalue().strip())
+        return expected, list(User.objects.order_by('twitter_id').values_list(*fields))
+
+    def test_handle_01(self):
+        """
+        [対象] handle() : No.01
+        [条件] JSON Lines形式で出力して登録し直す。
+        [結果] 空文字列、記号、日時を含めて元のユーザーが復元される。
+        """
+        expected, actual = self.export_and_import('users.jsonl')
+        self.assertEqual(expected, actual)
+
+    def test_handle_02(self):
+        """
+        [対象] handle() : No.02
+        [条件] gzipで圧縮したCSV形式で出力して登録し直す。
+        [結果] 空文字列、記号、日時を含めて元のユーザーが復元される。
+        """
+        expected, actual = self.export_and_import('users.csv.gz')
+        self.assertEqual(expected, actual)
+        with open(os.path.join(self.directory, 'users.csv.gz'), 'rb') as f:
+            self.assertEqual(b'\x1f\x8b', f.read(2))
+
+    def test_handle_03(self):
+        """
+        [対象] handle() : No.03
+        [条件] 拡張子から判定できないファイルに形式と圧縮形式を指定して出力して登録し直す。
+        [結果] 元のユーザーが復元される。
+        """
+        expected, actual = self.export_and_import('users.dump', format='csv', compress='bz2')
+        self.assertEqual(expected, actual)
+
+    def test_handle_04(self):
+        """
+        [対象] handle() : No.04
+        [条件] 登録済みのTwitter IDと、ファイル内で重複したTwitter IDを含むダンプファイルを登録する。
+        [結果] 登録されていないTwitter IDのユーザーのみが1件ずつ登録され、登録済みのユーザーは更新されない。
+        """
+        UserFactory(twitter_id=1, screen_name='existing')
+        path = os.path.join(self.directory, 'users.jsonl')
+        with open(path, 'w') as f:
+            for twitter_id, screen_name in ((1, 'new'), (2, 'two'), (2, 'two')):
+                f.write(json.dumps({
+                    'twitter_id': twitter_id, 'screen_name': screen_name, 'name': screen_name,
+                    'last_login': '2015-01-01T00:00:00+00:00',
+                }) + '\n')
+            f.write('\n')
+
+        stdout = StringIO()
+        call_command('twingo2_import_dump', path, stdout=stdout)
+
+        self.assertEqual('1 users imported.', stdout.getvalue().strip())
+        self.assertEqual(['existing', 'two'], list(User.objects.order_by('twitter_id').values_list(
+            'screen_name', flat=True
+        )))
+
+    def test_handle_05(self):
+        """
+        [対象] handle() : No.05
+        [条件] 変換できない値を含むダンプファイルを登録する。
+        [結果] CommandErrorが送出される。
+        """
+        path = os.path.join(self.directory, 'users.jsonl')
+        with open(path, 'w') as f:
+            f.write('{"twitter_id": "abc", "screen_name": "a", "name": "a"}\n')
+
+        with self.assertRaises(CommandError):
+            call_command('twingo2_import_dump', path, stdout=StringIO())
+
+    def test_handle_06(self):
+        """
+        [対象] handle() : No.06
+        [条件] デフォルトのバッチサイズで、999件を超えるユーザーを含むダンプファイルを登録する。
+        [結果] 1つのクエリにバインドするパラメーターが999個以下に分割されてすべてのユーザーが登録される。
+        """
+        path = os.path.join(self.directory, 'users.jsonl')
+        with open(path, 'w') as f:
+            for twitter_id in range(1, 1101):
+                f.write(json.dumps({
+                    'twitter_id': twitter_id, 'screen_name': 'screen_%d' % twitter_id, 'name': 'name',
+                    'last_login': '2015-01-01T00:00:00+00:00',
+                }) + '\n')
+
+        stdout = StringIO()
+        with record_query_params() as counts:
+            call_command('twingo2_import_dump', path, stdout=stdout)
+
+        self.assertEqual('1100 users imported.', stdout.getvalue().strip())
+        self.assertLessEqual(max(counts), 999)
+        self.assertEqual(1100, User.objects.count())
+
+    def test_handle_07(self):
+        """
+        [対象] handle() : No.07
+        [条件] 2つ目以降のバッチに変換できない値を含むダンプファイルを登録する。
+        [結果] CommandErrorが送出され、先行するバッチのユーザーも登録されない。
+        """
+        path = os.path.join(self.directory, 'users.jsonl')
+        with open(path, 'w') as f:
+            for twitter_id in (1, 2, 'abc'):
+                f.write(json.dumps({
+                    'twitter_id': twitter_id, 'screen_name': 'screen', 'name': 'name',
+                    'last_login': '2015-01-01T00:00:00+00:00',
+                }) + '\n')
+
+        with self.assertRaises(CommandError):
+            call_command('twingo2_import_dump', path, batch_size=1, stdout=StringIO())
+        self.assertFalse(User.objects.exists())
+
+
+@override_settings(USER_SHARD_DATABASES=('shard0', 'shard1'))
+class RebalanceShardsCommandTest(TestCase):
+    """
+    twingo2_rebalance_shardsコマンドに対するテストコード。
+    Twitter ID 1と3はshard1、Twitter ID 2と4はshard0に振り分けられる。
+    """
+
+    multi_db = True
+
+    def test_handle_01(self):
+        """
+        [対象] handle() : No.01
+        [条件] 対応しないシャードと、シャーディング前のデータベースにユーザーを格納して実行する。
+        [結果] ユーザーと保存したアクセストークンが作成日時を維持して対応するシャードに移動する。
+        """
+        created_at = datetime.datetime(2015, 1, 1, tzinfo=datetime.timezone.utc)
+        misplaced = User.objects.db_manager('shard0').create_user(1, 'misplaced', 'name')
+        User.objects.using('shard0').filter(pk=misplaced.pk).update(created_at=created_at)
+        AccessToken.objects.using('shard0').create(user=misplaced, encrypted_token='token', key_id='key')
+        User.objects.create_user(4, 'placed', 'name')
+        User.objects.db_manager('default').create_user(2, 'legacy', 'name')
+
+        stdout = StringIO()
+        call_command('twingo2_rebalance_shards', sources=['default'], batch_size=1, stdout=stdout)
+
+        self.assertEqual('3 users checked, 2 users moved.', stdout.getvalue().strip())
+        self.assertEqual(['placed', 'legacy'], list(User.objects.using('shard0').order_by('pk').values_list(
+            'screen_name', flat=True
+        )))
+        moved = User.objects.using('shard1').get(twitter_id=1)
+        self.assertEqual(created_at, moved.created_at)
+        self.assertEqual('token', AccessToken.objects.using('shard1').get(user=moved).encrypted_token)
+        self.assertFalse(AccessToken.objects.using('shard0').exists())
+        self.assertFalse(User.objects.using('default').exists())
+
+    def test_handle_02(self):
+        """
+        [対象] handle() : No.02
+        [条件] 移動先に、移行中のログインで作成された同じTwitter IDのユーザーが存在する状態で実行する。
+        [結果] 移動元のユーザーの無効化・権限・作成日時・アクセストークンが移動先のユーザーに統合され、移動元のユーザーは削除される。
+        """
+        created_at = datetime.datetime(2015, 1, 1, tzinfo=datetime.timezone.utc)
+        old = User.objects.db_manager('shard0').create_user(3, 'old', 'name')
+        User.objects.using('shard0').filter(pk=old.pk).update(is_active=False, is_staff=True, created_at=created_at)
+        AccessToken.objects.using('shard0').create(user=old, encrypted_token='token', key_id='key')
+        User.objects.create_user(3, 'new', 'name')
+
+        call_command('twingo2_rebalance_shards', stdout=StringIO())
+
+        self.assertFalse(User.objects.using('shard0').exists())
+        merged = User.objects.using('shard1').get(twitter_id=3)
+        self.assertEqual('new', merged.screen_name)
+        self.assertFalse(merged.is_active)
+        self.assertTrue(merged.is_staff)
+        self.assertEqual(created_at, merged.created_at)
+        self.assertEqual('token', AccessToken.objects.using('shard1').get(user=merged).encrypted_token)
+
+    def test_handle_03(self):
+        """
+        [対象] handle() : No.03
+        [条件] --dry-runを指定して実行する。
+        [結果] 移動するユーザーの数のみが出力され、ユーザーは移動しない。
+        """
+        User.objects.db_manager('shard0').create_user(1, 'misplaced', 'name')
+
+        stdout = StringIO()
+        call_command('twingo2_rebalance_shards', dry_run=True, stdout=stdout)
+
+        self.assertEqual('1 users checked, 1 users would be moved.', stdout.getvalue().strip())
+        self.assertTrue(User.objects.using('shard0').filter(twitter_id=1).exists())
+
+    def test_handle_04(self):
+        """
+        [対象] handle() : No.04
+        [条件] USER_SHARD_DATABASESを設定せずに実行する。
+        [結果] CommandErrorが送出される。
+        """
+        with self.settings(USER_SHARD_DATABASES=()):
+            with self.assertRaises(CommandError):
+                call_command('twingo2_rebalance_shards', stdout=StringIO())
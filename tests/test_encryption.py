@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from twingo2 import encryption
+
+
+OLD_KEY = '8ImC3AIUj2eme1NQtyfS_bJ8wE-GR5_cO-vjH36zRqg='
+NEW_KEY = 'wC3UB33-kjz4PeN85hOM7Q0YC0n_vRlTkBHp-1Iahks='
+
+
+class EncryptionTest(TestCase):
+    """
+    encryptionに対するテストコード。
+    """
+
+    @override_settings(TOKEN_ENCRYPTION_KEYS=[OLD_KEY])
+    def test_encrypt_01(self):
+        """
+        [対象] encrypt() : No.01
+        [条件] 文字列を暗号化して復号する。
+        [結果] 元の文字列が復元され、暗号鍵のIDが返却される。
+        """
+        token, key_id = encryption.encrypt('ちぃといつ')
+
+        self.assertNotIn('ちぃといつ', token)
+        self.assertEqual(encryption.get_key_id(OLD_KEY), key_id)
+        self.assertEqual('ちぃといつ', encryption.decrypt(token))
+
+    def test_encrypt_02(self):
+        """
+        [対象] encrypt() : No.02
+        [条件] TOKEN_ENCRYPTION_KEYSを設定しない。
+        [結果] ImproperlyConfiguredが送出される。
+        """
+        with self.assertRaises(ImproperlyConfigured):
+            encryption.encrypt('value')
+
+    def test_decrypt_01(self):
+        """
+        [対象] decrypt() : No.01
+        [条件] 古い暗号鍵で暗号化した文字列を、新しい暗号鍵を先頭に追加した設定で復号する。
+        [結果] 元の文字列が復元される。
+        """
+        with self.settings(TOKEN_ENCRYPTION_KEYS=[OLD_KEY]):
+            token, _ = encryption.encrypt('value')
+        with self.settings(TOKEN_ENCRYPTION_KEYS=[NEW_KEY, OLD_KEY]):
+            self.assertEqual('value', encryption.decrypt(token))
+
+    def test_decrypt_02(self):
+        """
+        [対象] decrypt() : No.02
+        [条件] 設定されていない暗号鍵で暗号化した文字列を復号する。
+        [結果] InvalidTokenが送出される。
+        """
+        with self.settings(TOKEN_ENCRYPTION_KEYS=[OLD_KEY]):
+            token, _ = encryption.encrypt('value')
+        with self.settings(TOKEN_ENCRYPTION_KEYS=[NEW_KEY]):
+            with self.assertRaises(encryption.InvalidToken):
+                encryption.decrypt(token)
+
+    def test_rotate_01(self):
+        """
+        [対象] rotate() : No.01
+        [条件] 古い暗号鍵で暗号化した文字列を暗号化し直す。
+        [結果] 新しい暗号鍵のみで復号できる暗号文が返却される。
+        """
+        with self.settings(TOKEN_ENCRYPTION_KEYS=[OLD_KEY]):
+            token, _ = encryption.encrypt('value')
+        with self.settings(TOKEN_ENCRYPTION_KEYS=[NEW_KEY, OLD_KEY]):
+            token, key_id = encryption.rotate(token)
+        with self.settings(TOKEN_ENCRYPTION_KEYS=[NEW_KEY]):
+            self.assertEqual('value', encryption.decrypt(token))
+        self.assertEqual(encryption.get_key_id(NEW_KEY), key_id)
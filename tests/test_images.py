@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import io
+import shutil
+import tempfile
+from mock import Mock, patch
+
+from PIL import Image
+
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from twingo2 import images
+from twingo2.models import ProfileImage, User
+
+
+def make_image(format='PNG', size=(400, 400)):
+    """
+    テスト用の画像を生成する。
+
+    :param format: 画像の形式
+    :type format: str
+    :param size: 画像の大きさ
+    :type size: tuple
+    :return: 画像のバイト列
+    :rtype: bytes
+    """
+    output = io.BytesIO()
+    Image.new('RGB', size, (255, 0, 0)).save(output, format)
+    return output.getvalue()
+
+
+class ImagesTest(TestCase):
+    """
+    images.pyに対するテストコード。
+    """
+
+    def setUp(self):
+        """
+        テストの前処理を行う。
+        """
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(
+            MEDIA_ROOT=self.media_root,
+            PROFILE_IMAGE_STORAGE='django.core.files.storage.FileSystemStorage',
+            PROFILE_IMAGE_SIZES=(48, 96),
+        )
+        self.override.enable()
+        self.user = User.objects.create(
+            twitter_id=1, screen_name='chii', last_login=timezone.now(), profile_image_url='http://dummy.com/chii_normal.png'
+        )
+
+    def tearDown(self):
+        """
+        テストの後処理を行う。
+        """
+        self.override.disable()
+        shutil.rmtree(self.media_root)
+
+    def test_get_source_url_01(self):
+        """
+        [対象] get_source_url() : No.01
+        [条件] サイズ指定を含むURLを指定する。
+        [結果] サイズ指定を除いたURLが返却される。
+        """
+        self.assertEqual('http://dummy.com/chii.png', images.get_source_url('http://dummy.com/chii_normal.png'))
+        self.assertEqual('http://dummy.com/chii', images.get_source_url('http://dummy.com/chii_normal'))
+
+    def test_refresh_01(self):
+        """
+        [対象] ProfileImagePipeline.refresh() : No.01
+        [条件] 保存されていないユーザーの画像を取得する。
+        [結果] 元の画像とサムネイルがハッシュ値を名前として保存される。
+        """
+        pipeline = images.ProfileImagePipeline()
+        with patch.object(pipeline, '_fetch', return_value=make_image()) as fetch:
+            self.assertTrue(pipeline.refresh(self.user.pk, self.user.profile_image_url))
+        fetch.assert_called_once_with('http://dummy.com/chii.png')
+
+        profile_image = ProfileImage.objects.get(pk=self.user.pk)
+        self.assertEqual(self.user.profile_image_url, profile_image.source_url)
+        self.assertEqual('png', profile_image.extension)
+        storage = images.get_storage()
+        self.assertTrue(storage.exists(images.get_path(images.get_name(profile_image.digest, 'png'))))
+        for size in (48, 96):
+            with storage.open(images.get_path(images.get_name(profile_image.digest, 'png', size))) as f:
+                self.assertEqual((size, size), Image.open(f).size)
+
+    def test_refresh_02(self):
+        """
+        [対象] ProfileImagePipeline.refresh() : No.02
+        [条件] 取得元のURLが変更されていないユーザーの画像を取得する。
+        [結果] 画像を取得せずにFalseが返却される。
+        """
+        ProfileImage.objects.create(user=self.user, source_url=self.user.profile_image_url, digest='0' * 64,
+                                    extension='png')
+
+        pipeline = images.ProfileImagePipeline()
+        with patch.object(pipeline, '_fetch') as fetch:
+            self.assertFalse(pipeline.refresh(self.user.pk, self.user.profile_image_url))
+        self.assertFalse(fetch.called)
+
+    def test_refresh_03(self):
+        """
+        [対象] ProfileImagePipeline.refresh() : No.03
+        [条件] 画像ではないデータを取得する。
+        [結果] ValueErrorが送出され、ProfileImageは作成されない。
+        """
+        pipeline = images.ProfileImagePipeline()
+        with patch.object(pipeline, '_fetch', return_value=b'<html></html>'):
+            with self.assertRaises(ValueError):
+                pipeline.refresh(self.user.pk, self.user.profile_image_url)
+        self.assertFalse(ProfileImage.objects.exists())
+
+    def test_schedule_01(self):
+        """
+        [対象] ProfileImagePipeline.schedule() : No.01
+        [条件] 処理が完了する前に同じユーザーの取得を2回予約する。
+        [結果] 1回のみ実行される。
+        """
+        pipeline = images.ProfileImagePipeline()
+        pipeline._executor = Mock()
+        pipeline.schedule(1, 'http://dummy.com/a.png')
+        pipeline.schedule(1, 'http://dummy.com/b.png')
+        pipeline.schedule(2, 'http://dummy.com/c.png')
+
+        self.assertEqual(2, pipeline._executor.submit.call_count)
+
+    def test_schedule_02(self):
+        """
+        [対象] ProfileImagePipeline.schedule() : No.02
+        [条件] 処理が完了した後に同じユーザーの取得を予約する。
+        [結果] 再度実行される。
+        """
+        pipeline = images.ProfileImagePipeline()
+        with patch.object(pipeline, 'refresh') as refresh, patch('twingo2.images.connection'):
+            pipeline.schedule(1, 'http://dummy.com/a.png')
+            pipeline.shutdown()
+            pipeline.schedule(1, 'http://dummy.com/b.png')
+            pipeline.shutdown()
+
+        self.assertEqual(2, refresh.call_count)
+
+    def test_get_profile_image_url_01(self):
+        """
+        [対象] get_profile_image_url() : No.01
+        [条件] プロフィール画像のローカル保存を無効にする。
+        [結果] TwitterのURLが返却される。
+        """
+        self.assertEqual(self.user.profile_image_url, images.get_profile_image_url(self.user))
+
+    @override_settings(PROFILE_IMAGE_CACHE_ENABLED=True)
+    @patch('twingo2.images.pipeline')
+    def test_get_profile_image_url_02(self, pipeline):
+        """
+        [対象] get_profile_image_url() : No.02
+        [条件] 画像が保存されていないユーザーを指定する。
+        [結果] TwitterのURLが返却され、取得が予約される。
+        """
+        self.assertEqual(self.user.profile_image_url, images.get_profile_image_url(self.user))
+        pipeline.schedule.assert_called_once_with(self.user.pk, self.user.profile_image_url)
+
+    @override_settings(PROFILE_IMAGE_CACHE_ENABLED=True)
+    @patch('twingo2.images.pipeline')
+    def test_get_profile_image_url_03(self, pipeline):
+        """
+        [対象] get_profile_image_url() : No.03
+        [条件] 画像が保存されているユーザーを指定する。
+        [結果] 指定した大きさ以上で最小のサムネイルのローカルのURLが返却される。
+        """
+        ProfileImage.objects.create(user=self.user, source_url=self.user.profile_image_url, digest='a' * 64,
+                                    extension='gif')
+        user = User.objects.select_related('profile_image').get(pk=self.user.pk)
+
+        self.assertEqual('/twingo2/profile_images/%s.gif' % ('a' * 64), images.get_profile_image_url(user))
+        self.assertEqual('/twingo2/profile_images/%s_96.png' % ('a' * 64), images.get_profile_image_url(user, 50))
+        self.assertEqual('/twingo2/profile_images/%s.gif' % ('a' * 64), images.get_profile_image_url(user, 500))
+        self.assertFalse(pipeline.schedule.called)
+
+    @override_settings(PROFILE_IMAGE_CACHE_ENABLED=True)
+    @patch('twingo2.images.pipeline')
+    def test_get_profile_image_url_04(self, pipeline):
+        """
+        [対象] get_profile_image_url() : No.04
+        [条件] Twitterのプロフィール画像が変更されたユーザーを指定する。
+        [結果] TwitterのURLが返却され、取得が予約される。
+        """
+        ProfileImage.objects.create(user=self.user, source_url='http://dummy.com/old.png', digest='a' * 64,
+                                    extension='png')
+        user = User.objects.select_related('profile_image').get(pk=self.user.pk)
+
+        self.assertEqual(self.user.profile_image_url, images.get_profile_image_url(user))
+        pipeline.schedule.assert_called_once_with(self.user.pk, self.user.profile_image_url)
+
+    @override_settings(PROFILE_IMAGE_CACHE_ENABLED=True)
+    @patch('twingo2.images.pipeline')
+    def test_schedule_profile_image_refresh_01(self, pipeline):
+        """
+        [対象] schedule_profile_image_refresh() : No.01
+        [条件] プロフィール画像のURLを含むフィールドと含まないフィールドを更新する。
+        [結果] プロフィール画像のURLを更新した場合のみ取得が予約される。
+        """
+        self.user.name = 'ちぃ'
+        self.user.save(update_fields=['name'])
+        self.assertFalse(pipeline.schedule.called)
+
+        self.user.profile_image_url = 'http://dummy.com/new_normal.png'
+        self.user.save(update_fields=['profile_image_url'])
+        pipeline.schedule.assert_called_once_with(self.user.pk, 'http://dummy.com/new_normal.png')
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from mock import Mock
+
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from twingo2 import metrics
+from twingo2.signals import login_failed, login_phase_finished
+
+
+class RegistryTest(TestCase):
+    """
+    metrics.Registryに対するテストコード。
+    """
+
+    def test_render_01(self):
+        """
+        [対象] render() : No.01
+        [条件] カウンターを増やす。
+        [結果] ラベルごとのカウンターが出力される。
+        """
+        registry = metrics.Registry()
+        registry.increment('twingo2_login_failures_total', reason='token_mismatch')
+        registry.increment('twingo2_login_failures_total', reason='token_mismatch')
+        registry.increment('twingo2_login_failures_total', reason='authentication_failed')
+
+        self.assertEqual(
+            '# TYPE twingo2_login_failures_total counter\n'
+            'twingo2_login_failures_total{reason="authentication_failed"} 1\n'
+            'twingo2_login_failures_total{reason="token_mismatch"} 2\n',
+            registry.render()
+        )
+
+    @override_settings(LOGIN_METRICS_BUCKETS=(0.1, 1.0))
+    def test_render_02(self):
+        """
+        [対象] render() : No.02
+        [条件] ヒストグラムに値を記録する。
+        [結果] 区間ごとの累積件数、合計値、件数が出力される。
+        """
+        registry = metrics.Registry()
+        registry.observe('twingo2_login_phase_seconds', 0.05, phase='callback')
+        registry.observe('twingo2_login_phase_seconds', 0.5, phase='callback')
+        registry.observe('twingo2_login_phase_seconds', 2.0, phase='callback')
+
+        self.assertEqual(
+            '# TYPE twingo2_login_phase_seconds histogram\n'
+            'twingo2_login_phase_seconds_bucket{phase="callback",le="0.1"} 1\n'
+            'twingo2_login_phase_seconds_bucket{phase="callback",le="1.0"} 2\n'
+            'twingo2_login_phase_seconds_bucket{phase="callback",le="+Inf"} 3\n'
+            'twingo2_login_phase_seconds_sum{phase="callback"} 2.55\n'
+            'twingo2_login_phase_seconds_count{phase="callback"} 3\n',
+            registry.render()
+        )
+
+    def test_render_03(self):
+        """
+        [対象] render() : No.03
+        [条件] 何も記録しない。
+        [結果] 空文字が返却される。
+        """
+        self.assertEqual('', metrics.Registry().render())
+
+
+class MetricsTest(TestCase):
+    """
+    metricsに対するテストコード。
+    """
+
+    def setUp(self):
+        """
+        初期処理を実行する。
+        """
+        # メトリクスを初期化する
+        metrics.registry.clear()
+
+    def test_timer_01(self):
+        """
+        [対象] timer() : No.01
+        [条件] 計測を無効にする。
+        [結果] 何も記録されず、シグナルも送信されない。
+        """
+        receiver = Mock()
+        login_phase_finished.connect(receiver)
+        try:
+            with metrics.timer('callback'):
+                pass
+        finally:
+            login_phase_finished.disconnect(receiver)
+
+        self.assertEqual('', metrics.registry.render())
+        self.assertFalse(receiver.called)
+
+    @override_settings(LOGIN_METRICS_ENABLED=True)
+    def test_timer_02(self):
+        """
+        [対象] timer() : No.02
+        [条件] 計測を有効にする。
+        [結果] 所要時間がヒストグラムに記録され、シグナルが送信される。
+        """
+        receiver = Mock()
+        login_phase_finished.connect(receiver)
+        try:
+            with metrics.timer('callback'):
+                pass
+        finally:
+            login_phase_finished.disconnect(receiver)
+
+        self.assertIn('twingo2_login_phase_seconds_count{phase="callback"} 1', metrics.registry.render())
+        self.assertEqual('callback', receiver.call_args[1]['phase'])
+        self.assertGreaterEqual(receiver.call_args[1]['duration'], 0)
+
+    @override_settings(LOGIN_METRICS_ENABLED=True)
+    def test_record_failure_01(self):
+        """
+        [対象] record_failure() : No.01
+        [条件] 計測を有効にする。
+        [結果] 原因ごとのカウンターが増え、シグナルが送信される。
+        """
+        receiver = Mock()
+        login_failed.connect(receiver)
+        try:
+            metrics.record_failure('request', 'token_mismatch')
+        finally:
+            login_failed.disconnect(receiver)
+
+        self.assertEqual(1, metrics.registry.get_counter('twingo2_login_failures_total', reason='token_mismatch'))
+        self.assertEqual('request', receiver.call_args[1]['request'])
+        self.assertEqual('token_mismatch', receiver.call_args[1]['reason'])
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from mock import patch
+
+from django.http import HttpResponse
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+
+from twingo2 import tokens
+from twingo2.models import User
+
+
+@override_settings(SIGNED_TOKEN_MAX_AGE=3600, SIGNED_TOKEN_REFRESH_INTERVAL=300)
+class SignedTokenMiddlewareTest(TestCase):
+    """
+    middleware.SignedTokenMiddlewareに対するテストコード。
+    """
+
+    def setUp(self):
+        """
+        初期処理を実行する。
+        """
+        # テスト用のユーザーとトークンを作成する
+        self.user = User.objects.create_user(twitter_id=1402804142, screen_name='7pairs', name='ちぃといつ')
+        self.factory = RequestFactory()
+
+    def _get_target_object(self):
+        """
+        テスト対象のオブジェクトを取得する。
+
+        :return: テスト対象のミドルウェア
+        :rtype: twingo2.middleware.SignedTokenMiddleware
+        """
+        # テスト対象のオブジェクトを生成する
+        from twingo2.middleware import SignedTokenMiddleware
+        return SignedTokenMiddleware()
+
+    def _process(self, request):
+        """
+        ミドルウェアにリクエストを処理させる。
+
+        :param request: リクエストオブジェクト
+        :type request: django.http.HttpRequest
+        :return: レスポンスオブジェクト
+        :rtype: django.http.HttpResponse
+        """
+        # リクエストとレスポンスを処理する
+        middleware = self._get_target_object()
+        middleware.process_request(request)
+        return middleware.process_response(request, HttpResponse())
+
+    def test_process_request_01(self):
+        """
+        [対象] process_request() : No.01
+        [条件] 有効なトークンをクッキーで送信する。
+        [結果] データベースにアクセスせずにrequest.userが設定される。
+        """
+        request = self.factory.get('/')
+        request.COOKIES['twingo2_token'] = tokens.issue_token(self.user)
+
+        with self.assertNumQueries(0):
+            response = self._process(request)
+
+        self.assertEqual(self.user.pk, request.user.id)
+        self.assertEqual('7pairs', request.user.screen_name)
+        self.assertFalse(request.user.is_staff)
+        self.assertNotIn('twingo2_token', response.cookies)
+
+    def test_process_request_02(self):
+        """
+        [対象] process_request() : No.02
+        [条件] 有効なトークンをAuthorizationヘッダーで送信する。
+        [結果] request.userが設定される。
+        """
+        request = self.factory.get('/', HTTP_AUTHORIZATION='Bearer %s' % tokens.issue_token(self.user))
+
+        self._process(request)
+
+        self.assertEqual(self.user.pk, request.user.id)
+
+    def test_process_request_03(self):
+        """
+        [対象] process_request() : No.03
+        [条件] 不正なトークンをクッキーで送信する。
+        [結果] 匿名ユーザーとして扱われ、クッキーが削除される。
+        """
+        request = self.factory.get('/')
+        request.COOKIES['twingo2_token'] = 'invalid'
+
+        response = self._process(request)
+
+        self.assertFalse(request.user.is_authenticated())
+        self.assertEqual('', response.cookies['twingo2_token'].value)
+
+    @patch('twingo2.tokens.time')
+    def test_process_request_04(self, time):
+        """
+        [対象] process_request() : No.04
+        [条件] 再検証の間隔が経過したトークンを送信する。
+        [結果] データベースの内容でトークンが再発行される。
+        """
+        time.time.return_value = 1000000000
+        token = tokens.issue_token(self.user)
+        User.objects.filter(pk=self.user.pk).update(screen_name='8pairs')
+        time.time.return_value = 1000000300
+        request = self.factory.get('/')
+        request.COOKIES['twingo2_token'] = token
+
+        response = self._process(request)
+
+        self.assertEqual('8pairs', request.user.screen_name)
+        self.assertEqual('8pairs', tokens.load_token(response.cookies['twingo2_token'].value)['s'])
+
+    @patch('twingo2.tokens.time')
+    def test_process_request_05(self, time):
+        """
+        [対象] process_request() : No.05
+        [条件] 再検証の間隔が経過したトークンを、無効化されたユーザーが送信する。
+        [結果] 匿名ユーザーとして扱われ、クッキーが削除される。
+        """
+        time.time.return_value = 1000000000
+        token = tokens.issue_token(self.user)
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        time.time.return_value = 1000000300
+        request = self.factory.get('/')
+        request.COOKIES['twingo2_token'] = token
+
+        response = self._process(request)
+
+        self.assertFalse(request.user.is_authenticated())
+        self.assertEqual('', response.cookies['twingo2_token'].value)
+
+    @override_settings(SIGNED_TOKEN_MAX_AGE=None)
+    def test_process_request_06(self):
+        """
+        [対象] process_request() : No.06
+        [条件] SIGNED_TOKEN_MAX_AGEを設定しない。
+        [結果] トークンは無視される。
+        """
+        request = self.factory.get('/')
+        request.COOKIES['twingo2_token'] = tokens.issue_token(self.user)
+
+        self._process(request)
+
+        self.assertFalse(hasattr(request, 'user'))
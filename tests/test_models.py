@@ -17,12 +17,16 @@
 #
 
 import datetime
+from mock import patch
 
 import factory
 
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
 
-from twingo2.models import User
+from twingo2.models import AccessToken, User
 
 
 class UserFactory(factory.DjangoModelFactory):
@@ -230,6 +234,197 @@ class UserManagerTest(TestCase):
             )
 
 
+    def test_create_or_get_user_01(self):
+        """
+        [対象] create_or_get_user() : No.01
+        [条件] 未登録のTwitter IDを指定する。
+        [結果] 一般ユーザーが1回のクエリで作成される。
+        """
+        with self.assertNumQueries(1):
+            actual, created = User.objects.create_or_get_user(
+                twitter_id=1402804142,
+                screen_name='7pairs',
+                name='ちぃといつ',
+                location='西武プリンスドーム'
+            )
+
+        user = User.objects.get(twitter_id=1402804142)
+        self.assertTrue(created)
+        self.assertEqual(user, actual)
+        self.assertEqual('7pairs', user.screen_name)
+        self.assertEqual('ちぃといつ', user.name)
+        self.assertEqual('西武プリンスドーム', user.location)
+        self.assertFalse(user.has_usable_password())
+        self.assertTrue(user.is_active)
+        self.assertFalse(user.is_superuser)
+        self.assertFalse(user.is_staff)
+
+    def test_create_or_get_user_02(self):
+        """
+        [対象] create_or_get_user() : No.02
+        [条件] 管理者として未登録のTwitter IDを指定する。
+        [結果] 管理者ユーザーが作成される。
+        """
+        actual, created = User.objects.create_or_get_user(
+            twitter_id=1402804142,
+            screen_name='7pairs',
+            name='ちぃといつ',
+            is_superuser=True
+        )
+
+        self.assertTrue(created)
+        self.assertTrue(actual.is_superuser)
+        self.assertTrue(actual.is_staff)
+
+    def test_create_or_get_user_03(self):
+        """
+        [対象] create_or_get_user() : No.03
+        [条件] 登録済みのTwitter IDを指定する。
+        [結果] IntegrityErrorは発生せず、登録済みのユーザーが返却される。
+        """
+        user = UserFactory(twitter_id=1402804142)
+
+        actual, created = User.objects.create_or_get_user(
+            twitter_id=user.twitter_id,
+            screen_name='7pairs',
+            name='ちぃといつ'
+        )
+
+        self.assertFalse(created)
+        self.assertEqual(user, actual)
+        self.assertEqual(user.screen_name, actual.screen_name)
+        self.assertEqual(1, User.objects.count())
+
+    @patch.object(connection.Database, 'sqlite_version_info', (3, 8, 0))
+    def test_create_or_get_user_04(self):
+        """
+        [対象] create_or_get_user() : No.04
+        [条件] ON CONFLICTをサポートしていないデータベースで登録済みのTwitter IDを指定する。
+        [結果] IntegrityErrorは発生せず、登録済みのユーザーが返却される。
+        """
+        user = UserFactory(twitter_id=1402804142)
+
+        actual, created = User.objects.create_or_get_user(
+            twitter_id=user.twitter_id,
+            screen_name='7pairs',
+            name='ちぃといつ'
+        )
+
+        self.assertFalse(created)
+        self.assertEqual(user, actual)
+
+    @patch.object(connection.Database, 'sqlite_version_info', (3, 8, 0))
+    def test_create_or_get_user_05(self):
+        """
+        [対象] create_or_get_user() : No.05
+        [条件] ON CONFLICTをサポートしていないデータベースで未登録のTwitter IDを指定する。
+        [結果] 一般ユーザーが作成される。
+        """
+        actual, created = User.objects.create_or_get_user(
+            twitter_id=1402804142,
+            screen_name='7pairs',
+            name='ちぃといつ'
+        )
+
+        self.assertTrue(created)
+        self.assertEqual(User.objects.get(twitter_id=1402804142), actual)
+
+    def test_create_or_get_user_06(self):
+        """
+        [対象] create_or_get_user() : No.06
+        [条件] Twitter IDを指定しない。
+        [結果] ValueErrorが送出される。
+        """
+        with self.assertRaises(ValueError):
+            User.objects.create_or_get_user(
+                twitter_id=None,
+                screen_name='7pairs',
+                name='ちぃといつ'
+            )
+
+
+    def test_get_by_screen_name_01(self):
+        """
+        [対象] get_by_screen_name() : No.01
+        [条件] 大文字小文字が異なるユーザー名を指定する。
+        [結果] 対応するユーザーが返却される。
+        """
+        user = UserFactory(screen_name='Chii_7pairs')
+
+        self.assertEqual(user, User.objects.get_by_screen_name('chii_7PAIRS'))
+
+    def test_get_by_screen_name_02(self):
+        """
+        [対象] get_by_screen_name() : No.02
+        [条件] 同じユーザー名のユーザーが複数存在する。
+        [結果] 最後に更新されたユーザーが返却される。
+        """
+        old_user = UserFactory(screen_name='chii')
+        new_user = UserFactory(screen_name='CHII')
+        User.objects.filter(pk=old_user.pk).update(updated_at=timezone.now())
+
+        self.assertEqual(old_user, User.objects.get_by_screen_name('chii'))
+        User.objects.filter(pk=new_user.pk).update(updated_at=timezone.now())
+        self.assertEqual(new_user, User.objects.get_by_screen_name('chii'))
+
+    def test_get_by_screen_name_03(self):
+        """
+        [対象] get_by_screen_name() : No.03
+        [条件] 存在しないユーザー名を指定する。
+        [結果] User.DoesNotExistが送出される。
+        """
+        UserFactory(screen_name='chii')
+
+        with self.assertRaises(User.DoesNotExist):
+            User.objects.get_by_screen_name('chi_')
+
+    def test_in_bulk_by_screen_name_01(self):
+        """
+        [対象] in_bulk_by_screen_name() : No.01
+        [条件] 存在するユーザー名と存在しないユーザー名を大文字小文字を混在させて指定する。
+        [結果] 1回のクエリで、存在するユーザーのみが小文字のユーザー名をキーとして返却される。
+        """
+        user_1 = UserFactory(screen_name='Chii')
+        user_2 = UserFactory(screen_name='itsu')
+
+        with self.assertNumQueries(1):
+            actual = User.objects.in_bulk_by_screen_name(['CHII', 'chii', 'Itsu', 'unknown'])
+        self.assertEqual({'chii': user_1, 'itsu': user_2}, actual)
+
+    def test_in_bulk_by_screen_name_02(self):
+        """
+        [対象] in_bulk_by_screen_name() : No.02
+        [条件] 同じユーザー名のユーザーが複数存在する。
+        [結果] 最後に更新されたユーザーが返却される。
+        """
+        UserFactory(screen_name='chii')
+        new_user = UserFactory(screen_name='Chii')
+        User.objects.filter(pk=new_user.pk).update(updated_at=timezone.now())
+
+        self.assertEqual({'chii': new_user}, User.objects.in_bulk_by_screen_name(['chii']))
+
+    def test_in_bulk_by_screen_name_03(self):
+        """
+        [対象] in_bulk_by_screen_name() : No.03
+        [条件] batch_sizeを超える数のユーザー名を指定する。
+        [結果] batch_size件ごとにクエリが実行される。
+        """
+        for i in range(3):
+            UserFactory(screen_name='user_%d' % i)
+
+        with self.assertNumQueries(2):
+            actual = User.objects.in_bulk_by_screen_name(['user_0', 'user_1', 'user_2'], batch_size=2)
+        self.assertEqual(['user_0', 'user_1', 'user_2'], sorted(actual))
+
+    def test_in_bulk_by_screen_name_04(self):
+        """
+        [対象] in_bulk_by_screen_name() : No.04
+        [条件] ユーザー名を指定しない。
+        [結果] クエリを実行せずに空の辞書が返却される。
+        """
+        with self.assertNumQueries(0):
+            self.assertEqual({}, User.objects.in_bulk_by_screen_name([]))
+
 class UserTest(TestCase):
     """
     models.Userに対するテストコード。
@@ -270,3 +465,84 @@ class UserTest(TestCase):
         user = User.objects.get(twitter_id=12345)
         actual = user.get_short_name()
         self.assertEqual('screen_name01', actual)
+
+    def test_has_perm_01(self):
+        """
+        [対象] has_perm() : No.01
+        [条件] 管理者、管理画面操作権限を持つユーザー、一般ユーザー、無効な管理者で実行する。
+        [結果] 有効な管理者はすべての権限、管理画面操作権限を持つユーザーはtwingo2の権限のみを持つ。
+        """
+        self.assertTrue(UserFactory(is_superuser=True).has_perm('twingo2.change_user'))
+        self.assertTrue(UserFactory(is_superuser=True).has_perm('auth.change_group'))
+        self.assertTrue(UserFactory(is_staff=True).has_module_perms('twingo2'))
+        self.assertTrue(UserFactory(is_staff=True).has_perm('twingo2.change_user'))
+        self.assertFalse(UserFactory(is_staff=True).has_perm('auth.change_group'))
+        self.assertFalse(UserFactory(is_staff=True).has_module_perms('sessions'))
+        self.assertFalse(UserFactory().has_perm('twingo2.change_user'))
+        self.assertFalse(UserFactory(is_superuser=True, is_active=False).has_module_perms('twingo2'))
+
+    def test_update_profile_01(self):
+        """
+        [対象] update_profile() : No.01
+        [条件] 一部のフィールドを変更する。
+        [結果] 変更されたフィールドのみが更新され、そのフィールド名が返却される。
+        """
+        user = UserFactory(twitter_id=1402804142)
+
+        actual = user.update_profile(screen_name='7pairs', name=user.name, location='西武プリンスドーム')
+
+        user = User.objects.get(twitter_id=1402804142)
+        self.assertEqual(['screen_name', 'location'], actual)
+        self.assertEqual('7pairs', user.screen_name)
+        self.assertEqual('西武プリンスドーム', user.location)
+
+    def test_update_profile_02(self):
+        """
+        [対象] update_profile() : No.02
+        [条件] 変更のない値を指定する。
+        [結果] プロフィール確認日時のみが更新され、空のリストが返却される。
+        """
+        user = UserFactory(twitter_id=1402804142)
+
+        with self.assertNumQueries(1):
+            actual = user.update_profile(screen_name=user.screen_name, name=user.name)
+
+        self.assertEqual([], actual)
+        stored = User.objects.get(twitter_id=1402804142)
+        self.assertEqual(user.profile_checked_at, stored.profile_checked_at)
+        self.assertEqual(user.updated_at, stored.updated_at)
+
+
+@override_settings(TOKEN_ENCRYPTION_KEYS=['8ImC3AIUj2eme1NQtyfS_bJ8wE-GR5_cO-vjH36zRqg='])
+class AccessTokenManagerTest(TestCase):
+    """
+    models.AccessTokenManagerに対するテストコード。
+    """
+
+    def test_save_token_01(self):
+        """
+        [対象] save_token() : No.01
+        [条件] アクセストークンが保存されていないユーザーを指定する。
+        [結果] 暗号化されたアクセストークンが保存される。
+        """
+        user = UserFactory(twitter_id=1402804142)
+
+        AccessToken.objects.save_token(user, ('key', 'secret'))
+
+        access_token = AccessToken.objects.get(user=user)
+        self.assertNotIn('secret', access_token.encrypted_token)
+        self.assertEqual(('key', 'secret'), access_token.get_access_token())
+
+    def test_save_token_02(self):
+        """
+        [対象] save_token() : No.02
+        [条件] アクセストークンが保存済みのユーザーを指定する。
+        [結果] 1回のクエリでアクセストークンが更新される。
+        """
+        user = UserFactory(twitter_id=1402804142)
+        AccessToken.objects.save_token(user, ('key', 'secret'))
+
+        with self.assertNumQueries(1):
+            AccessToken.objects.save_token(user, ('new_key', 'new_secret'))
+
+        self.assertEqual(('new_key', 'new_secret'), AccessToken.objects.get(user=user).get_access_token())
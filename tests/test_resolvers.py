@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import datetime
+
+import factory
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from twingo2.models import User
+from twingo2.resolvers import Mention, resolve_mentions, resolve_screen_name, resolve_screen_names
+
+
+class UserFactory(factory.DjangoModelFactory):
+    """
+    Userのテストデータを作成するファクトリー。
+    """
+
+    class Meta:
+        model = User
+
+    twitter_id = factory.Sequence(lambda x: x)
+    screen_name = factory.Sequence(lambda x: 'screen_name_%02d' % x)
+    name = factory.Sequence(lambda x: 'name_%02d' % x)
+    is_active = True
+    last_login = datetime.datetime.now()
+
+
+class ResolversTest(TestCase):
+    """
+    resolvers.pyに対するテストコード。
+    """
+
+    def setUp(self):
+        """
+        初期処理を実行する。
+        """
+        # キャッシュを初期化する
+        cache.clear()
+
+    def test_resolve_screen_name_01(self):
+        """
+        [対象] resolve_screen_name() : No.01
+        [条件] 先頭に@を付け、大文字小文字が異なるユーザー名を指定する。
+        [結果] 対応するユーザーが返却される。
+        """
+        user = UserFactory(screen_name='Chii')
+
+        self.assertEqual(user, resolve_screen_name('@CHII'))
+        self.assertIsNone(resolve_screen_name('itsu'))
+
+    def test_resolve_screen_name_02(self):
+        """
+        [対象] resolve_screen_name() : No.02
+        [条件] ユーザー名として無効な文字列を指定する。
+        [結果] クエリを実行せずにNoneが返却される。
+        """
+        with self.assertNumQueries(0):
+            self.assertIsNone(resolve_screen_name('chii%'))
+            self.assertIsNone(resolve_screen_name('a' * 16))
+
+    @override_settings(SCREEN_NAME_CACHE_TIMEOUT=60)
+    def test_resolve_screen_names_01(self):
+        """
+        [対象] resolve_screen_names() : No.01
+        [条件] キャッシュを有効にして同じユーザー名を2回解決する。
+        [結果] 1回目は1回のクエリで取得され、2回目はクエリが実行されない。
+        """
+        user_1 = UserFactory(screen_name='chii')
+        user_2 = UserFactory(screen_name='itsu')
+
+        with self.assertNumQueries(1):
+            actual = resolve_screen_names(['chii', 'ITSU', 'chii'])
+        self.assertEqual({'chii': user_1, 'itsu': user_2}, actual)
+        with self.assertNumQueries(0):
+            self.assertEqual(actual, resolve_screen_names(['Chii', 'itsu']))
+
+    def test_resolve_mentions_01(self):
+        """
+        [対象] resolve_mentions() : No.01
+        [条件] 存在するユーザーと存在しないユーザーへの@ユーザー名を含む複数のテキストを指定する。
+        [結果] 1回のクエリで、テキストごとに存在するユーザーの位置が返却される。
+        """
+        user_1 = UserFactory(screen_name='chii')
+        user_2 = UserFactory(screen_name='Itsu')
+
+        with self.assertNumQueries(1):
+            actual = resolve_mentions(['@chii こんにちは @unknown', 'RT ＠itsu: @CHII', '', None])
+        self.assertEqual([
+            [Mention(0, 5, 'chii', user_1)],
+            [Mention(3, 8, 'itsu', user_2), Mention(10, 15, 'CHII', user_1)],
+            [],
+            [],
+        ], actual)
+
+    def test_resolve_mentions_02(self):
+        """
+        [対象] resolve_mentions() : No.02
+        [条件] メールアドレス、URL、16文字以上の文字列を含むテキストを指定する。
+        [結果] @ユーザー名として扱われず、クエリも実行されない。
+        """
+        UserFactory(screen_name='chii')
+
+        with self.assertNumQueries(0):
+            actual = resolve_mentions(['mail@chii', '@chii://', '@chiichiichiichii1', '@@chii'])
+        self.assertEqual([[], [], [], []], actual)
+
+    @override_settings(SCREEN_NAME_CACHE_TIMEOUT=60)
+    def test_resolve_mentions_03(self):
+        """
+        [対象] resolve_mentions() : No.03
+        [条件] キャッシュを有効にして100件のテキストを2回解決する。
+        [結果] 1回目は1回のクエリで取得され、2回目はクエリが実行されない。
+        """
+        for i in range(10):
+            UserFactory(screen_name='user_%d' % i)
+        texts = ['@user_%d と @user_%d' % (i % 10, (i + 1) % 10) for i in range(100)]
+
+        with self.assertNumQueries(1):
+            actual = resolve_mentions(texts)
+        self.assertEqual(200, sum(len(mentions) for mentions in actual))
+        with self.assertNumQueries(0):
+            self.assertEqual(actual, resolve_mentions(texts))
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from mock import Mock
+
+from django.core.cache import cache
+from django.db.utils import ConnectionDoesNotExist
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from twingo2.backends import TwitterBackend
+from twingo2.cache import primary_pin_cache
+from twingo2.models import User
+from twingo2.routers import ReplicaRouter, get_read_database
+
+
+@override_settings(USER_READ_DATABASES=('replica',))
+class RoutersTest(TestCase):
+    """
+    routers.pyに対するテストコード。
+    """
+
+    def setUp(self):
+        """
+        初期処理を実行する。
+        """
+        # キャッシュを初期化する
+        cache.clear()
+
+    def test_get_read_database_01(self):
+        """
+        [対象] get_read_database() : No.01
+        [条件] USER_READ_DATABASESを設定しない。
+        [結果] プライマリのエイリアスが返却される。
+        """
+        with self.settings(USER_READ_DATABASES=()):
+            self.assertEqual('default', get_read_database(User, 1))
+
+    def test_get_read_database_02(self):
+        """
+        [対象] get_read_database() : No.02
+        [条件] USER_READ_DATABASESを設定し、書き込み直後でないユーザーのIDを指定する。
+        [結果] レプリカのエイリアスが返却される。
+        """
+        self.assertEqual('replica', get_read_database(User, 1))
+
+    def test_get_read_database_03(self):
+        """
+        [対象] get_read_database() : No.03
+        [条件] USER_READ_DATABASESを設定し、書き込み直後のユーザーのIDを指定する。
+        [結果] プライマリのエイリアスが返却される。
+        """
+        primary_pin_cache.pin(1)
+
+        self.assertEqual('default', get_read_database(User, 1))
+        self.assertEqual('replica', get_read_database(User, 2))
+
+    def test_get_read_database_04(self):
+        """
+        [対象] get_read_database() : No.04
+        [条件] USER_READ_STICKY_TIMEOUTに0を設定し、書き込み直後のユーザーのIDを指定する。
+        [結果] レプリカのエイリアスが返却される。
+        """
+        with self.settings(USER_READ_STICKY_TIMEOUT=0):
+            primary_pin_cache.pin(1)
+
+            self.assertEqual('replica', get_read_database(User, 1))
+
+    def test_pin_user_to_primary_01(self):
+        """
+        [対象] pin_user_to_primary() : No.01
+        [条件] ユーザーを作成する。
+        [結果] 作成したユーザーがプライマリに固定される。
+        """
+        user = User.objects.create_user(1, 'screen_name', 'name')
+
+        self.assertTrue(primary_pin_cache.is_pinned(user.pk))
+
+    def test_get_user_01(self):
+        """
+        [対象] TwitterBackend.get_user() : No.01
+        [条件] USER_READ_DATABASESを設定し、作成直後のユーザーを取得する。
+        [結果] レプリカに反映されていなくてもプライマリからユーザーが取得される。
+        """
+        user = User.objects.create_user(1, 'screen_name', 'name')
+
+        self.assertEqual(user, TwitterBackend().get_user(user.pk))
+
+    def test_get_user_02(self):
+        """
+        [対象] TwitterBackend.get_user() : No.02
+        [条件] USER_READ_DATABASESを設定し、プライマリへの固定が解除されたユーザーを取得する。
+        [結果] レプリカから取得される。
+        """
+        user = User.objects.create_user(1, 'screen_name', 'name')
+        cache.clear()
+
+        with self.assertRaisesRegex(ConnectionDoesNotExist, 'replica'):
+            TwitterBackend().get_user(user.pk)
+
+    def test_db_for_read_01(self):
+        """
+        [対象] ReplicaRouter.db_for_read() : No.01
+        [条件] twingo2とそれ以外のモデルを指定する。
+        [結果] twingo2のモデルのみレプリカのエイリアスが返却される。
+        """
+        router = ReplicaRouter()
+
+        self.assertEqual('replica', router.db_for_read(User))
+        self.assertIsNone(router.db_for_read(Mock(_meta=Mock(app_label='auth'))))
+
+    def test_db_for_write_01(self):
+        """
+        [対象] ReplicaRouter.db_for_write() : No.01
+        [条件] レプリカから読み込んだユーザーを指定する。
+        [結果] プライマリのエイリアスが返却される。
+        """
+        user = User(twitter_id=1)
+        user._state.db = 'replica'
+
+        self.assertEqual('default', ReplicaRouter().db_for_write(User, instance=user))
+
+    def test_allow_relation_01(self):
+        """
+        [対象] ReplicaRouter.allow_relation() : No.01
+        [条件] プライマリとレプリカのインスタンス、およびそれ以外のデータベースのインスタンスを指定する。
+        [結果] プライマリとレプリカの間のみTrueが返却される。
+        """
+        primary = User(twitter_id=1)
+        primary._state.db = 'default'
+        replica = User(twitter_id=2)
+        replica._state.db = 'replica'
+        other = User(twitter_id=3)
+        other._state.db = 'other'
+
+        router = ReplicaRouter()
+        self.assertTrue(router.allow_relation(primary, replica))
+        self.assertIsNone(router.allow_relation(primary, other))
+
+    def test_allow_migrate_01(self):
+        """
+        [対象] ReplicaRouter.allow_migrate() : No.01
+        [条件] プライマリとレプリカを指定する。
+        [結果] レプリカへのtwingo2のマイグレーションのみFalseが返却される。
+        """
+        router = ReplicaRouter()
+
+        self.assertIsNone(router.allow_migrate('default', 'twingo2', model_name='user'))
+        self.assertFalse(router.allow_migrate('replica', 'twingo2', model_name='user'))
+        self.assertIsNone(router.allow_migrate('replica', 'auth', model_name='user'))
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import datetime
+
+import factory
+
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from twingo2 import search
+from twingo2.models import User, UserSearchToken
+
+
+class UserFactory(factory.DjangoModelFactory):
+    """
+    Userのテストデータを作成するファクトリー。
+    """
+
+    class Meta:
+        model = User
+
+    twitter_id = factory.Sequence(lambda x: x)
+    screen_name = factory.Sequence(lambda x: 'screen_name_%02d' % x)
+    name = factory.Sequence(lambda x: 'name_%02d' % x)
+    description = ''
+    is_active = True
+    last_login = datetime.datetime.now()
+
+
+class SearchTest(TestCase):
+    """
+    search.pyに対するテストコード。
+    """
+
+    def test_tokenize_01(self):
+        """
+        [対象] tokenize() : No.01
+        [条件] 大文字、記号、アンダースコアを含むテキストを指定する。
+        [結果] 小文字の単語と、アンダースコアで分割した各部分がトークンとなる。
+        """
+        self.assertEqual(
+            {'chii_7pairs', 'chii', '7pairs', 'hello', 'ちぃ', 'ぃと', 'とい', 'いつ'},
+            search.tokenize('Chii_7pairs: Hello, ちぃといつ! _ __')
+        )
+        self.assertEqual(set(), search.tokenize(None))
+
+    def test_tokenize_02(self):
+        """
+        [対象] tokenize() : No.02
+        [条件] 最大長を超える単語を含むテキストを指定する。
+        [結果] 最大長で切り詰められる。
+        """
+        self.assertEqual({'a' * search.TOKEN_MAX_LENGTH}, search.tokenize('a' * 50))
+
+    def test_tokenize_03(self):
+        """
+        [対象] tokenize() : No.03
+        [条件] 英数字とかな、漢字が連続するテキストと、1文字の漢字を指定する。
+        [結果] かな、漢字の連続のみが2文字ずつのn-gramに分割され、1文字の場合はそのままトークンとなる。
+        """
+        self.assertEqual({'django', '大好', '好き', 'py3'}, search.tokenize('Django大好きpy3'))
+        self.assertEqual({'猫'}, search.tokenize('猫'))
+
+
+@override_settings(USER_SEARCH_INDEX_ENABLED=True)
+class UserSearchIndexTest(TestCase):
+    """
+    トークン索引テーブルによる検索に対するテストコード。
+    """
+
+    def test_search_01(self):
+        """
+        [対象] UserManager.search() : No.01
+        [条件] ユーザー名、名前、自己紹介の単語の先頭部分を大文字小文字を変えて指定する。
+        [結果] いずれかのフィールドに前方一致する単語を含むユーザーが返却される。
+        """
+        user_1 = UserFactory(screen_name='chii_7pairs', name='ちぃといつ')
+        user_2 = UserFactory(screen_name='itsu', description='Python and Django')
+        UserFactory(screen_name='other')
+
+        self.assertEqual([user_1], list(User.objects.search('CHII')))
+        self.assertEqual([user_1], list(User.objects.search('7pa')))
+        self.assertEqual([user_1], list(User.objects.search('ちぃと')))
+        self.assertEqual([user_2], list(User.objects.search('djan')))
+        self.assertEqual([], list(User.objects.search('ango')))
+
+    def test_search_04(self):
+        """
+        [対象] UserManager.search() : No.04
+        [条件] 名前の途中に含まれる日本語を指定する。
+        [結果] 日本語の名前の部分一致でユーザーが返却される。
+        """
+        user = UserFactory(name='七対子ちぃといつ')
+        UserFactory(name='ちぃと')
+
+        self.assertEqual([user], list(User.objects.search('といつ')))
+        self.assertEqual([user], list(User.objects.search('対')))
+        self.assertEqual([], list(User.objects.search('七子')))
+
+    def test_search_02(self):
+        """
+        [対象] UserManager.search() : No.02
+        [条件] 複数の語を指定する。
+        [結果] すべての語に前方一致する単語を含むユーザーのみが返却される。
+        """
+        user_1 = UserFactory(screen_name='chii', description='python django')
+        UserFactory(screen_name='itsu', description='python flask')
+
+        self.assertEqual([user_1], list(User.objects.search('pyth dja')))
+
+    def test_search_03(self):
+        """
+        [対象] UserManager.search() : No.03
+        [条件] 単語を含まない検索語を指定する。
+        [結果] クエリを実行せずに空の結果が返却される。
+        """
+        UserFactory()
+
+        with self.assertNumQueries(0):
+            self.assertEqual([], list(User.objects.search(' @! ')))
+
+    def test_update_search_index_01(self):
+        """
+        [対象] update_search_index() : No.01
+        [条件] ユーザー名を変更する。
+        [結果] 変更前のユーザー名では検索されず、変更後のユーザー名で検索される。
+        """
+        user = UserFactory(screen_name='chii')
+        user.update_profile(screen_name='itsu')
+
+        self.assertEqual([], list(User.objects.search('chii')))
+        self.assertEqual([user], list(User.objects.search('itsu')))
+
+    def test_update_search_index_02(self):
+        """
+        [対象] update_search_index() : No.02
+        [条件] 検索対象ではないフィールドのみを更新する。
+        [結果] トークン索引は更新されない。
+        """
+        user = UserFactory(screen_name='chii')
+
+        with self.assertNumQueries(1):
+            user.save(update_fields=['last_login'])
+
+    def test_update_search_index_03(self):
+        """
+        [対象] update_search_index() : No.03
+        [条件] USER_SEARCH_INDEX_ENABLEDを無効にしてユーザーを作成する。
+        [結果] トークン索引は作成されず、部分一致で検索される。
+        """
+        with self.settings(USER_SEARCH_INDEX_ENABLED=False):
+            user = UserFactory(screen_name='chii_7pairs')
+
+            self.assertFalse(UserSearchToken.objects.exists())
+            self.assertEqual([user], list(User.objects.search('7pa')))
+            self.assertEqual([user], list(User.objects.search('airs')))
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from django.contrib.auth import SESSION_KEY, get_user, login
+from django.contrib.sessions.backends.cache import SessionStore
+from django.test import RequestFactory, TestCase
+from django.test.utils import override_settings
+
+from twingo2.backends import TwitterBackend
+from twingo2.models import User
+from twingo2.sharding import ShardRouter, get_previous_shard, get_shard, get_user_id, split_user_id
+
+
+@override_settings(USER_SHARD_DATABASES=('shard0', 'shard1'))
+class ShardingTest(TestCase):
+    """
+    sharding.pyに対するテストコード。
+    Twitter ID 1はshard1、Twitter ID 2はshard0に振り分けられる。
+    """
+
+    multi_db = True
+
+    def test_get_shard_01(self):
+        """
+        [対象] get_shard() : No.01
+        [条件] Twitter IDを指定する。
+        [結果] SHA-1によるハッシュ値で決まるシャードが返却される。
+        """
+        self.assertEqual('shard1', get_shard(1))
+        self.assertEqual('shard0', get_shard(2))
+
+    def test_get_previous_shard_01(self):
+        """
+        [対象] get_previous_shard() : No.01
+        [条件] 移行前のシャードを設定する。
+        [結果] 移行の前後でシャードが変わる場合のみ移行前のシャードが返却される。
+        """
+        with self.settings(USER_SHARD_PREVIOUS_DATABASES=('default',)):
+            self.assertEqual('default', get_previous_shard(1))
+        with self.settings(USER_SHARD_PREVIOUS_DATABASES=('shard0', 'shard1')):
+            self.assertIsNone(get_previous_shard(1))
+        self.assertIsNone(get_previous_shard(1))
+
+    def test_get_user_id_01(self):
+        """
+        [対象] get_user_id() / split_user_id() : No.01
+        [条件] シャードに格納されたユーザーのIDを取得し、分解する。
+        [結果] 主キーの後ろにシャードの番号が付加され、元のシャードと主キーに分解できる。
+        """
+        user = User.objects.create_user(1, 'screen_name', 'name')
+
+        user_id = get_user_id(user)
+
+        self.assertEqual(user.pk * 1000 + 1, user_id)
+        self.assertEqual(('shard1', user.pk), split_user_id(user_id))
+
+    def test_get_user_id_02(self):
+        """
+        [対象] get_user_id() / split_user_id() : No.02
+        [条件] シャーディングを無効にする。
+        [結果] 主キーがそのまま使用される。
+        """
+        with self.settings(USER_SHARD_DATABASES=()):
+            user = User.objects.create_user(1, 'screen_name', 'name')
+
+            self.assertEqual(user.pk, get_user_id(user))
+            self.assertEqual((None, user.pk), split_user_id(user.pk))
+
+    def test_split_user_id_01(self):
+        """
+        [対象] split_user_id() : No.01
+        [条件] 存在しないシャードを指すユーザーIDを指定する。
+        [結果] ValueErrorが送出される。
+        """
+        with self.assertRaises(ValueError):
+            split_user_id(1002)
+
+    def test_create_user_01(self):
+        """
+        [対象] UserManager.create_user() : No.01
+        [条件] ユーザーを作成する。
+        [結果] Twitter IDに対応するシャードにのみ保存される。
+        """
+        user = User.objects.create_user(1, 'screen_name', 'name')
+
+        self.assertEqual('shard1', user._state.db)
+        self.assertTrue(User.objects.using('shard1').filter(twitter_id=1).exists())
+        self.assertFalse(User.objects.using('shard0').filter(twitter_id=1).exists())
+        self.assertFalse(User.objects.using('default').filter(twitter_id=1).exists())
+
+    def test_create_or_get_user_01(self):
+        """
+        [対象] UserManager.create_or_get_user() : No.01
+        [条件] 同じTwitter IDのユーザーを2回作成する。
+        [結果] 対応するシャードに1件のみ作成され、2回目は作成済みのユーザーが返却される。
+        """
+        user1, created1 = User.objects.create_or_get_user(2, 'screen_name', 'name')
+        user2, created2 = User.objects.create_or_get_user(2, 'screen_name', 'name')
+
+        self.assertTrue(created1)
+        self.assertFalse(created2)
+        self.assertEqual(user1.pk, user2.pk)
+        self.assertEqual('shard0', user2._state.db)
+        self.assertEqual(1, User.objects.using('shard0').count())
+
+    def test_in_bulk_by_screen_name_01(self):
+        """
+        [対象] UserManager.in_bulk_by_screen_name() : No.01
+        [条件] 異なるシャードに格納されたユーザーのユーザー名を指定する。
+        [結果] すべてのシャードから取得される。
+        """
+        User.objects.create_user(1, 'Alice', 'name')
+        User.objects.create_user(2, 'Bob', 'name')
+
+        actual = User.objects.in_bulk_by_screen_name(['alice', 'BOB'])
+
+        self.assertEqual({'alice': 'shard1', 'bob': 'shard0'}, {k: v._state.db for k, v in actual.items()})
+        self.assertEqual('shard0', User.objects.get_by_screen_name('bob')._state.db)
+
+    def test_authenticate_01(self):
+        """
+        [対象] TwitterBackend.authenticate() : No.01
+        [条件] シャードに格納された既存ユーザーがTwitter IDとともにログインする。
+        [結果] 対応するシャードからユーザーが取得される。
+        """
+        user = User.objects.create_user(2, 'screen_name', 'name')
+
+        actual = TwitterBackend().authenticate(('2-access', 'secret'), twitter_id=2)
+
+        self.assertEqual(user.pk, actual.pk)
+        self.assertEqual('shard0', actual._state.db)
+
+    @override_settings(USER_SHARD_PREVIOUS_DATABASES=('default',))
+    def test_authenticate_02(self):
+        """
+        [対象] TwitterBackend.authenticate() : No.02
+        [条件] 移行中に、移行前のデータベースに残っている管理画面操作権限を持つユーザーがログインする。
+        [結果] ユーザーが権限を維持して対応するシャードに移動する。
+        """
+        user = User.objects.db_manager('default').create_user(2, 'screen_name', 'name')
+        User.objects.using('default').filter(pk=user.pk).update(is_staff=True)
+
+        actual = TwitterBackend().authenticate(('2-access', 'secret'), twitter_id=2)
+
+        self.assertEqual('shard0', actual._state.db)
+        self.assertTrue(actual.is_staff)
+        self.assertFalse(User.objects.using('default').exists())
+
+    @override_settings(USER_SHARD_PREVIOUS_DATABASES=('default',))
+    def test_authenticate_03(self):
+        """
+        [対象] TwitterBackend.authenticate() : No.03
+        [条件] 移行中に、移行前のデータベースに残っている無効化されたユーザーがログインする。
+        [結果] Noneが返却され、有効なユーザーは作成されない。
+        """
+        user = User.objects.db_manager('default').create_user(2, 'screen_name', 'name')
+        User.objects.using('default').filter(pk=user.pk).update(is_active=False)
+
+        actual = TwitterBackend().authenticate(('2-access', 'secret'), twitter_id=2)
+
+        self.assertIsNone(actual)
+        self.assertFalse(User.objects.using('shard0').get(twitter_id=2).is_active)
+
+    def test_get_user_01(self):
+        """
+        [対象] TwitterBackend.get_user() : No.01
+        [条件] シャードを含むユーザーIDと、シャードを含まない主キーを指定する。
+        [結果] シャードを含むユーザーIDの場合のみユーザーが取得される。
+        """
+        user = User.objects.create_user(1, 'screen_name', 'name')
+
+        self.assertEqual(user.pk, TwitterBackend().get_user(get_user_id(user)).pk)
+        self.assertIsNone(TwitterBackend().get_user(user.pk))
+
+    def test_store_sharded_user_id_01(self):
+        """
+        [対象] store_sharded_user_id() : No.01
+        [条件] シャードに格納されたユーザーでログインする。
+        [結果] セッションにシャードを含むユーザーIDが格納され、次のリクエストで同じユーザーが復元される。
+        """
+        user = User.objects.create_user(1, 'screen_name', 'name')
+        user.backend = 'twingo2.backends.TwitterBackend'
+        request = RequestFactory().get('/')
+        request.session = SessionStore()
+
+        login(request, user)
+
+        self.assertEqual(str(get_user_id(user)), request.session[SESSION_KEY])
+        self.assertEqual(user.pk, get_user(request).pk)
+
+    def test_db_for_write_01(self):
+        """
+        [対象] ShardRouter.db_for_write() : No.01
+        [条件] 未保存のユーザーと保存済みのユーザーを指定する。
+        [結果] 未保存のユーザーのみTwitter IDに対応するシャードが返却される。
+        """
+        router = ShardRouter()
+
+        self.assertEqual('shard1', router.db_for_write(User, instance=User(twitter_id=1)))
+        self.assertIsNone(router.db_for_write(User, instance=User.objects.create_user(2, 'screen_name', 'name')))
+
+    def test_allow_relation_01(self):
+        """
+        [対象] ShardRouter.allow_relation() : No.01
+        [条件] 同じシャードと異なるシャードのユーザーを指定する。
+        [結果] 同じシャードの場合のみTrueが返却される。
+        """
+        user1 = User.objects.create_user(1, 'screen_name1', 'name')
+        user2 = User.objects.create_user(2, 'screen_name2', 'name')
+        router = ShardRouter()
+
+        self.assertTrue(router.allow_relation(user1, user1))
+        self.assertFalse(router.allow_relation(user1, user2))
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from mock import patch
+
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from twingo2 import tokens
+from twingo2.models import User
+
+
+@override_settings(SIGNED_TOKEN_MAX_AGE=3600)
+class TokensTest(TestCase):
+    """
+    tokens.pyに対するテストコード。
+    """
+
+    def setUp(self):
+        """
+        初期処理を実行する。
+        """
+        # テスト用のユーザーを作成する
+        self.user = User.objects.create_superuser(twitter_id=1402804142, screen_name='7pairs', name='ちぃといつ')
+
+    def test_load_token_01(self):
+        """
+        [対象] load_token() : No.01
+        [条件] 発行したトークンを指定する。
+        [結果] トークンに格納したユーザー情報が返却される。
+        """
+        token = tokens.issue_token(self.user)
+
+        with self.assertNumQueries(0):
+            actual = tokens.TokenUser(tokens.load_token(token))
+
+        self.assertEqual(self.user.pk, actual.id)
+        self.assertEqual('7pairs', actual.screen_name)
+        self.assertTrue(actual.is_staff)
+        self.assertTrue(actual.is_authenticated())
+
+    def test_load_token_02(self):
+        """
+        [対象] load_token() : No.02
+        [条件] 改ざんされたトークンを指定する。
+        [結果] Noneが返却される。
+        """
+        token = tokens.issue_token(self.user)
+
+        self.assertIsNone(tokens.load_token(token[:-1] + ('A' if token[-1] != 'A' else 'B')))
+
+    @patch('django.core.signing.time')
+    def test_load_token_03(self, time):
+        """
+        [対象] load_token() : No.03
+        [条件] 有効期限を過ぎたトークンを指定する。
+        [結果] Noneが返却される。
+        """
+        time.time.return_value = 1000000000
+        token = tokens.issue_token(self.user)
+        time.time.return_value = 1000003601
+
+        self.assertIsNone(tokens.load_token(token))
+
+    @override_settings(SIGNED_TOKEN_REFRESH_INTERVAL=300)
+    @patch('twingo2.tokens.time')
+    def test_needs_refresh_01(self, time):
+        """
+        [対象] needs_refresh() : No.01
+        [条件] 発行から再検証の間隔が経過していないユーザー情報を指定する。
+        [結果] Falseが返却される。
+        """
+        time.time.return_value = 1000000000
+        payload = tokens.make_payload(self.user)
+        time.time.return_value = 1000000299
+
+        self.assertFalse(tokens.needs_refresh(payload))
+
+    @override_settings(SIGNED_TOKEN_REFRESH_INTERVAL=300)
+    @patch('twingo2.tokens.time')
+    def test_needs_refresh_02(self, time):
+        """
+        [対象] needs_refresh() : No.02
+        [条件] 発行から再検証の間隔が経過したユーザー情報を指定する。
+        [結果] Trueが返却される。
+        """
+        time.time.return_value = 1000000000
+        payload = tokens.make_payload(self.user)
+        time.time.return_value = 1000000300
+
+        self.assertTrue(tokens.needs_refresh(payload))
+
+    def test_token_user_01(self):
+        """
+        [対象] TokenUser : No.01
+        [条件] 管理画面操作権限を持つユーザーのトークンから復元する。
+        [結果] User.has_perm()と同様に、twingo2の権限のみを持つ。
+        """
+        actual = tokens.TokenUser(tokens.load_token(tokens.issue_token(self.user)))
+
+        self.assertEqual('7pairs', actual.get_username())
+        self.assertTrue(actual.has_module_perms('twingo2'))
+        self.assertTrue(actual.has_perms(['twingo2.change_user', 'twingo2.delete_user']))
+        self.assertFalse(actual.has_perm('auth.change_group'))
+        self.assertFalse(actual.has_module_perms('auth'))
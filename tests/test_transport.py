@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from mock import patch
+
+import requests
+import tweepy.auth
+import tweepy.binder
+from requests_oauthlib import OAuth1Session
+
+from django.apps import apps
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from twingo2 import transport as transport_module
+from twingo2.transport import DEFAULT_TIMEOUT, TimeoutHTTPAdapter, Transport, get_timeout, get_transport, install
+
+
+class TransportTest(TestCase):
+    """
+    transport.Transportに対するテストコード。
+    """
+
+    def test_session_01(self):
+        """
+        [対象] session() : No.01
+        [条件] セッションを2回生成する。
+        [結果] 別々のセッションに同一のアダプターが設定される。
+        """
+        transport = Transport(4, 10, False)
+
+        session_1 = transport.session()
+        session_2 = transport.session()
+
+        self.assertIsNot(session_1, session_2)
+        self.assertIs(transport.adapter, session_1.get_adapter('https://api.twitter.com/'))
+        self.assertIs(transport.adapter, session_2.get_adapter('https://api.twitter.com/'))
+
+    def test_session_02(self):
+        """
+        [対象] session() : No.02
+        [条件] 生成したセッションを閉じる。
+        [結果] コネクションプールは維持される。
+        """
+        transport = Transport(4, 10, False)
+        session = transport.session()
+        transport.adapter.poolmanager.connection_from_host('api.twitter.com', 443, 'https')
+
+        session.close()
+
+        self.assertEqual(1, len(transport.adapter.poolmanager.pools))
+
+    def test_session_03(self):
+        """
+        [対象] session() : No.03
+        [条件] コネクションプールを共有しない設定でセッションを2回生成する。
+        [結果] 別々のセッションにそれぞれタイムアウトを適用するアダプターが設定される。
+        """
+        transport = Transport(4, 10, False, False)
+
+        adapter_1 = transport.session().get_adapter('https://api.twitter.com/')
+        adapter_2 = transport.session().get_adapter('https://api.twitter.com/')
+
+        self.assertIsInstance(adapter_1, TimeoutHTTPAdapter)
+        self.assertIsNot(adapter_1, adapter_2)
+        self.assertIsNot(transport.adapter, adapter_1)
+
+    def test_send_01(self):
+        """
+        [対象] send() : No.01
+        [条件] タイムアウトを指定せずにリクエストを送信する。
+        [結果] TWITTER_TIMEOUTのデフォルト値が適用される。
+        """
+        transport = Transport(4, 10, False, False)
+        session = transport.session()
+
+        with patch('requests.adapters.HTTPAdapter.send') as send:
+            session.get('https://api.twitter.com/', allow_redirects=False)
+
+        self.assertEqual(DEFAULT_TIMEOUT, send.call_args[1]['timeout'])
+
+    def test_get_stats_01(self):
+        """
+        [対象] get_stats() : No.01
+        [条件] コネクションプールが生成されている。
+        [結果] ホストごとの統計情報が返却される。
+        """
+        transport = Transport(4, 10, False)
+        transport.adapter.poolmanager.connection_from_host('api.twitter.com', 443, 'https')
+
+        actual = transport.get_stats()
+
+        self.assertEqual([{
+            'scheme': 'https',
+            'host': 'api.twitter.com',
+            'port': 443,
+            'connections': 0,
+            'requests': 0,
+            'idle': 0,
+        }], actual)
+
+
+class InstallTest(TestCase):
+    """
+    transport.install()に対するテストコード。
+    """
+
+    @override_settings(TWITTER_POOL_MAXSIZE=10)
+    @patch.object(transport_module, '_transport', None)
+    @patch.object(tweepy.binder, 'requests', tweepy.binder.requests)
+    def test_install_01(self):
+        """
+        [対象] install() : No.01
+        [条件] 共有のコネクションプールを設定する。
+        [結果] tweepyがAPIの呼び出しで生成するセッションに共有のアダプターが設定され、OAuthの処理は置き換えられない。
+        """
+        install()
+
+        adapter = get_transport().adapter
+        self.assertIs(adapter, tweepy.binder.requests.Session().get_adapter('https://api.twitter.com/'))
+        self.assertEqual(requests.codes, tweepy.binder.requests.codes)
+        self.assertIs(requests, tweepy.auth.requests)
+        self.assertIs(OAuth1Session, tweepy.auth.OAuth1Session)
+
+    @patch.object(transport_module, '_transport', None)
+    @patch.object(tweepy.binder, 'requests', tweepy.binder.requests)
+    def test_install_02(self):
+        """
+        [対象] install() : No.02
+        [条件] 共有のコネクションプールを設定しない。
+        [結果] tweepyが生成するセッションにタイムアウトを適用するアダプターが設定される。
+        """
+        install()
+
+        self.assertIsInstance(tweepy.binder.requests.Session().get_adapter('https://api.twitter.com/'), TimeoutHTTPAdapter)
+        self.assertIsNot(get_transport().adapter, tweepy.binder.requests.Session().get_adapter('https://api.twitter.com/'))
+
+    @patch.object(transport_module, 'install')
+    def test_ready_01(self, install):
+        """
+        [対象] Twingo2Config.ready() : No.01
+        [条件] TWITTER_POOL_MAXSIZEを設定しない。
+        [結果] tweepyは置き換えられない。
+        """
+        apps.get_app_config('twingo2').ready()
+
+        self.assertFalse(install.called)
+
+    @override_settings(TWITTER_POOL_MAXSIZE=10)
+    @patch.object(transport_module, 'install')
+    def test_ready_02(self, install):
+        """
+        [対象] Twingo2Config.ready() : No.02
+        [条件] TWITTER_POOL_MAXSIZEを設定する。
+        [結果] tweepyが置き換えられる。
+        """
+        apps.get_app_config('twingo2').ready()
+
+        self.assertTrue(install.called)
+
+
+class GetTimeoutTest(TestCase):
+    """
+    transport.get_timeout()に対するテストコード。
+    """
+
+    def test_get_timeout_01(self):
+        """
+        [対象] get_timeout() : No.01
+        [条件] TWITTER_TIMEOUTを設定しない。
+        [結果] デフォルトのタイムアウトが返却される。
+        """
+        self.assertEqual(DEFAULT_TIMEOUT, get_timeout())
+
+    @override_settings(TWITTER_TIMEOUT=3)
+    def test_get_timeout_02(self):
+        """
+        [対象] get_timeout() : No.02
+        [条件] TWITTER_TIMEOUTを設定する。
+        [結果] 設定したタイムアウトが返却される。
+        """
+        self.assertEqual(3, get_timeout())
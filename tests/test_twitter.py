@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from mock import patch
+
+import requests
+from tweepy.error import TweepError
+
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from twingo2 import transport
+from twingo2.cache import api_client_cache
+from twingo2.models import AccessToken, User
+from twingo2.transport import DEFAULT_TIMEOUT, TimeoutHTTPAdapter
+from twingo2.twitter import AppAuthHandler, OAuthHandler, RateLimiter, chunked, get_api
+
+
+@override_settings(TOKEN_ENCRYPTION_KEYS=['8ImC3AIUj2eme1NQtyfS_bJ8wE-GR5_cO-vjH36zRqg='])
+class GetApiTest(TestCase):
+    """
+    twitter.get_api()に対するテストコード。
+    """
+
+    def setUp(self):
+        """
+        初期処理を実行する。
+        """
+        # キャッシュを初期化する
+        api_client_cache.clear()
+
+    def test_get_api_01(self):
+        """
+        [対象] get_api() : No.01
+        [条件] アクセストークンが保存されたユーザーについて2回取得する。
+        [結果] 保存されたアクセストークンによるAPIオブジェクトが返却され、2回目はデータベースにアクセスしない。
+        """
+        user = User.objects.create_user(twitter_id=1402804142, screen_name='7pairs', name='ちぃといつ')
+        AccessToken.objects.save_token(user, ('key', 'secret'))
+
+        actual = get_api(user)
+        with self.assertNumQueries(0):
+            self.assertIs(actual, get_api(user))
+
+        self.assertEqual('key', actual.auth.access_token)
+        self.assertEqual('secret', actual.auth.access_token_secret)
+
+    def test_get_api_02(self):
+        """
+        [対象] get_api() : No.02
+        [条件] アクセストークンが保存されていないユーザーを指定する。
+        [結果] Noneが返却される。
+        """
+        user = User.objects.create_user(twitter_id=1402804142, screen_name='7pairs', name='ちぃといつ')
+
+        self.assertIsNone(get_api(user))
+
+    def test_get_api_03(self):
+        """
+        [対象] get_api() : No.03
+        [条件] アクセストークンを削除したユーザーを指定する。
+        [結果] Noneが返却される。
+        """
+        user = User.objects.create_user(twitter_id=1402804142, screen_name='7pairs', name='ちぃといつ')
+        AccessToken.objects.save_token(user, ('key', 'secret'))
+        get_api(user)
+        AccessToken.objects.get(user=user).delete()
+
+        self.assertIsNone(get_api(user))
+
+
+class AppAuthHandlerTest(TestCase):
+    """
+    twitter.AppAuthHandlerに対するテストコード。
+    """
+
+    @patch.object(transport, '_transport', None)
+    def test_init_01(self):
+        """
+        [対象] __init__() : No.01
+        [条件] ベアラートークンを取得する。
+        [結果] TWITTER_TIMEOUTのデフォルト値を適用して取得される。
+        """
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b'{"token_type": "bearer", "access_token": "bearer_token"}'
+
+        with patch('requests.adapters.HTTPAdapter.send', return_value=response) as send:
+            auth_handler = AppAuthHandler('consumer_key', 'consumer_secret')
+
+        self.assertEqual(DEFAULT_TIMEOUT, send.call_args[1]['timeout'])
+        self.assertEqual('bearer_token', auth_handler._bearer_token)
+
+
+class OAuthHandlerTest(TestCase):
+    """
+    twitter.OAuthHandlerに対するテストコード。
+    """
+
+    @patch.object(transport, '_transport', None)
+    def test_init_01(self):
+        """
+        [対象] __init__() : No.01
+        [条件] tweepyのrequestsモジュールを置き換えずに構築する。
+        [結果] リクエストトークンの取得に使用するセッションにタイムアウトを適用するアダプターが設定される。
+        """
+        oauth_handler = OAuthHandler('consumer_key', 'consumer_secret')
+
+        self.assertIsInstance(oauth_handler.oauth.get_adapter('https://api.twitter.com/'), TimeoutHTTPAdapter)
+
+    @patch('twingo2.twitter.auth.OAuth1Session')
+    def test_get_access_token_01(self, oauth1_session):
+        """
+        [対象] get_access_token() : No.01
+        [条件] アクセストークンの応答にユーザー情報が含まれる。
+        [結果] アクセストークンが返却され、Twitter IDとスクリーンネームが保持される。
+        """
+        oauth1_session.return_value.fetch_access_token.return_value = {
+            'oauth_token': '1402804142-key', 'oauth_token_secret': 'secret',
+            'user_id': '1402804142', 'screen_name': '7pairs',
+        }
+
+        oauth_handler = OAuthHandler('consumer_key', 'consumer_secret')
+        oauth_handler.request_token = {'oauth_token': 'token', 'oauth_token_secret': 'token_secret'}
+        actual = oauth_handler.get_access_token('verifier')
+
+        self.assertEqual(('1402804142-key', 'secret'), actual)
+        self.assertEqual(1402804142, oauth_handler.user_id)
+        self.assertEqual('7pairs', oauth_handler.screen_name)
+
+    @patch('twingo2.twitter.auth.OAuth1Session')
+    def test_get_access_token_02(self, oauth1_session):
+        """
+        [対象] get_access_token() : No.02
+        [条件] アクセストークンの応答にユーザー情報が含まれない。
+        [結果] アクセストークンが返却され、Twitter IDはNoneとなる。
+        """
+        oauth1_session.return_value.fetch_access_token.return_value = {
+            'oauth_token': 'key', 'oauth_token_secret': 'secret',
+        }
+
+        oauth_handler = OAuthHandler('consumer_key', 'consumer_secret')
+        oauth_handler.request_token = {'oauth_token': 'token', 'oauth_token_secret': 'token_secret'}
+        actual = oauth_handler.get_access_token('verifier')
+
+        self.assertEqual(('key', 'secret'), actual)
+        self.assertIsNone(oauth_handler.user_id)
+
+    @patch('twingo2.twitter.auth.OAuth1Session')
+    def test_get_access_token_03(self, oauth1_session):
+        """
+        [対象] get_access_token() : No.03
+        [条件] アクセストークンの取得に失敗する。
+        [結果] TweepErrorが送出される。
+        """
+        oauth1_session.return_value.fetch_access_token.side_effect = ValueError('error')
+
+        oauth_handler = OAuthHandler('consumer_key', 'consumer_secret')
+        oauth_handler.request_token = {'oauth_token': 'token', 'oauth_token_secret': 'token_secret'}
+        with self.assertRaises(TweepError):
+            oauth_handler.get_access_token('verifier')
+
+
+class RateLimiterTest(TestCase):
+    """
+    twitter.RateLimiterに対するテストコード。
+    """
+
+    @patch('twingo2.twitter.time')
+    def test_wait_01(self, time):
+        """
+        [対象] wait() : No.01
+        [条件] 初回のリクエストを送信する。
+        [結果] 待機しない。
+        """
+        time.monotonic.return_value = 100.0
+
+        RateLimiter(2).wait()
+
+        self.assertFalse(time.sleep.called)
+
+    @patch('twingo2.twitter.time')
+    def test_wait_02(self, time):
+        """
+        [対象] wait() : No.02
+        [条件] 間隔を空けずに2回目のリクエストを送信する。
+        [結果] 上限に応じた時間だけ待機する。
+        """
+        time.monotonic.return_value = 100.0
+
+        rate_limiter = RateLimiter(2)
+        rate_limiter.wait()
+        time.monotonic.return_value = 100.1
+        rate_limiter.wait()
+
+        self.assertEqual(1, time.sleep.call_count)
+        self.assertAlmostEqual(0.4, time.sleep.call_args[0][0])
+
+    @patch('twingo2.twitter.time')
+    def test_wait_03(self, time):
+        """
+        [対象] wait() : No.03
+        [条件] 十分な間隔を空けて2回目のリクエストを送信する。
+        [結果] 待機しない。
+        """
+        time.monotonic.return_value = 100.0
+
+        rate_limiter = RateLimiter(2)
+        rate_limiter.wait()
+        time.monotonic.return_value = 101.0
+        rate_limiter.wait()
+
+        self.assertFalse(time.sleep.called)
+
+
+class ChunkedTest(TestCase):
+    """
+    twitter.chunked()に対するテストコード。
+    """
+
+    def test_chunked_01(self):
+        """
+        [対象] chunked() : No.01
+        [条件] 件数で割り切れないイテラブルを指定する。
+        [結果] 指定された件数ごとに分割され、最後のリストに残りが格納される。
+        """
+        actual = list(chunked(range(5), 2))
+
+        self.assertEqual([[0, 1], [2, 3], [4]], actual)
@@ -16,15 +16,26 @@
 # limitations under the License.
 #
 
-from mock import patch
+import io
+from mock import Mock, patch
+
+import requests
+from tweepy.error import TweepError
 
 from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.core.files import File
 from django.core.urlresolvers import reverse
 from django.test import TestCase
 from django.test.client import Client
 from django.test.utils import override_settings
 from django.utils.importlib import import_module
 
+from twingo2 import metrics, tokens
+from twingo2.circuit import twitter_breaker
+from twingo2.models import User
+
 
 class ViewsTest(TestCase):
     """
@@ -35,6 +46,9 @@ class ViewsTest(TestCase):
         """
         初期処理を実行する。
         """
+        # サーキットブレーカーを初期化する
+        twitter_breaker.record_success()
+
         # クライアントを生成する
         self.client = Client()
 
@@ -53,6 +67,13 @@ class ViewsTest(TestCase):
         }
         self.client.cookies[session_cookie].update(cookie_data)
 
+    def tearDown(self):
+        """
+        終了処理を実行する。
+        """
+        # サーキットブレーカーを初期化する
+        twitter_breaker.record_success()
+
     @patch('twingo2.views.OAuthHandler')
     def test_twitter_login_01(self, oauth_handler):
         """
@@ -85,6 +106,25 @@ class ViewsTest(TestCase):
         self.assertEqual('Request Token', session['request_token'])
         self.assertEqual('/next_page/', session['next'])
 
+    @override_settings(PENDING_LOGIN_STORE='twingo2.stores.CacheStore')
+    @patch('twingo2.views.OAuthHandler')
+    def test_twitter_login_03(self, oauth_handler):
+        """
+        [対象] twitter_login() : No.03
+        [条件] キャッシュを使用するストアを指定してアクセスする。
+        [結果] セッションを使用せずにリクエストトークンと次ページのURLがキャッシュに保管される。
+        """
+        oauth_handler.return_value.get_authorization_url.return_value = '/redirect/'
+        oauth_handler.return_value.request_token = {'oauth_token': 'token'}
+
+        response = self.client.get(reverse('twingo2_login'), {'next': '/next_page/'})
+        self.assertRedirects(response, '/redirect/')
+        self.assertIsNone(self.client.session.get('request_token'))
+        self.assertEqual(
+            {'request_token': {'oauth_token': 'token'}, 'next': '/next_page/', 'nonce': response.cookies['twingo2_login'].value},
+            cache.get('twingo2:pending_login:token')
+        )
+
     @patch('twingo2.views.login')
     @patch('twingo2.views.authenticate')
     @patch('twingo2.views.OAuthHandler')
@@ -180,6 +220,316 @@ class ViewsTest(TestCase):
         response = self.client.get(reverse('twingo2_callback'), {'oauth_token': 'token', 'oauth_verifier': 'verifier'})
         self.assertEqual(401, response.status_code)
 
+    @override_settings(SIGNED_TOKEN_MAX_AGE=3600)
+    @patch('twingo2.views.login')
+    @patch('twingo2.views.authenticate')
+    @patch('twingo2.views.OAuthHandler')
+    def test_twitter_callback_07(self, oauth_handler, authenticate, login):
+        """
+        [対象] twitter_callback() : No.07
+        [条件] 署名付きトークンによる認証を有効にする。
+        [結果] ログインしたユーザーの情報を格納したトークンがクッキーに設定される。
+        """
+        user = User.objects.create_user(twitter_id=1402804142, screen_name='7pairs', name='ちぃといつ')
+        authenticate.return_value = user
+
+        session = self.client.session
+        session['request_token'] = {'oauth_token': 'token'}
+        session.save()
+
+        response = self.client.get(reverse('twingo2_callback'), {'oauth_token': 'token', 'oauth_verifier': 'verifier'})
+        self.assertRedirects(response, '/')
+        payload = tokens.load_token(response.cookies['twingo2_token'].value)
+        self.assertEqual(user.pk, payload['i'])
+        self.assertEqual('7pairs', payload['s'])
+
+    @override_settings(PENDING_LOGIN_STORE='twingo2.stores.CacheStore')
+    @patch('twingo2.views.login')
+    @patch('twingo2.views.authenticate')
+    @patch('twingo2.views.OAuthHandler')
+    def test_twitter_callback_08(self, oauth_handler, authenticate, login):
+        """
+        [対象] twitter_callback() : No.08
+        [条件] キャッシュを使用するストアでログインを完了する。
+        [結果] 保管しておいた画面にリダイレクトされ、キャッシュから削除される。
+        """
+        oauth_handler.return_value.get_authorization_url.return_value = '/redirect/'
+        oauth_handler.return_value.request_token = {'oauth_token': 'token'}
+        authenticate.return_value = 'user'
+        self.client.get(reverse('twingo2_login'), {'next': '/next/'})
+
+        response = self.client.get(reverse('twingo2_callback'), {'oauth_token': 'token', 'oauth_verifier': 'verifier'})
+        self.assertRedirects(response, '/next/')
+        self.assertIsNone(cache.get('twingo2:pending_login:token'))
+        self.assertEqual('', response.cookies['twingo2_login'].value)
+
+    @override_settings(PENDING_LOGIN_STORE='twingo2.stores.CacheStore')
+    def test_twitter_callback_09(self):
+        """
+        [対象] twitter_callback() : No.09
+        [条件] キャッシュを使用するストアで、保管されていないリクエストトークンを受け取る。
+        [結果] 401エラーが発生する。
+        """
+        response = self.client.get(reverse('twingo2_callback'), {'oauth_token': 'token', 'oauth_verifier': 'verifier'})
+        self.assertEqual(401, response.status_code)
+
+    @override_settings(
+        PENDING_LOGIN_STORE='twingo2.stores.SignedCookieStore',
+        TOKEN_ENCRYPTION_KEYS=['8ImC3AIUj2eme1NQtyfS_bJ8wE-GR5_cO-vjH36zRqg=']
+    )
+    @patch('twingo2.views.login')
+    @patch('twingo2.views.authenticate')
+    @patch('twingo2.views.OAuthHandler')
+    def test_twitter_callback_10(self, oauth_handler, authenticate, login):
+        """
+        [対象] twitter_callback() : No.10
+        [条件] 署名付きクッキーを使用するストアでログインを完了する。
+        [結果] シークレットは暗号化して保管され、保管しておいた画面にリダイレクトされ、クッキーが削除される。
+        """
+        oauth_handler.return_value.get_authorization_url.return_value = '/redirect/'
+        oauth_handler.return_value.request_token = {'oauth_token': 'token', 'oauth_token_secret': 'secret'}
+        authenticate.return_value = 'user'
+        response = self.client.get(reverse('twingo2_login'), {'next': '/next/'})
+        self.assertIsNone(self.client.session.get('request_token'))
+        payload = signing.loads(response.cookies['twingo2_login'].value, salt='twingo2.stores.SignedCookieStore')
+        self.assertNotEqual('secret', payload['request_token']['oauth_token_secret'])
+
+        response = self.client.get(reverse('twingo2_callback'), {'oauth_token': 'token', 'oauth_verifier': 'verifier'})
+        self.assertRedirects(response, '/next/')
+        self.assertEqual('', response.cookies['twingo2_login'].value)
+        self.assertEqual(
+            {'oauth_token': 'token', 'oauth_token_secret': 'secret'}, oauth_handler.return_value.request_token
+        )
+
+    @override_settings(PENDING_LOGIN_STORE='twingo2.stores.SignedCookieStore')
+    def test_twitter_callback_11(self):
+        """
+        [対象] twitter_callback() : No.11
+        [条件] 署名付きクッキーを使用するストアで、改ざんされたクッキーを受け取る。
+        [結果] 401エラーが発生する。
+        """
+        self.client.cookies['twingo2_login'] = 'tampered'
+
+        response = self.client.get(reverse('twingo2_callback'), {'oauth_token': 'token', 'oauth_verifier': 'verifier'})
+        self.assertEqual(401, response.status_code)
+
+    @override_settings(TWITTER_BREAKER_THRESHOLD=1, TWITTER_BREAKER_RESET_TIMEOUT=30)
+    @patch('twingo2.views.OAuthHandler')
+    def test_twitter_login_04(self, oauth_handler):
+        """
+        [対象] twitter_login() : No.04
+        [条件] Twitterがタイムアウトする。
+        [結果] 503エラーが発生し、以降のログインはTwitterに問い合わせずに503エラーとなる。
+        """
+        oauth_handler.return_value.get_authorization_url.side_effect = requests.Timeout()
+
+        response = self.client.get(reverse('twingo2_login'))
+        self.assertEqual(503, response.status_code)
+        self.assertEqual('30', response['Retry-After'])
+
+        response = self.client.get(reverse('twingo2_login'))
+        self.assertEqual(503, response.status_code)
+        self.assertEqual(1, oauth_handler.return_value.get_authorization_url.call_count)
+
+    @override_settings(TWITTER_UNAVAILABLE_VIEW='tests.urls.unavailable_page')
+    @patch('twingo2.views.OAuthHandler')
+    def test_twitter_callback_12(self, oauth_handler):
+        """
+        [対象] twitter_callback() : No.12
+        [条件] アクセストークンの取得でTwitterがエラーを返却し、503時のビューを指定する。
+        [結果] 指定したビューのレスポンスが返却される。
+        """
+        oauth_handler.return_value.get_access_token.side_effect = TweepError('reason', Mock(status_code=502))
+
+        session = self.client.session
+        session['request_token'] = {'oauth_token': 'token'}
+        session.save()
+
+        response = self.client.get(reverse('twingo2_callback'), {'oauth_token': 'token', 'oauth_verifier': 'verifier'})
+        self.assertEqual(503, response.status_code)
+        self.assertEqual(b'unavailable', response.content)
+
+    @patch('twingo2.views.login')
+    @patch('twingo2.views.authenticate')
+    @patch('twingo2.views.OAuthHandler')
+    def test_twitter_callback_13(self, oauth_handler, authenticate, login):
+        """
+        [対象] twitter_callback() : No.13
+        [条件] アクセストークンの取得時にTwitter IDが返却される。
+        [結果] アクセストークンとともにTwitter IDが認証処理に渡される。
+        """
+        oauth_handler.return_value.get_access_token.return_value = ('key', 'secret')
+        oauth_handler.return_value.user_id = 1402804142
+        authenticate.return_value = 'user'
+
+        session = self.client.session
+        session['request_token'] = {'oauth_token': 'token'}
+        session.save()
+
+        response = self.client.get(reverse('twingo2_callback'), {'oauth_token': 'token', 'oauth_verifier': 'verifier'})
+        self.assertRedirects(response, '/')
+        authenticate.assert_called_once_with(access_token=('key', 'secret'), twitter_id=1402804142)
+
+    @override_settings(LOGIN_METRICS_ENABLED=True)
+    @patch('twingo2.views.login')
+    @patch('twingo2.views.authenticate')
+    @patch('twingo2.views.OAuthHandler')
+    def test_twitter_callback_14(self, oauth_handler, authenticate, login):
+        """
+        [対象] twitter_callback() : No.14
+        [条件] ログイン処理の計測を有効にしてログインに成功する。
+        [結果] 成功が記録され、各段階の所要時間が記録される。
+        """
+        metrics.registry.clear()
+        authenticate.return_value = 'user'
+
+        session = self.client.session
+        session['request_token'] = {'oauth_token': 'token'}
+        session.save()
+
+        self.client.get(reverse('twingo2_callback'), {'oauth_token': 'token', 'oauth_verifier': 'verifier'})
+        rendered = metrics.registry.render()
+        self.assertEqual(1, metrics.registry.get_counter('twingo2_login_success_total'))
+        for phase in ('callback', 'get_access_token', 'authenticate'):
+            self.assertIn('twingo2_login_phase_seconds_count{phase="%s"} 1' % phase, rendered)
+
+    @override_settings(LOGIN_METRICS_ENABLED=True)
+    def test_twitter_callback_15(self):
+        """
+        [対象] twitter_callback() : No.15
+        [条件] ログイン処理の計測を有効にし、リクエストトークンを保管せずにコールバックする。
+        [結果] 原因とともに失敗が記録される。
+        """
+        metrics.registry.clear()
+
+        response = self.client.get(reverse('twingo2_callback'), {'oauth_token': 'token', 'oauth_verifier': 'verifier'})
+        self.assertEqual(401, response.status_code)
+        self.assertEqual(
+            1, metrics.registry.get_counter('twingo2_login_failures_total', reason='missing_request_token')
+        )
+
+    @override_settings(PENDING_LOGIN_STORE='twingo2.stores.CacheStore')
+    @patch('twingo2.views.authenticate')
+    @patch('twingo2.views.OAuthHandler')
+    def test_twitter_callback_16(self, oauth_handler, authenticate):
+        """
+        [対象] twitter_callback() : No.16
+        [条件] キャッシュを使用するストアで、ログインを開始したブラウザとは別のブラウザからコールバックする。
+        [結果] 401エラーが発生し、認証処理は実行されない。
+        """
+        oauth_handler.return_value.get_authorization_url.return_value = '/redirect/'
+        oauth_handler.return_value.request_token = {'oauth_token': 'token'}
+        self.client.get(reverse('twingo2_login'))
+
+        victim = Client()
+        victim.cookies['twingo2_login'] = 'forged'
+        response = victim.get(reverse('twingo2_callback'), {'oauth_token': 'token', 'oauth_verifier': 'verifier'})
+        self.assertEqual(401, response.status_code)
+        self.assertFalse(authenticate.called)
+
+    @patch('twingo2.views.authenticate')
+    @patch('twingo2.views.OAuthHandler')
+    def test_twitter_callback_17(self, oauth_handler, authenticate):
+        """
+        [対象] twitter_callback() : No.17
+        [条件] セッションを使用するストアで、ログイン処理中の情報以外の値をセッションに格納した状態で認証処理に失敗する。
+        [結果] 401エラーが発生し、セッションが空になる。
+        """
+        authenticate.return_value = None
+
+        session = self.client.session
+        session['request_token'] = {'oauth_token': 'token'}
+        session['next'] = '/next/'
+        session['other'] = 'value'
+        session.save()
+
+        response = self.client.get(reverse('twingo2_callback'), {'oauth_token': 'token', 'oauth_verifier': 'verifier'})
+        self.assertEqual(401, response.status_code)
+        self.assertEqual([], list(self.client.session.keys()))
+
+    def test_twitter_metrics_01(self):
+        """
+        [対象] twitter_metrics() : No.01
+        [条件] ログイン処理の計測を無効にする。
+        [結果] 404が返却される。
+        """
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(404, response.status_code)
+
+    @override_settings(LOGIN_METRICS_ENABLED=True)
+    def test_twitter_metrics_02(self):
+        """
+        [対象] twitter_metrics() : No.02
+        [条件] ログイン処理の計測を有効にする。
+        [結果] Prometheusのテキスト形式でメトリクスが返却される。
+        """
+        metrics.registry.clear()
+        metrics.record_success()
+
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn(b'twingo2_login_success_total 1', response.content)
+
+    def test_twitter_profile_image_01(self):
+        """
+        [対象] twitter_profile_image() : No.01
+        [条件] プロフィール画像のローカル保存を無効にする。
+        [結果] 404が返却される。
+        """
+        response = self.client.get(reverse('twingo2_profile_image', kwargs={'name': '%s.png' % ('a' * 64)}))
+        self.assertEqual(404, response.status_code)
+
+    @override_settings(PROFILE_IMAGE_CACHE_ENABLED=True)
+    def test_twitter_profile_image_02(self):
+        """
+        [対象] twitter_profile_image() : No.02
+        [条件] 保存されている画像を取得する。
+        [結果] 画像がETagと長期間のキャッシュを指定して返却され、送信後にファイルが閉じられる。
+        """
+        name = '%s_48.png' % ('a' * 64)
+        storage = Mock()
+        storage.open.return_value = File(io.BytesIO(b'image'))
+        with patch('twingo2.images.get_storage', return_value=storage):
+            response = self.client.get(reverse('twingo2_profile_image', kwargs={'name': name}))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(b'image', b''.join(response.streaming_content))
+        self.assertEqual('5', response['Content-Length'])
+        response.close()
+        self.assertTrue(storage.open.return_value.closed)
+        self.assertEqual('image/png', response['Content-Type'])
+        self.assertEqual('"%s_48"' % ('a' * 64), response['ETag'])
+        self.assertEqual('public, max-age=31536000, immutable', response['Cache-Control'])
+        storage.open.assert_called_once_with('twingo2/profile_images/aa/%s' % name)
+
+    @override_settings(PROFILE_IMAGE_CACHE_ENABLED=True)
+    def test_twitter_profile_image_03(self):
+        """
+        [対象] twitter_profile_image() : No.03
+        [条件] ブラウザーが保持している画像と同じETagを指定して取得する。
+        [結果] ストレージから読み込まずに304が返却される。
+        """
+        with patch('twingo2.images.get_storage') as get_storage:
+            response = self.client.get(
+                reverse('twingo2_profile_image', kwargs={'name': '%s.jpg' % ('b' * 64)}),
+                HTTP_IF_NONE_MATCH='"%s"' % ('b' * 64)
+            )
+        self.assertEqual(304, response.status_code)
+        self.assertFalse(get_storage.called)
+
+    @override_settings(PROFILE_IMAGE_CACHE_ENABLED=True)
+    def test_twitter_profile_image_04(self):
+        """
+        [対象] twitter_profile_image() : No.04
+        [条件] 保存されていない画像を取得する。
+        [結果] 404が返却される。
+        """
+        storage = Mock()
+        storage.open.side_effect = IOError
+        with patch('twingo2.images.get_storage', return_value=storage):
+            response = self.client.get(reverse('twingo2_profile_image', kwargs={'name': '%s.png' % ('c' * 64)}))
+        self.assertEqual(404, response.status_code)
+
     @override_settings(AFTER_LOGOUT_URL='/after/')
     @patch('twingo2.views.logout')
     def test_twitter_logout_01(self, logout):
@@ -200,3 +550,17 @@ class ViewsTest(TestCase):
         """
         response = self.client.get(reverse('twingo2_logout'))
         self.assertRedirects(response, '/')
+
+    @override_settings(SIGNED_TOKEN_MAX_AGE=3600)
+    @patch('twingo2.views.logout')
+    def test_twitter_logout_03(self, logout):
+        """
+        [対象] twitter_logout() : No.03
+        [条件] 署名付きトークンによる認証を有効にする。
+        [結果] トークンがクッキーから削除される。
+        """
+        self.client.cookies['twingo2_token'] = 'token'
+
+        response = self.client.get(reverse('twingo2_logout'))
+        self.assertRedirects(response, '/')
+        self.assertEqual('', response.cookies['twingo2_token'].value)
@@ -17,15 +17,18 @@
 #
 
 from django.conf.urls import include, patterns, url
+from django.contrib import admin
 from django.http import HttpResponse
 
 
 urlpatterns = patterns('',
     (r'^twingo2/', include('twingo2.urls')),
+    (r'^admin/', include(admin.site.urls)),
     url(r'^$', 'tests.urls.top_page', name='top'),
     url(r'^redirect/$', 'tests.urls.redirect_page', name='redirect'),
     url(r'^next/$', 'tests.urls.next_page', name='next'),
     url(r'^after/$', 'tests.urls.after_page', name='after'),
+    url(r'^metrics/$', 'twingo2.views.twitter_metrics', name='metrics'),
 )
 
 
@@ -50,6 +53,13 @@ def next_page(request):
     return HttpResponse('')
 
 
+def unavailable_page(request):
+    """
+    ダミーの503画面。
+    """
+    return HttpResponse('unavailable', status=503)
+
+
 def after_page(request):
     """
     ダミーの処理後画面。
@@ -18,3 +18,6 @@
 
 # バージョン番号
 __version__ = '1.0.2'
+
+# アプリケーション設定
+default_app_config = 'twingo2.apps.Twingo2Config'
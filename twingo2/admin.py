@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import json
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.db import connections
+from django.utils import timezone
+
+from twingo2.cache import primary_pin_cache, screen_name_cache, user_cache
+from twingo2.models import User
+
+
+AFTER_VAR = 'after'
+"""直前のページの最後のユーザーのIDを示すクエリパラメーター"""
+
+
+def estimate_count(queryset, limit=10000):
+    """
+    クエリセットの件数を概算する。
+    PostgreSQLでは実行計画の推定行数を返却し、それ以外のデータベースではlimit件を上限として数える。
+
+    :param queryset: 件数を求めるクエリセット
+    :type queryset: django.db.models.query.QuerySet
+    :param limit: PostgreSQL以外のデータベースで数える件数の上限
+    :type limit: int
+    :return: 概算の件数
+    :rtype: int
+    """
+    # PostgreSQLではCOUNT(*)を実行せずに実行計画から求める
+    queryset = queryset.order_by()
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+    # それ以外のデータベースでは上限までを数える
+    return queryset[:limit].count()
+
+
+class KeysetChangeList(ChangeList):
+    """
+    OFFSETではなくIDの範囲指定でページングするChangeList。
+    件数は概算とし、IDの降順に固定して表示する。
+    """
+
+    def get_filters_params(self, params=None):
+        """
+        絞り込みの条件として扱うクエリパラメーターを取得する。
+
+        :param params: クエリパラメーター
+        :type params: dict
+        :return: 絞り込みの条件
+        :rtype: dict
+        """
+        # ページングのパラメーターを除く
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(AFTER_VAR, None)
+        return lookup_params
+
+    def get_ordering(self, request, queryset):
+        """
+        並び順を取得する。
+
+        :param request: リクエストオブジェクト
+        :type request: django.http.HttpRequest
+        :param queryset: クエリセット
+        :type queryset: django.db.models.query.QuerySet
+        :return: 並び順
+        :rtype: list
+        """
+        # IDの降順に固定する
+        return ['-pk']
+
+    def get_ordering_field_columns(self):
+        """
+        並び替えに使用している列を取得する。
+
+        :return: 列の番号と並び順の辞書
+        :rtype: dict
+        """
+        # 列による並び替えは行わない
+        return {}
+
+    def get_results(self, request):
+        """
+        表示するページのユーザーを取得する。
+
+        :param request: リクエストオブジェクト
+        :type request: django.http.HttpRequest
+        """
+        # 絞り込み後の件数を概算する
+        self.result_count = estimate_count(self.queryset, getattr(settings, 'USER_ADMIN_COUNT_LIMIT', 10000))
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.can_show_all = False
+
+        # 直前のページの最後のIDより小さいユーザーを取得する
+        try:
+            after = int(self.params.get(AFTER_VAR, ''))
+        except ValueError:
+            after = None
+        queryset = self.queryset if after is None else self.queryset.filter(pk__lt=after)
+        self.result_list = queryset[:self.list_per_page]
+        users = list(self.result_list)
+
+        # 次のページが存在する場合のみリンクを表示する
+        self.has_previous = after is not None
+        self.next_page_url = None
+        if len(users) == self.list_per_page and queryset.filter(pk__lt=users[-1].pk).exists():
+            self.next_page_url = self.get_query_string({AFTER_VAR: users[-1].pk})
+        self.first_page_url = self.get_query_string(remove=[AFTER_VAR])
+        self.multi_page = self.has_previous or self.next_page_url is not None
+        self.paginator = None
+
+
+class UserAdmin(admin.ModelAdmin):
+    """
+    Userの管理画面。
+    大量のユーザーを扱えるよう、件数の概算とIDの範囲指定によるページングを行い、一括操作は分割したUPDATEで実行する。
+    """
+
+    list_display = ('twitter_id', 'screen_name', 'name', 'is_active', 'is_staff', 'is_superuser', 'created_at')
+    list_filter = ('is_active', 'is_staff', 'is_superuser')
+    search_fields = ('screen_name', 'name', 'description')
+    exclude = ('password',)
+    readonly_fields = ('twitter_id', 'created_at', 'updated_at')
+    show_full_result_count = False
+    actions = ('activate_users', 'deactivate_users', 'promote_to_staff')
+    change_list_template = 'admin/twingo2/user/keyset_change_list.html'
+
+    def get_changelist(self, request, **kwargs):
+        """
+        一覧画面のChangeListのクラスを取得する。
+
+        :param request: リクエストオブジェクト
+        :type request: django.http.HttpRequest
+        :param kwargs: キーワード引数
+        :type kwargs: dict
+        :return: ChangeListのクラス
+        :rtype: type
+        """
+        return KeysetChangeList
+
+    def get_readonly_fields(self, request, obj=None):
+        """
+        変更画面で読み取り専用とするフィールドを取得する。
+        管理者以外が自分自身や他のユーザーに権限を付与できないよう、権限のフィールドは管理者のみが変更できる。
+        また、管理者以外は自分自身を有効/無効にできない。
+
+        :param request: リクエストオブジェクト
+        :type request: django.http.HttpRequest
+        :param obj: 変更するユーザー
+        :type obj: twingo2.models.User
+        :return: 読み取り専用とするフィールド名のリスト
+        :rtype: list
+        """
+        readonly_fields = list(super().get_readonly_fields(request, obj))
+        if not request.user.is_superuser:
+            readonly_fields += ['is_superuser', 'is_staff']
+            if obj is not None and obj.pk == request.user.pk:
+                readonly_fields.append('is_active')
+        return readonly_fields
+
+    def get_actions(self, request):
+        """
+        一覧画面の一括操作を取得する。
+        権限の付与は管理者のみが実行できる。
+
+        :param request: リクエストオブジェクト
+        :type request: django.http.HttpRequest
+        :return: 操作の名前をキーとする一括操作の辞書
+        :rtype: collections.OrderedDict
+        """
+        actions = super().get_actions(request)
+        if not request.user.is_superuser:
+            actions.pop('promote_to_staff', None)
+        return actions
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        検索語でユーザーを絞り込む。
+        icontainsによる全件走査を避けるため、User.objects.search()の索引を使用する。
+
+        :param request: リクエストオブジェクト
+        :type request: django.http.HttpRequest
+        :param queryset: クエリセット
+        :type queryset: django.db.models.query.QuerySet
+        :param search_term: 検索語
+        :type search_term: str
+        :return: 絞り込み後のクエリセットと、重複の除去が必要であるかどうか
+        :rtype: tuple
+        """
+        if not search_term:
+            return queryset, False
+        return queryset.filter(pk__in=User.objects.search(search_term).values('pk')), False
+
+    def activate_users(self, request, queryset):
+        """
+        選択されたユーザーを有効にする。
+
+        :param request: リクエストオブジェクト
+        :type request: django.http.HttpRequest
+        :param queryset: 選択されたユーザーのクエリセット
+        :type queryset: django.db.models.query.QuerySet
+        """
+        updated = self._update_in_batches(queryset, is_active=True)
+        self.message_user(request, '%d件のユーザーを有効にしました。' % updated)
+    activate_users.short_description = '選択されたユーザーを有効にする'
+
+    def deactivate_users(self, request, queryset):
+        """
+        選択されたユーザーを無効にする。
+        操作しているユーザー自身は無効にしない。
+
+        :param request: リクエストオブジェクト
+        :type request: django.http.HttpRequest
+        :param queryset: 選択されたユーザーのクエリセット
+        :type queryset: django.db.models.query.QuerySet
+        """
+        updated = self._update_in_batches(queryset.exclude(pk=request.user.pk), is_active=False)
+        self.message_user(request, '%d件のユーザーを無効にしました。' % updated)
+    deactivate_users.short_description = '選択されたユーザーを無効にする'
+
+    def promote_to_staff(self, request, queryset):
+        """
+        選択されたユーザーに管理画面の操作権限を付与する。
+
+        :param request: リクエストオブジェクト
+        :type request: django.http.HttpRequest
+        :param queryset: 選択されたユーザーのクエリセット
+        :type queryset: django.db.models.query.QuerySet
+        """
+        updated = self._update_in_batches(queryset, is_staff=True)
+        self.message_user(request, '%d件のユーザーに管理画面の操作権限を付与しました。' % updated)
+    promote_to_staff.short_description = '選択されたユーザーに管理画面の操作権限を付与する'
+
+    def _update_in_batches(self, queryset, **values):
+        """
+        ユーザーを読み込まずに、主キー順にUSER_ADMIN_BATCH_SIZE件ずつUPDATEする。
+
+        :param queryset: 更新するユーザーのクエリセット
+        :type queryset: django.db.models.query.QuerySet
+        :param values: 更新するフィールド名と値
+        :type values: dict
+        :return: 更新した件数
+        :rtype: int
+        """
+        # 主キーとキャッシュのキーのみを取得し、バッチごとに更新する
+        batch_size = getattr(settings, 'USER_ADMIN_BATCH_SIZE', 1000)
+        last_pk = 0
+        updated = 0
+        while True:
+            users = list(queryset.filter(pk__gt=last_pk).order_by('pk').only('pk', 'screen_name')[:batch_size])
+            if not users:
+                break
+            updated += User.objects.filter(pk__in=[user.pk for user in users]).update(
+                updated_at=timezone.now(), **values
+            )
+
+            # UPDATEではシグナルが送信されないためプライマリに固定してキャッシュを破棄する
+            pending = connections[queryset.db].in_atomic_block
+            for user in users:
+                primary_pin_cache.pin(user.pk)
+                user_cache.invalidate(user.pk, pending=pending)
+                screen_name_cache.invalidate(user)
+            last_pk = users[-1].pk
+        return updated
+
+
+# USER_ADMIN_ENABLEDが設定されている場合のみ登録する
+if getattr(settings, 'USER_ADMIN_ENABLED', False):
+    admin.site.register(User, UserAdmin)
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from django.apps import AppConfig
+from django.conf import settings
+
+
+class Twingo2Config(AppConfig):
+    """
+    twingo2のアプリケーション設定。
+    """
+
+    name = 'twingo2'
+    """アプリケーション名"""
+
+    def ready(self):
+        """
+        アプリケーションの初期化処理を実行する。
+        """
+        # シグナルの受信処理を登録する
+        from twingo2 import receivers  # NOQA
+
+        # Twitterとの通信で共有のコネクションプールを使用する
+        # tweepyの置き換えはプロセス全体に影響するため、設定された場合のみ行う
+        if getattr(settings, 'TWITTER_POOL_MAXSIZE', None):
+            from twingo2 import transport
+            transport.install()
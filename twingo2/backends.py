@@ -16,12 +16,32 @@
 # limitations under the License.
 #
 
+import datetime
+
 from tweepy import API, OAuthHandler
 from tweepy.error import TweepError
 
 from django.conf import settings
+from django.db import router
+from django.utils import timezone
+
+from twingo2 import encryption, metrics, routers, sharding, transport
+from twingo2.cache import access_token_cache, api_client_cache, user_cache
+from twingo2.circuit import CircuitOpenError, is_unavailable_error, twitter_breaker
+from twingo2.models import AccessToken, User
+
+
+def get_profile(twitter_user):
+    """
+    Twitterのユーザー情報からUserのプロフィールに相当する値を取り出す。
 
-from twingo2.models import User
+    :param twitter_user: Twitterのユーザー情報
+    :type twitter_user: tweepy.models.User
+    :return: User.PROFILE_FIELDSに含まれるフィールド名とその値
+    :rtype: dict
+    """
+    # 未設定の項目はNoneで返却されるため空文字に置き換える
+    return {field_name: getattr(twitter_user, field_name) or '' for field_name in User.PROFILE_FIELDS}
 
 
 class TwitterBackend:
@@ -30,72 +50,216 @@ class TwitterBackend:
     ModelBackendの代替として使用することを想定している。
     """
 
-    def authenticate(self, access_token):
+    def authenticate(self, access_token, twitter_id=None):
         """
         Twitterから取得したアクセストークンをもとに認証を行う。
+        アクセストークンの取得時に返却されたTwitter IDが指定された場合、
+        プロフィールの更新が不要な既存ユーザーであればTwitterに問い合わせない。
 
         :param access_token: アクセストークン
         :type access_token: tuple
+        :param twitter_id: アクセストークンの取得時に返却されたTwitter ID
+        :type twitter_id: int
         :return: ユーザー情報
         :rtype: twingo2.models.User
         """
+        # 過去に認証したアクセストークンであればキャッシュされたTwitter IDを優先する
+        cached_twitter_id = access_token_cache.get(access_token)
+        known_twitter_id = cached_twitter_id if cached_twitter_id is not None else twitter_id
+
+        # Twitter IDが判明していれば既存ユーザーについてはTwitterに問い合わせない
+        # (レプリカに未反映のユーザーは存在しないものとして扱い、Twitterへの問い合わせ後にプライマリから取得する)
+        if known_twitter_id is not None:
+            try:
+                with metrics.timer('user_query'):
+                    user = self._get_user_by_twitter_id(known_twitter_id)
+            except User.DoesNotExist:
+                access_token_cache.delete(access_token)
+            else:
+                # 無効化されたユーザーのアクセストークンは破棄する
+                if not user.is_active:
+                    access_token_cache.delete(access_token)
+                    return None
+                if not self._is_profile_stale(user):
+                    if cached_twitter_id is None:
+                        access_token_cache.set(access_token, user.twitter_id)
+                        self._save_access_token(user, access_token)
+                    return user
+
         # APIオブジェクトを構築する
         oauth_handler = OAuthHandler(settings.CONSUMER_KEY, settings.CONSUMER_SECRET)
         oauth_handler.set_access_token(access_token[0], access_token[1])
-        api = API(oauth_handler)
+        api = API(oauth_handler, timeout=transport.get_timeout())
 
         # ログインユーザーのTwitter情報を取得する
         try:
-            twitter_user = api.me()
-        except TweepError:
+            with metrics.timer('verify_credentials'), twitter_breaker:
+                twitter_user = api.me()
+        except (CircuitOpenError, TweepError) as e:
+            # Twitterが応答できない場合は縮退運転として既存ユーザーのみを認証する
+            if getattr(settings, 'TWITTER_DEGRADED_MODE', False) and (
+                    isinstance(e, CircuitOpenError) or is_unavailable_error(e)):
+                return self._authenticate_degraded(access_token)
             return None
 
-        # Userを取得/作成する
-        try:
-            user = User.objects.get(twitter_id=twitter_user.id)
-        except User.DoesNotExist:
-            admin_twitter_id = getattr(settings, 'ADMIN_TWITTER_ID', ())
-            if twitter_user.id in admin_twitter_id:
-                # 管理者ユーザーを作成する
-                user = User.objects.create_superuser(
+        # プライマリ(シャーディングが有効な場合は対応するシャード)からUserを取得/作成する
+        with metrics.timer('user_query'):
+            try:
+                user = self._get_user_by_twitter_id(twitter_user.id, write=True)
+            except User.DoesNotExist:
+                # 並行して作成された場合は作成済みのユーザーを取得する
+                admin_twitter_id = getattr(settings, 'ADMIN_TWITTER_ID', ())
+                user, created = User.objects.create_or_get_user(
                     twitter_id=twitter_user.id,
-                    screen_name=twitter_user.screen_name,
-                    name=twitter_user.name,
-                    description=twitter_user.description,
-                    location=twitter_user.location,
-                    url=twitter_user.url,
-                    profile_image_url=twitter_user.profile_image_url
+                    is_superuser=twitter_user.id in admin_twitter_id,
+                    **get_profile(twitter_user)
                 )
             else:
-                # 一般ユーザーを作成する
-                user = User.objects.create_user(
-                    twitter_id=twitter_user.id,
-                    screen_name=twitter_user.screen_name,
-                    name=twitter_user.name,
-                    description=twitter_user.description,
-                    location=twitter_user.location,
-                    url=twitter_user.url,
-                    profile_image_url=twitter_user.profile_image_url
-                )
+                # 一定期間更新されていないプロフィールを更新する
+                if self._is_profile_stale(user):
+                    user.update_profile(**get_profile(twitter_user))
 
         # 有効なユーザーであるかチェックする
         if user.is_active:
+            access_token_cache.set(access_token, user.twitter_id)
+            self._save_access_token(user, access_token)
             return user
         else:
             return None
 
+    def _save_access_token(self, user, access_token):
+        """
+        TOKEN_ENCRYPTION_KEYSが設定されている場合、アクセストークンを暗号化して保存する。
+
+        :param user: ユーザー情報
+        :type user: twingo2.models.User
+        :param access_token: アクセストークン
+        :type access_token: tuple
+        """
+        # 暗号化保存が無効な場合は何もしない
+        if not encryption.is_enabled():
+            return
+
+        # 保存し、古いアクセストークンによるAPIオブジェクトを破棄する
+        AccessToken.objects.save_token(user, access_token)
+        api_client_cache.invalidate(sharding.get_user_id(user))
+
+    def _get_user_by_twitter_id(self, twitter_id, write=False):
+        """
+        Twitter IDでユーザーを取得する。
+        シャードの移行中(USER_SHARD_PREVIOUS_DATABASESを設定している間)は、移行前のシャードに残っているユーザーを
+        対応するシャードに移動してから返却し、同じTwitter IDのユーザーが新たに作成されることを防ぐ。
+
+        :param twitter_id: Twitter ID
+        :type twitter_id: int
+        :param write: 作成/更新の前に取得する場合はTrue
+        :type write: bool
+        :return: ユーザー情報
+        :rtype: twingo2.models.User
+        :raises User.DoesNotExist: 対応するユーザーが存在しない場合
+        """
+        # 対応するシャード(またはレプリカ/プライマリ)から取得する
+        try:
+            return User.objects.using(self._get_database(twitter_id, write)).get(twitter_id=twitter_id)
+        except User.DoesNotExist:
+            previous = sharding.get_previous_shard(twitter_id)
+            if previous is None:
+                raise
+
+        # 移行前のシャードに残っていれば移動する
+        user = User.objects.using(previous).get(twitter_id=twitter_id)
+        return User.objects.db_manager(previous).move_to_shards([user])[twitter_id]
+
+    def _get_database(self, twitter_id, write=False):
+        """
+        Twitter IDでユーザーを取得するデータベースを決定する。
+        シャーディングが有効な場合はTwitter IDに対応するシャード、それ以外の場合はレプリカまたはプライマリとする。
+
+        :param twitter_id: Twitter ID
+        :type twitter_id: int
+        :param write: 作成/更新の前に取得する場合はTrue
+        :type write: bool
+        :return: データベースのエイリアス
+        :rtype: str
+        """
+        if sharding.is_enabled():
+            return sharding.get_shard(twitter_id)
+        return router.db_for_write(User) if write else routers.get_read_database(User)
+
+    def _authenticate_degraded(self, access_token):
+        """
+        Twitterに問い合わせずに既存ユーザーを認証する。
+        Twitterのアクセストークンは「Twitter ID-ランダムな文字列」の形式であるため、
+        その先頭からTwitter IDを取得する。新規ユーザーは作成しない。
+
+        :param access_token: アクセストークン
+        :type access_token: tuple
+        :return: ユーザー情報
+        :rtype: twingo2.models.User
+        """
+        # アクセストークンからTwitter IDを取得する
+        twitter_id, separator, _ = str(access_token[0]).partition('-')
+        if not separator or not twitter_id.isdigit():
+            return None
+
+        # 有効な既存ユーザーのみを認証する
+        try:
+            user = self._get_user_by_twitter_id(int(twitter_id))
+        except User.DoesNotExist:
+            return None
+        return user if user.is_active else None
+
+    def _is_profile_stale(self, user):
+        """
+        プロフィールの更新が必要であるかどうかを判定する。
+
+        :param user: ユーザー情報
+        :type user: twingo2.models.User
+        :return: PROFILE_REFRESH_INTERVALで指定された秒数以上プロフィールを確認していなければTrue
+        :rtype: bool
+        """
+        # 更新間隔が設定されていない場合は更新しない
+        refresh_interval = getattr(settings, 'PROFILE_REFRESH_INTERVAL', None)
+        if refresh_interval is None:
+            return False
+
+        # 最終確認日時(未確認の場合は最終更新日時)から更新間隔が経過しているかチェックする
+        checked_at = user.profile_checked_at or user.updated_at
+        return checked_at <= timezone.now() - datetime.timedelta(seconds=refresh_interval)
+
     def get_user(self, user_id):
         """
         指定されたIDのユーザー情報を取得する。
+        USER_CACHE_TIMEOUTが設定されている場合はキャッシュを経由する。
 
-        :param user_id: UserのID
+        :param user_id: UserのID(シャーディングが有効な場合はsharding.get_user_id()で取得した値)
         :type user_id: int
         :return: ユーザー情報
         :rtype: twingo2.models.User
         """
+        # ユーザー情報を取得する
+        return user_cache.get(user_id, self._get_user)
+
+    def _get_user(self, user_id):
+        """
+        指定されたIDのユーザー情報をデータベースから取得する。
+        USER_READ_DATABASESが設定されている場合はレプリカから取得する。ただし書き込み直後のユーザーはプライマリから取得する。
+        シャーディングが有効な場合はIDが示すシャードから取得する。
+
+        :param user_id: UserのID(シャーディングが有効な場合はsharding.get_user_id()で取得した値)
+        :type user_id: int
+        :return: ユーザー情報
+        :rtype: twingo2.models.User
+        """
+        # 取得するデータベースと主キーを決定する
+        try:
+            db, pk = sharding.split_user_id(user_id)
+        except ValueError:
+            return None
+
         # ユーザー情報を取得する
         try:
-            user = User.objects.get(pk=user_id, is_active=True)
+            user = User.objects.using(db or routers.get_read_database(User, user_id)).get(pk=pk, is_active=True)
             return user
         except User.DoesNotExist:
             return None
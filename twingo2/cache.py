@@ -0,0 +1,668 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from collections import OrderedDict
+import pickle
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.crypto import get_random_string, salted_hmac
+
+
+class LocalCache:
+    """
+    有効期限付きのLRUキャッシュ。
+    プロセス内でのみ共有される。
+    """
+
+    def __init__(self, max_size):
+        """
+        LocalCacheを構築する。
+
+        :param max_size: 保持するエントリの最大数
+        :type max_size: int
+        """
+        # 内部状態を初期化する
+        self._max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        指定されたキーの値を取得する。
+
+        :param key: キー
+        :type key: str
+        :param default: 値が存在しない場合の返却値
+        :type default: object
+        :return: 値
+        :rtype: object
+        """
+        with self._lock:
+            # エントリを取得する
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+
+            # 有効期限切れのエントリは破棄する
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return default
+
+            # 最近使用したエントリとして末尾に移動する
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        """
+        指定されたキーに値を設定する。
+
+        :param key: キー
+        :type key: str
+        :param value: 値
+        :type value: object
+        :param timeout: 有効期間(秒)
+        :type timeout: float
+        """
+        with self._lock:
+            # エントリを追加する
+            self._entries[key] = (value, time.monotonic() + timeout)
+            self._entries.move_to_end(key)
+
+            # 最大数を超えた場合は最も古いエントリから破棄する
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        """
+        指定されたキーの値を削除する。
+
+        :param key: キー
+        :type key: str
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        すべての値を削除する。
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+class UserCache:
+    """
+    TwitterBackend.get_user()の結果を保持するキャッシュ。
+    プロセス内のLocalCacheとDjangoのキャッシュフレームワークの二段構成とする。
+    破棄のたびにユーザーごとのバージョンを更新し、破棄より前に読み込んだ値が共有キャッシュから返却されることを防ぐ。
+    """
+
+    def __init__(self):
+        """
+        UserCacheを構築する。
+        """
+        # 内部状態を初期化する
+        self._local = None
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        """
+        キャッシュが有効であるかどうか。
+
+        :return: キャッシュが有効であればTrue
+        :rtype: bool
+        """
+        # 有効期間が設定されている場合のみ有効とする
+        return bool(getattr(settings, 'USER_CACHE_TIMEOUT', None))
+
+    def get(self, user_id, loader):
+        """
+        指定されたIDのユーザー情報を取得する。
+        キャッシュに存在しない場合はloaderを呼び出して取得した値をキャッシュする。
+
+        :param user_id: UserのID
+        :type user_id: int
+        :param loader: ユーザー情報をデータベースから取得する関数
+        :type loader: callable
+        :return: ユーザー情報
+        :rtype: twingo2.models.User
+        """
+        # キャッシュが無効な場合はデータベースから直接取得する
+        if not self.enabled:
+            return loader(user_id)
+
+        # キャッシュから取得する
+        key = self._make_key(user_id)
+        user, version, pending = self._get_cached(key)
+        if user is not None:
+            return user
+
+        # 同一キーに対するデータベースアクセスを1スレッドに限定する
+        with self._get_loading_lock(key):
+            try:
+                # 待機中に他のスレッドがキャッシュした値を優先する
+                user, version, pending = self._get_cached(key)
+                if user is not None:
+                    return user
+
+                # データベースから取得してキャッシュする(コミット前の更新がある場合はキャッシュしない)
+                user = loader(user_id)
+                if user is not None and not pending:
+                    self._set_cached(key, user, version)
+                return user
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+
+    def invalidate(self, user_id, pending=False):
+        """
+        指定されたIDのユーザー情報をキャッシュから削除する。
+
+        :param user_id: UserのID
+        :type user_id: int
+        :param pending: トランザクション内の更新で、まだコミットされていない場合はTrue
+        :type pending: bool
+        """
+        # キャッシュが無効な場合は何もしない
+        if not self.enabled:
+            return
+
+        # バージョンを更新し、読み込み中の値がキャッシュされないようにする
+        # コミット前の場合は他のスレッドが更新前の値を読み込むため、一定時間はキャッシュしない
+        key = self._make_key(user_id)
+        shared = self._get_shared()
+        shared.set(self._make_version_key(key), get_random_string(12), settings.USER_CACHE_TIMEOUT)
+        if pending:
+            shared.set(self._make_pending_key(key), True, getattr(settings, 'USER_CACHE_PENDING_TIMEOUT', 30))
+
+        # 両方のキャッシュから削除する
+        self._get_local().delete(key)
+        shared.delete(key)
+
+    def clear(self):
+        """
+        プロセス内のキャッシュを破棄する。
+        """
+        with self._lock:
+            self._local = None
+
+    def _make_key(self, user_id):
+        """
+        キャッシュのキーを生成する。
+
+        :param user_id: UserのID
+        :type user_id: int
+        :return: キャッシュのキー
+        :rtype: str
+        """
+        # キーを生成する
+        return 'twingo2:user:%s' % user_id
+
+    def _make_version_key(self, key):
+        """
+        バージョンを格納するキャッシュのキーを生成する。
+
+        :param key: ユーザー情報のキャッシュのキー
+        :type key: str
+        :return: キャッシュのキー
+        :rtype: str
+        """
+        return '%s:version' % key
+
+    def _make_pending_key(self, key):
+        """
+        コミット前の更新があることを示すキャッシュのキーを生成する。
+
+        :param key: ユーザー情報のキャッシュのキー
+        :type key: str
+        :return: キャッシュのキー
+        :rtype: str
+        """
+        return '%s:pending' % key
+
+    def _get_cached(self, key):
+        """
+        キャッシュからユーザー情報を取得する。
+        共有キャッシュの値は、格納時のバージョンが現在のバージョンと一致する場合のみ返却する。
+
+        :param key: キャッシュのキー
+        :type key: str
+        :return: ユーザー情報(存在しない場合はNone)、現在のバージョン、コミット前の更新の有無
+        :rtype: tuple
+        """
+        # プロセス内のキャッシュから取得する
+        local = self._get_local()
+        data = local.get(key)
+        if data is not None:
+            return pickle.loads(data), None, False
+
+        # 共有キャッシュからバージョンとともに取得する
+        version_key = self._make_version_key(key)
+        pending_key = self._make_pending_key(key)
+        values = self._get_shared().get_many([key, version_key, pending_key])
+        version = values.get(version_key)
+        pending = values.get(pending_key, False)
+        entry = values.get(key)
+        if entry is None or entry[0] != version:
+            return None, version, pending
+
+        # プロセス内のキャッシュに反映する
+        user = entry[1]
+        local.set(key, pickle.dumps(user), self._get_local_timeout())
+        return user, version, pending
+
+    def _set_cached(self, key, user, version):
+        """
+        ユーザー情報をキャッシュに格納する。
+
+        :param key: キャッシュのキー
+        :type key: str
+        :param user: ユーザー情報
+        :type user: twingo2.models.User
+        :param version: データベースから取得する前のバージョン
+        :type version: str
+        """
+        # 両方のキャッシュに格納する
+        shared = self._get_shared()
+        local = self._get_local()
+        shared.set(key, (version, user), settings.USER_CACHE_TIMEOUT)
+        local.set(key, pickle.dumps(user), self._get_local_timeout())
+
+        # 取得中に破棄された場合はプロセス内のキャッシュからも削除する(共有キャッシュの値はバージョンの不一致により無視される)
+        if shared.get(self._make_version_key(key)) != version:
+            local.delete(key)
+
+    def _get_loading_lock(self, key):
+        """
+        データベースから取得中であることを示すロックを取得する。
+
+        :param key: キャッシュのキー
+        :type key: str
+        :return: ロック
+        :rtype: threading.Lock
+        """
+        with self._lock:
+            lock = self._loading.get(key)
+            if lock is None:
+                lock = self._loading[key] = threading.Lock()
+            return lock
+
+    def _get_local(self):
+        """
+        プロセス内のキャッシュを取得する。
+
+        :return: プロセス内のキャッシュ
+        :rtype: LocalCache
+        """
+        with self._lock:
+            if self._local is None:
+                self._local = LocalCache(getattr(settings, 'USER_CACHE_LOCAL_SIZE', 1024))
+            return self._local
+
+    def _get_local_timeout(self):
+        """
+        プロセス内のキャッシュの有効期間を取得する。
+        他プロセスでの更新を検知できないため、共有キャッシュより短い期間とする。
+
+        :return: 有効期間(秒)
+        :rtype: float
+        """
+        return min(getattr(settings, 'USER_CACHE_LOCAL_TIMEOUT', 5), settings.USER_CACHE_TIMEOUT)
+
+    def _get_shared(self):
+        """
+        Djangoのキャッシュフレームワークによる共有キャッシュを取得する。
+
+        :return: 共有キャッシュ
+        :rtype: django.core.cache.backends.base.BaseCache
+        """
+        return caches[getattr(settings, 'USER_CACHE_ALIAS', 'default')]
+
+
+class AccessTokenCache:
+    """
+    アクセストークンとTwitter IDの対応を保持するキャッシュ。
+    アクセストークンはSECRET_KEYを鍵とするHMACに変換してキーとするため、キャッシュからは復元できない。
+    """
+
+    @property
+    def enabled(self):
+        """
+        キャッシュが有効であるかどうか。
+
+        :return: キャッシュが有効であればTrue
+        :rtype: bool
+        """
+        # 有効期間が設定されている場合のみ有効とする
+        return bool(getattr(settings, 'ACCESS_TOKEN_CACHE_TIMEOUT', None))
+
+    def get(self, access_token):
+        """
+        アクセストークンに対応するTwitter IDを取得する。
+
+        :param access_token: アクセストークン
+        :type access_token: tuple
+        :return: Twitter ID(存在しない場合はNone)
+        :rtype: int
+        """
+        # キャッシュが無効な場合は常に存在しないものとする
+        if not self.enabled:
+            return None
+        return self._get_cache().get(self._make_key(access_token))
+
+    def set(self, access_token, twitter_id):
+        """
+        アクセストークンに対応するTwitter IDを格納する。
+
+        :param access_token: アクセストークン
+        :type access_token: tuple
+        :param twitter_id: Twitter ID
+        :type twitter_id: int
+        """
+        # キャッシュが無効な場合は何もしない
+        if not self.enabled:
+            return
+        self._get_cache().set(self._make_key(access_token), twitter_id, settings.ACCESS_TOKEN_CACHE_TIMEOUT)
+
+    def delete(self, access_token):
+        """
+        アクセストークンに対応するTwitter IDを削除する。
+
+        :param access_token: アクセストークン
+        :type access_token: tuple
+        """
+        # キャッシュが無効な場合は何もしない
+        if not self.enabled:
+            return
+        self._get_cache().delete(self._make_key(access_token))
+
+    def _make_key(self, access_token):
+        """
+        キャッシュのキーを生成する。
+
+        :param access_token: アクセストークン
+        :type access_token: tuple
+        :return: キャッシュのキー
+        :rtype: str
+        """
+        # アクセストークンのHMACをキーとする
+        digest = salted_hmac('twingo2.cache.AccessTokenCache', '%s:%s' % tuple(access_token)).hexdigest()
+        return 'twingo2:access_token:%s' % digest
+
+    def _get_cache(self):
+        """
+        キャッシュを取得する。
+
+        :return: キャッシュ
+        :rtype: django.core.cache.backends.base.BaseCache
+        """
+        return caches[getattr(settings, 'ACCESS_TOKEN_CACHE_ALIAS', 'default')]
+
+
+class ScreenNameCache:
+    """
+    小文字のユーザー名とユーザー情報の対応を保持するキャッシュ。
+    複数のユーザー名を1回のget_many()で取得する。
+    """
+
+    @property
+    def enabled(self):
+        """
+        キャッシュが有効であるかどうか。
+
+        :return: キャッシュが有効であればTrue
+        :rtype: bool
+        """
+        # 有効期間が設定されている場合のみ有効とする
+        return bool(getattr(settings, 'SCREEN_NAME_CACHE_TIMEOUT', None))
+
+    def get_many(self, screen_names, loader):
+        """
+        複数のユーザー名に対応するユーザー情報を取得する。
+        キャッシュに存在しないユーザー名はまとめてloaderに渡し、取得した値をキャッシュする。
+
+        :param screen_names: 小文字のユーザー名のリスト
+        :type screen_names: list
+        :param loader: 小文字のユーザー名のリストを受け取り、小文字のユーザー名とユーザー情報の辞書を返却する関数
+        :type loader: callable
+        :return: 小文字のユーザー名をキー、ユーザー情報を値とする辞書
+        :rtype: dict
+        """
+        # キャッシュが無効な場合はデータベースから直接取得する
+        if not self.enabled:
+            return loader(screen_names)
+
+        # キャッシュから取得する(変更前のユーザー名で格納された値は使用しない)
+        keys = {self._make_key(screen_name): screen_name for screen_name in screen_names}
+        users = {}
+        for key, user in self._get_cache().get_many(list(keys)).items():
+            if user.screen_name.lower() == keys[key]:
+                users[keys[key]] = user
+
+        # キャッシュに存在しないユーザー名をまとめて取得してキャッシュする
+        missing = [screen_name for screen_name in screen_names if screen_name not in users]
+        if missing:
+            loaded = loader(missing)
+            if loaded:
+                self._get_cache().set_many(
+                    {self._make_key(screen_name): user for screen_name, user in loaded.items()},
+                    settings.SCREEN_NAME_CACHE_TIMEOUT
+                )
+            users.update(loaded)
+        return users
+
+    def invalidate(self, user):
+        """
+        指定されたユーザーの現在と変更前のユーザー名に対応する値をキャッシュから削除する。
+
+        :param user: ユーザー情報
+        :type user: twingo2.models.User
+        """
+        # キャッシュが無効な場合は何もしない
+        if not self.enabled:
+            return
+
+        # 現在と変更前のユーザー名の値を削除する
+        screen_names = {user.screen_name, getattr(user, '_previous_screen_name', None)}
+        self._get_cache().delete_many([self._make_key(s.lower()) for s in screen_names if s])
+
+    def _make_key(self, screen_name):
+        """
+        キャッシュのキーを生成する。
+
+        :param screen_name: 小文字のユーザー名
+        :type screen_name: str
+        :return: キャッシュのキー
+        :rtype: str
+        """
+        # キーを生成する
+        return 'twingo2:screen_name:%s' % screen_name
+
+    def _get_cache(self):
+        """
+        キャッシュを取得する。
+
+        :return: キャッシュ
+        :rtype: django.core.cache.backends.base.BaseCache
+        """
+        return caches[getattr(settings, 'SCREEN_NAME_CACHE_ALIAS', 'default')]
+
+
+class ApiClientCache:
+    """
+    ユーザーごとのAPIオブジェクトを保持するキャッシュ。
+    APIオブジェクトは共有できないため、プロセス内のLocalCacheのみを使用する。
+    """
+
+    def __init__(self):
+        """
+        ApiClientCacheを構築する。
+        """
+        # 内部状態を初期化する
+        self._local = None
+        self._lock = threading.Lock()
+
+    def get(self, user_id, loader):
+        """
+        指定されたIDのユーザーのAPIオブジェクトを取得する。
+        キャッシュに存在しない場合はloaderを呼び出して取得した値をキャッシュする。
+
+        :param user_id: UserのID
+        :type user_id: int
+        :param loader: APIオブジェクトを構築する関数
+        :type loader: callable
+        :return: APIオブジェクト
+        :rtype: tweepy.API
+        """
+        # キャッシュから取得する
+        local = self._get_local()
+        api = local.get(user_id)
+        if api is not None:
+            return api
+
+        # 構築してキャッシュする
+        api = loader(user_id)
+        if api is not None:
+            local.set(user_id, api, getattr(settings, 'API_CLIENT_CACHE_TIMEOUT', 300))
+        return api
+
+    def invalidate(self, user_id):
+        """
+        指定されたIDのユーザーのAPIオブジェクトをキャッシュから削除する。
+
+        :param user_id: UserのID
+        :type user_id: int
+        """
+        self._get_local().delete(user_id)
+
+    def clear(self):
+        """
+        すべてのAPIオブジェクトを破棄する。
+        """
+        with self._lock:
+            self._local = None
+
+    def _get_local(self):
+        """
+        プロセス内のキャッシュを取得する。
+
+        :return: プロセス内のキャッシュ
+        :rtype: LocalCache
+        """
+        with self._lock:
+            if self._local is None:
+                self._local = LocalCache(getattr(settings, 'API_CLIENT_CACHE_SIZE', 256))
+            return self._local
+
+
+class PrimaryPinCache:
+    """
+    書き込み直後のユーザーを記録し、一定時間はプライマリから読み込ませるためのキャッシュ。
+    レプリカの遅延により作成/更新直後のユーザーが取得できない、または古い内容で取得されることを防ぐ。
+    """
+
+    @property
+    def enabled(self):
+        """
+        キャッシュが有効であるかどうか。
+
+        :return: USER_READ_DATABASESとUSER_READ_STICKY_TIMEOUTが設定されていればTrue
+        :rtype: bool
+        """
+        # 読み込み専用のデータベースが設定されている場合のみ有効とする
+        return bool(getattr(settings, 'USER_READ_DATABASES', ())) and bool(self._get_timeout())
+
+    def pin(self, user_id):
+        """
+        指定されたIDのユーザーをUSER_READ_STICKY_TIMEOUTで指定された秒数だけプライマリに固定する。
+
+        :param user_id: UserのID
+        :type user_id: int
+        """
+        # キャッシュが無効な場合は何もしない
+        if not self.enabled:
+            return
+        self._get_cache().set(self._make_key(user_id), True, self._get_timeout())
+
+    def is_pinned(self, user_id):
+        """
+        指定されたIDのユーザーがプライマリに固定されているかどうかを判定する。
+
+        :param user_id: UserのID
+        :type user_id: int
+        :return: プライマリに固定されていればTrue
+        :rtype: bool
+        """
+        # キャッシュが無効な場合は固定しない
+        if not self.enabled:
+            return False
+        return bool(self._get_cache().get(self._make_key(user_id)))
+
+    def _make_key(self, user_id):
+        """
+        キャッシュのキーを生成する。
+
+        :param user_id: UserのID
+        :type user_id: int
+        :return: キャッシュのキー
+        :rtype: str
+        """
+        # キーを生成する
+        return 'twingo2:primary_pin:%s' % user_id
+
+    def _get_timeout(self):
+        """
+        プライマリに固定する期間を取得する。
+        レプリカの遅延の最大値より長い期間を設定すること。
+
+        :return: 有効期間(秒)
+        :rtype: float
+        """
+        return getattr(settings, 'USER_READ_STICKY_TIMEOUT', 10)
+
+    def _get_cache(self):
+        """
+        キャッシュを取得する。
+        他のプロセスで書き込んだユーザーも判定できるよう、プロセス間で共有されるキャッシュを使用すること。
+
+        :return: キャッシュ
+        :rtype: django.core.cache.backends.base.BaseCache
+        """
+        return caches[getattr(settings, 'USER_READ_STICKY_CACHE_ALIAS', 'default')]
+
+
+# get_user()の結果を保持するキャッシュ
+user_cache = UserCache()
+
+# アクセストークンとTwitter IDの対応を保持するキャッシュ
+access_token_cache = AccessTokenCache()
+
+# ユーザーごとのAPIオブジェクトを保持するキャッシュ
+api_client_cache = ApiClientCache()
+
+# ユーザー名とユーザー情報の対応を保持するキャッシュ
+screen_name_cache = ScreenNameCache()
+
+# 書き込み直後のユーザーをプライマリに固定するキャッシュ
+primary_pin_cache = PrimaryPinCache()
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import threading
+import time
+
+import requests
+
+from django.conf import settings
+
+
+class CircuitOpenError(Exception):
+    """
+    サーキットブレーカーが遮断状態であることを示す例外。
+    """
+    pass
+
+
+def is_unavailable_error(error):
+    """
+    Twitterが応答できない状態であることを示す例外であるかどうかを判定する。
+    通信エラー、タイムアウト、5xxおよび429が該当し、認証エラーなどの4xxは該当しない。
+
+    :param error: 例外
+    :type error: Exception
+    :return: Twitterが応答できない状態であればTrue
+    :rtype: bool
+    """
+    # 通信エラーとタイムアウト
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+
+    # HTTPのステータスコードで判定する
+    response = getattr(error, 'response', None)
+    status_code = getattr(error, 'status_code', getattr(response, 'status_code', None))
+    if status_code is not None:
+        return status_code >= 500 or status_code == 429
+
+    # tweepyが元の例外を包んでいる場合は元の例外で判定する
+    if error.__context__ is not None:
+        return is_unavailable_error(error.__context__)
+    return False
+
+
+class CircuitBreaker:
+    """
+    Twitterとの通信に失敗し続けた場合に一定時間通信を遮断するサーキットブレーカー。
+    プロセス内のすべてのスレッドで状態を共有する。
+    """
+
+    def __init__(self):
+        """
+        CircuitBreakerを構築する。
+        """
+        # 内部状態を初期化する
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        """
+        通信を開始する。
+
+        :return: 当オブジェクト
+        :rtype: CircuitBreaker
+        """
+        # 遮断中であれば通信せずに失敗させる
+        if not self.allow():
+            raise CircuitOpenError('Twitter is unavailable.')
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """
+        通信の結果を記録する。
+
+        :param exc_type: 例外の型
+        :type exc_type: type
+        :param exc_value: 例外
+        :type exc_value: Exception
+        :param traceback: トレースバック
+        :type traceback: traceback
+        :return: 例外を伝播させるためFalse
+        :rtype: bool
+        """
+        # 応答できない状態を示す例外のみを失敗として扱う
+        if exc_value is None or not is_unavailable_error(exc_value):
+            self.record_success()
+        else:
+            self.record_failure()
+        return False
+
+    @property
+    def is_open(self):
+        """
+        遮断中であるかどうか。
+
+        :return: 遮断中であればTrue
+        :rtype: bool
+        """
+        with self._lock:
+            return self._opened_at is not None
+
+    def allow(self):
+        """
+        通信してよいかどうかを判定する。
+        遮断から一定時間が経過した場合は、試行として1件だけ通信を許可する。
+
+        :return: 通信してよければTrue
+        :rtype: bool
+        """
+        with self._lock:
+            # 遮断していなければ許可する
+            if self._opened_at is None:
+                return True
+
+            # 一定時間が経過するまで、または試行中は許可しない
+            if self._trial or time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            self._trial = True
+            return True
+
+    def record_success(self):
+        """
+        通信の成功を記録する。
+        """
+        # 遮断を解除する
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        """
+        通信の失敗を記録する。
+        """
+        with self._lock:
+            # 試行に失敗した場合、または失敗が続いた場合は遮断する
+            self._failures += 1
+            if self._trial or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+            self._trial = False
+
+    @property
+    def retry_after(self):
+        """
+        遮断が解除されるまでの秒数。
+
+        :return: 秒数
+        :rtype: int
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return 0
+            return max(0, int(self.reset_timeout - (time.monotonic() - self._opened_at) + 0.999))
+
+    @property
+    def threshold(self):
+        """
+        遮断するまでの連続失敗回数。
+
+        :return: 回数
+        :rtype: int
+        """
+        return getattr(settings, 'TWITTER_BREAKER_THRESHOLD', 5)
+
+    @property
+    def reset_timeout(self):
+        """
+        遮断してから試行を許可するまでの秒数。
+
+        :return: 秒数
+        :rtype: float
+        """
+        return getattr(settings, 'TWITTER_BREAKER_RESET_TIMEOUT', 30)
+
+
+# Twitterとの通信で共有するサーキットブレーカー
+twitter_breaker = CircuitBreaker()
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import bz2
+import csv
+import gzip
+import io
+import json
+import lzma
+import sys
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+from twingo2.models import User
+
+
+FIELDS = (
+    'twitter_id', 'screen_name', 'name', 'description', 'location', 'url', 'profile_image_url',
+    'is_active', 'is_superuser', 'is_staff', 'password', 'last_login', 'created_at', 'updated_at',
+)
+"""入出力するUserのフィールド(主キーはデータベースごとに異なるため含めない)"""
+
+FORMATS = ('jsonl', 'csv')
+"""対応する形式"""
+
+COMPRESSIONS = {'gzip': ('.gz', gzip.open), 'bz2': ('.bz2', bz2.open), 'xz': ('.xz', lzma.open)}
+"""対応する圧縮形式と拡張子、ファイルを開く関数"""
+
+
+def detect(path):
+    """
+    ファイル名の拡張子から形式と圧縮形式を判定する。
+
+    :param path: ファイルパス
+    :type path: str
+    :return: 形式(判定できない場合はNone)と圧縮形式(圧縮しない場合はNone)
+    :rtype: tuple
+    """
+    compression = None
+    for name, (extension, _) in COMPRESSIONS.items():
+        if path.endswith(extension):
+            compression = name
+            path = path[:-len(extension)]
+    file_format = next((f for f in FORMATS if path.endswith('.' + f)), None)
+    return file_format, compression
+
+
+def open_dump(path, mode, compression=None):
+    """
+    ダンプファイルをテキストモードで開く。
+
+    :param path: ファイルパス("-"の場合は標準入出力)
+    :type path: str
+    :param mode: "r"または"w"
+    :type mode: str
+    :param compression: 圧縮形式(圧縮しない場合はNone)
+    :type compression: str
+    :return: ファイルオブジェクト
+    :rtype: io.TextIOBase
+    """
+    # 標準入出力はクローズしない
+    if path == '-':
+        stream = sys.stdin if mode == 'r' else sys.stdout
+        raw = io.open(stream.fileno(), mode + 'b', closefd=False)
+    else:
+        raw = io.open(path, mode + 'b')
+
+    # 圧縮されている場合は展開/圧縮しながら読み書きする
+    if compression is not None:
+        raw = COMPRESSIONS[compression][1](raw, mode + 'b')
+    return io.TextIOWrapper(raw, encoding='utf-8', newline='' if mode == 'r' else None)
+
+
+def iter_users(using, batch_size):
+    """
+    すべてのユーザーのFIELDSの値を主キー順に少しずつ取得する。
+    PostgreSQLではサーバーサイドカーソルを使用し、それ以外では主キーの範囲を指定して取得する。
+
+    :param using: データベースのエイリアス
+    :type using: str
+    :param batch_size: 1回に取得する件数
+    :type batch_size: int
+    :return: FIELDSの値のタプルを返却するイテレーター
+    :rtype: iterator
+    """
+    queryset = User.objects.using(using).order_by('pk')
+    connection = connections[using]
+
+    # PostgreSQLでは名前付きカーソルでbatch_size件ずつ受信する
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.values_list(*FIELDS).query.sql_with_params()
+        with transaction.atomic(using=using):
+            connection.ensure_connection()
+            with connection.connection.cursor(name='twingo2_export') as cursor:
+                cursor.itersize = batch_size
+                cursor.execute(sql, params)
+                for row in cursor:
+                    yield row
+        return
+
+    # それ以外では主キーの範囲を指定して取得する
+    last_pk = 0
+    while True:
+        rows = list(queryset.filter(pk__gt=last_pk).values_list('pk', *FIELDS)[:batch_size])
+        if not rows:
+            break
+        for row in rows:
+            yield row[1:]
+        last_pk = rows[-1][0]
+
+
+class JsonLinesWriter:
+    """
+    1行に1ユーザーのJSONを出力するクラス。
+    """
+
+    def __init__(self, f):
+        """
+        JsonLinesWriterを構築する。
+
+        :param f: 出力先
+        :type f: io.TextIOBase
+        """
+        self._f = f
+
+    def write(self, row):
+        """
+        1ユーザーを出力する。
+
+        :param row: FIELDSの値のタプル
+        :type row: tuple
+        """
+        values = {name: _to_text(value) if hasattr(value, 'isoformat') else value for name, value in zip(FIELDS, row)}
+        self._f.write(json.dumps(values, ensure_ascii=False, sort_keys=True) + '\n')
+
+
+class CsvWriter:
+    """
+    ヘッダー行に続けて1行に1ユーザーのCSVを出力するクラス。
+    """
+
+    def __init__(self, f):
+        """
+        CsvWriterを構築する。
+
+        :param f: 出力先
+        :type f: io.TextIOBase
+        """
+        self._writer = csv.writer(f, lineterminator='\n')
+        self._writer.writerow(FIELDS)
+
+    def write(self, row):
+        """
+        1ユーザーを出力する。
+
+        :param row: FIELDSの値のタプル
+        :type row: tuple
+        """
+        self._writer.writerow([_to_text(value) for value in row])
+
+
+def read_jsonl(f):
+    """
+    JSON Linesのダンプファイルからユーザーを読み込む。
+
+    :param f: 入力元
+    :type f: io.TextIOBase
+    :return: フィールド名と値の辞書を返却するイテレーター
+    :rtype: iterator
+    """
+    for line in f:
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_csv(f):
+    """
+    CSVのダンプファイルからユーザーを読み込む。
+
+    :param f: 入力元
+    :type f: io.TextIOBase
+    :return: フィールド名と値の辞書を返却するイテレーター
+    :rtype: iterator
+    """
+    return csv.DictReader(f)
+
+
+def to_python(values):
+    """
+    読み込んだ値をUserのフィールドの型に変換する。
+    NULLを許容するフィールドの空文字列はNoneとし、省略された登録日時と更新日時は現在日時とする。
+
+    :param values: フィールド名と値の辞書
+    :type values: dict
+    :return: フィールド名と変換後の値の辞書
+    :rtype: dict
+    :raises django.core.exceptions.ValidationError: 変換できない値が含まれる場合
+    """
+    converted = {}
+    for name in FIELDS:
+        field = User._meta.get_field(name)
+        value = values.get(name)
+        if value == '' and field.null:
+            value = None
+        elif value is None and (getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)):
+            value = timezone.now()
+        elif value is None and not field.null:
+            value = field.get_default()
+        converted[name] = field.to_python(value)
+    return converted
+
+
+WRITERS = {'jsonl': JsonLinesWriter, 'csv': CsvWriter}
+"""形式ごとの出力クラス"""
+
+READERS = {'jsonl': read_jsonl, 'csv': read_csv}
+"""形式ごとの読み込み関数"""
+
+
+def _to_text(value):
+    """
+    値をCSVに出力する文字列に変換する。
+
+    :param value: 値
+    :type value: object
+    :return: 文字列(Noneの場合は空文字列)
+    :rtype: str
+    """
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
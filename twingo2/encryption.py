@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import functools
+import hashlib
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+except ImportError:
+    Fernet = MultiFernet = None
+
+    class InvalidToken(Exception):
+        """
+        cryptographyがインストールされていない場合の代替となる例外。
+        """
+
+
+def is_enabled():
+    """
+    アクセストークンの暗号化保存が有効であるかどうかを判定する。
+
+    :return: TOKEN_ENCRYPTION_KEYSが設定されていればTrue
+    :rtype: bool
+    """
+    # 暗号鍵が設定されている場合のみ有効とする
+    return bool(getattr(settings, 'TOKEN_ENCRYPTION_KEYS', None))
+
+
+def get_key_id(key):
+    """
+    暗号鍵を識別するIDを取得する。
+    暗号鍵そのものを保存しないようにハッシュ値の先頭を使用する。
+
+    :param key: 暗号鍵
+    :type key: str
+    :return: 暗号鍵のID
+    :rtype: str
+    """
+    # SHA-256の先頭16文字をIDとする
+    return hashlib.sha256(key.encode('ascii')).hexdigest()[:16]
+
+
+def get_primary_key_id():
+    """
+    暗号化に使用する暗号鍵のIDを取得する。
+
+    :return: TOKEN_ENCRYPTION_KEYSの先頭の暗号鍵のID
+    :rtype: str
+    """
+    return get_key_id(_get_keys()[0])
+
+
+def encrypt(value):
+    """
+    文字列を暗号化する。
+
+    :param value: 暗号化する文字列
+    :type value: str
+    :return: 暗号文と暗号化に使用した暗号鍵のID
+    :rtype: tuple
+    """
+    # 先頭の暗号鍵で暗号化する
+    keys = _get_keys()
+    token = _get_fernet(keys).encrypt(value.encode('utf-8'))
+    return token.decode('ascii'), get_key_id(keys[0])
+
+
+def decrypt(token):
+    """
+    暗号文を復号する。
+    TOKEN_ENCRYPTION_KEYSに含まれるいずれかの暗号鍵で暗号化されていれば復号できる。
+
+    :param token: 暗号文
+    :type token: str
+    :return: 復号した文字列
+    :rtype: str
+    :raises twingo2.encryption.InvalidToken: 復号できなかった場合
+    """
+    # 設定されたすべての暗号鍵で復号を試みる
+    return _get_fernet(_get_keys()).decrypt(token.encode('ascii')).decode('utf-8')
+
+
+def rotate(token):
+    """
+    暗号文を先頭の暗号鍵で暗号化し直す。
+
+    :param token: 暗号文
+    :type token: str
+    :return: 新しい暗号文と暗号化に使用した暗号鍵のID
+    :rtype: tuple
+    :raises twingo2.encryption.InvalidToken: 復号できなかった場合
+    """
+    # 復号して先頭の暗号鍵で暗号化し直す
+    return encrypt(decrypt(token))
+
+
+def _get_keys():
+    """
+    設定された暗号鍵を取得する。
+
+    :return: 暗号鍵のタプル(先頭が暗号化に使用する暗号鍵)
+    :rtype: tuple
+    :raises django.core.exceptions.ImproperlyConfigured: 暗号化を利用できない場合
+    """
+    # 暗号化に必要な設定とパッケージをチェックする
+    keys = getattr(settings, 'TOKEN_ENCRYPTION_KEYS', None)
+    if not keys:
+        raise ImproperlyConfigured('TOKEN_ENCRYPTION_KEYS must be set to store access tokens.')
+    if Fernet is None:
+        raise ImproperlyConfigured('The cryptography package is required to store access tokens.')
+    return tuple(keys)
+
+
+@functools.lru_cache(maxsize=8)
+def _get_fernet(keys):
+    """
+    暗号鍵からMultiFernetを構築する。
+    設定が変わらない限り同じオブジェクトを再利用する。
+
+    :param keys: 暗号鍵のタプル
+    :type keys: tuple
+    :return: MultiFernetオブジェクト
+    :rtype: cryptography.fernet.MultiFernet
+    """
+    return MultiFernet([Fernet(key) for key in keys])
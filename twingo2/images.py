@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import io
+import logging
+import re
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage, get_storage_class
+from django.core.urlresolvers import reverse
+from django.db import connection
+
+from twingo2.models import ProfileImage
+from twingo2.transport import get_timeout, get_transport
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+"""保存する画像の形式と拡張子の対応"""
+
+
+def is_enabled():
+    """
+    プロフィール画像のローカル保存が有効であるかどうかを判定する。
+
+    :return: PROFILE_IMAGE_CACHE_ENABLEDが設定されていればTrue
+    :rtype: bool
+    """
+    return getattr(settings, 'PROFILE_IMAGE_CACHE_ENABLED', False)
+
+
+def get_sizes():
+    """
+    生成するサムネイルの大きさを取得する。
+
+    :return: サムネイルの一辺のピクセル数のタプル(昇順)
+    :rtype: tuple
+    """
+    return tuple(sorted(getattr(settings, 'PROFILE_IMAGE_SIZES', (48, 96, 200))))
+
+
+def get_storage():
+    """
+    プロフィール画像を保存するストレージを取得する。
+
+    :return: ストレージ
+    :rtype: django.core.files.storage.Storage
+    """
+    # 指定されていない場合はデフォルトのストレージを使用する
+    storage_class = getattr(settings, 'PROFILE_IMAGE_STORAGE', None)
+    if storage_class is None:
+        return default_storage
+    return get_storage_class(storage_class)()
+
+
+def get_name(digest, extension, size=None):
+    """
+    画像の名前を取得する。
+    同じ内容の画像は同じ名前になるため、一度保存した画像が書き換えられることはない。
+
+    :param digest: 画像のSHA-256ハッシュ値
+    :type digest: str
+    :param extension: 拡張子
+    :type extension: str
+    :param size: サムネイルの大きさ(元の画像の場合はNone)
+    :type size: int
+    :return: 画像の名前
+    :rtype: str
+    """
+    suffix = '' if size is None else '_%d' % size
+    return '%s%s.%s' % (digest, suffix, extension)
+
+
+def get_path(name):
+    """
+    画像のストレージ上のパスを取得する。
+    1つのディレクトリにファイルが集中しないよう、ハッシュ値の先頭2文字で振り分ける。
+
+    :param name: 画像の名前
+    :type name: str
+    :return: ストレージ上のパス
+    :rtype: str
+    """
+    return 'twingo2/profile_images/%s/%s' % (name[:2], name)
+
+
+def get_profile_image_url(user, size=None):
+    """
+    ユーザーのプロフィール画像のURLを取得する。
+    ローカルに保存されていない、またはTwitterの画像が変更されている場合はTwitterのURLを返却し、取得を予約する。
+    一覧画面ではselect_related('profile_image')で取得したユーザーを渡すこと。
+
+    :param user: ユーザー情報
+    :type user: twingo2.models.User
+    :param size: 必要な大きさ(指定した大きさ以上で最小のサムネイルを使用する。Noneの場合は元の画像)
+    :type size: int
+    :return: プロフィール画像のURL
+    :rtype: str
+    """
+    # 無効な場合はTwitterのURLを返す
+    if not is_enabled() or not user.profile_image_url:
+        return user.profile_image_url
+
+    # 保存されていない、または古い場合は取得を予約してTwitterのURLを返す
+    try:
+        profile_image = user.profile_image
+    except ProfileImage.DoesNotExist:
+        profile_image = None
+    if profile_image is None or profile_image.source_url != user.profile_image_url:
+        pipeline.schedule(user.pk, user.profile_image_url)
+        return user.profile_image_url
+
+    # 指定された大きさ以上で最小のサムネイルを選択する
+    thumbnail_size = None
+    if size is not None:
+        thumbnail_size = next((s for s in get_sizes() if s >= size), None)
+    extension = profile_image.extension if thumbnail_size is None else get_thumbnail_extension(profile_image.extension)
+    name = get_name(profile_image.digest, extension, thumbnail_size)
+    return reverse('twingo2_profile_image', kwargs={'name': name})
+
+
+def get_thumbnail_extension(extension):
+    """
+    サムネイルの拡張子を取得する。
+    JPEG以外の画像はPNGに変換する。
+
+    :param extension: 元の画像の拡張子
+    :type extension: str
+    :return: サムネイルの拡張子
+    :rtype: str
+    """
+    return 'jpg' if extension == 'jpg' else 'png'
+
+
+def get_source_url(profile_image_url):
+    """
+    取得する画像のURLを取得する。
+    profile_image_urlは48x48の画像を指すため、サイズ指定を除いた元の画像を取得する。
+
+    :param profile_image_url: プロフィール画像のURL
+    :type profile_image_url: str
+    :return: 取得する画像のURL
+    :rtype: str
+    """
+    return re.sub(r'_normal(\.\w+)?$', r'\1', profile_image_url)
+
+
+class ProfileImagePipeline:
+    """
+    プロフィール画像を取得し、サムネイルを生成してストレージに保存するパイプライン。
+    処理はスレッドプールで非同期に実行する。
+    """
+
+    def __init__(self):
+        """
+        ProfileImagePipelineを構築する。
+        """
+        # 内部状態を初期化する
+        self._executor = None
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def schedule(self, user_id, url):
+        """
+        プロフィール画像の取得を予約する。
+        同じユーザーの処理が予約済みの場合は何もしない。
+
+        :param user_id: UserのID
+        :type user_id: int
+        :param url: プロフィール画像のURL
+        :type url: str
+        """
+        # 重複して予約しない
+        with self._lock:
+            if user_id in self._pending:
+                return
+            self._pending.add(user_id)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=getattr(settings, 'PROFILE_IMAGE_WORKERS', 2))
+            executor = self._executor
+        executor.submit(self._run, user_id, url)
+
+    def refresh(self, user_id, url):
+        """
+        プロフィール画像を取得して保存する。
+        保存済みの画像と取得元のURLが同じ場合は何もしない。
+
+        :param user_id: UserのID
+        :type user_id: int
+        :param url: プロフィール画像のURL
+        :type url: str
+        :return: 保存した場合はTrue
+        :rtype: bool
+        """
+        # 変更されていない場合は取得しない
+        if ProfileImage.objects.filter(pk=user_id, source_url=url).exists():
+            return False
+
+        # 画像を取得し、内容のハッシュ値を名前として保存する
+        content = self._fetch(get_source_url(url))
+        digest = hashlib.sha256(content).hexdigest()
+        extension = self._save(digest, content)
+
+        # 保存した画像を記録する
+        ProfileImage.objects.update_or_create(
+            user_id=user_id, defaults={'source_url': url, 'digest': digest, 'extension': extension}
+        )
+        return True
+
+    def shutdown(self):
+        """
+        予約済みの処理の完了を待ってスレッドプールを破棄する。
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def _run(self, user_id, url):
+        """
+        ワーカースレッドでプロフィール画像を取得して保存する。
+
+        :param user_id: UserのID
+        :type user_id: int
+        :param url: プロフィール画像のURL
+        :type url: str
+        """
+        try:
+            self.refresh(user_id, url)
+        except Exception:
+            logger.exception('Failed to refresh the profile image of user %s.', user_id)
+        finally:
+            # ワーカースレッドのデータベース接続を閉じる
+            with self._lock:
+                self._pending.discard(user_id)
+            connection.close()
+
+    def _fetch(self, url):
+        """
+        画像を取得する。
+
+        :param url: 画像のURL
+        :type url: str
+        :return: 画像のバイト列
+        :rtype: bytes
+        :raises ValueError: 取得できなかった場合、または上限を超える大きさの場合
+        """
+        # 共有のコネクションプールを使用して取得する
+        max_size = getattr(settings, 'PROFILE_IMAGE_MAX_SIZE', 5 * 1024 * 1024)
+        with get_transport().session() as session:
+            response = session.get(url, stream=True, timeout=get_timeout())
+            try:
+                if response.status_code != 200:
+                    raise ValueError('Failed to fetch %s: HTTP %d' % (url, response.status_code))
+                content = response.raw.read(max_size + 1, decode_content=True)
+            finally:
+                response.close()
+        if len(content) > max_size:
+            raise ValueError('The image at %s exceeds %d bytes.' % (url, max_size))
+        return content
+
+    def _save(self, digest, content):
+        """
+        元の画像とサムネイルをストレージに保存する。
+        同じ名前のファイルが存在する場合は保存しない。
+
+        :param digest: 画像のSHA-256ハッシュ値
+        :type digest: str
+        :param content: 画像のバイト列
+        :type content: bytes
+        :return: 元の画像の拡張子
+        :rtype: str
+        :raises ValueError: 画像として読み込めない場合
+        """
+        # サムネイルの生成にはPillowが必要
+        if Image is None:
+            raise ImproperlyConfigured('Pillow is required to cache profile images.')
+
+        # 画像の形式を判定する
+        try:
+            image = Image.open(io.BytesIO(content))
+            image.load()
+        except (IOError, SyntaxError) as e:
+            raise ValueError('Invalid image: %s' % e)
+        extension = EXTENSIONS.get(image.format)
+        if extension is None:
+            raise ValueError('Unsupported image format: %s' % image.format)
+
+        # 元の画像を保存する
+        storage = get_storage()
+        self._save_file(storage, get_path(get_name(digest, extension)), content)
+
+        # サムネイルを生成して保存する
+        thumbnail_extension = get_thumbnail_extension(extension)
+        for size in get_sizes():
+            name = get_path(get_name(digest, thumbnail_extension, size))
+            if storage.exists(name):
+                continue
+            thumbnail = image.convert('RGB' if thumbnail_extension == 'jpg' else 'RGBA')
+            thumbnail.thumbnail((size, size), Image.LANCZOS)
+            output = io.BytesIO()
+            thumbnail.save(output, 'JPEG' if thumbnail_extension == 'jpg' else 'PNG')
+            self._save_file(storage, name, output.getvalue())
+        return extension
+
+    def _save_file(self, storage, name, content):
+        """
+        ファイルが存在しない場合のみ保存する。
+
+        :param storage: ストレージ
+        :type storage: django.core.files.storage.Storage
+        :param name: ストレージ上の名前
+        :type name: str
+        :param content: ファイルの内容
+        :type content: bytes
+        """
+        if not storage.exists(name):
+            storage.save(name, ContentFile(content))
+
+
+# プロセス内で共有するパイプライン
+pipeline = ProfileImagePipeline()
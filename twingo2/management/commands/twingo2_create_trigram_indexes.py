@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router
+
+from twingo2 import search
+from twingo2.models import User
+
+
+class Command(BaseCommand):
+    """
+    PostgreSQLでpg_trgmによる検索対象のフィールドの索引を作成するコマンド。
+    CREATE INDEX CONCURRENTLYで作成するため、稼働中のデータベースでもテーブルへの書き込みを妨げない。
+    """
+
+    help = ('Create the pg_trgm indexes used by User.objects.search() on PostgreSQL without blocking writes. '
+            'The pg_trgm extension is created if missing, which requires a superuser before PostgreSQL 13.')
+
+    def add_arguments(self, parser):
+        """
+        コマンドライン引数を定義する。
+
+        :param parser: 引数のパーサー
+        :type parser: argparse.ArgumentParser
+        """
+        parser.add_argument(
+            '--database', dest='database', default=None,
+            help='Database to create the indexes in (default: the database users are written to).'
+        )
+
+    def handle(self, *args, **options):
+        """
+        索引を作成する。
+
+        :param args: 位置引数
+        :type args: tuple
+        :param options: コマンドラインオプション
+        :type options: dict
+        """
+        # データベースをチェックする
+        using = options['database'] or router.db_for_write(User)
+        connection = connections[using]
+        if connection.vendor != 'postgresql':
+            raise CommandError('Trigram indexes are only supported on PostgreSQL.')
+
+        # CREATE INDEX CONCURRENTLYはトランザクション内で実行できないため、自動コミットで1文ずつ実行する
+        if connection.in_atomic_block:
+            raise CommandError('Trigram indexes cannot be created inside a transaction.')
+        qn = connection.ops.quote_name
+        table = qn(User._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            for field_name in search.SEARCH_FIELDS:
+                # icontainsはUPPER("フィールド"::text) LIKE UPPER(%s)として比較されるため、同じ式で索引を作成する
+                column = qn(User._meta.get_field(field_name).column)
+                cursor.execute(
+                    'CREATE INDEX CONCURRENTLY IF NOT EXISTS %s ON %s USING gin (UPPER(%s::text) gin_trgm_ops)' % (
+                        qn('twingo2_user_%s_trgm' % field_name), table, column
+                    )
+                )
+                self.stdout.write('Created index on %s.' % field_name)
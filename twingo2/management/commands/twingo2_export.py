@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from twingo2 import dump
+
+
+class Command(BaseCommand):
+    """
+    ユーザーをJSON LinesまたはCSVのダンプファイルに出力するコマンド。
+    """
+
+    help = 'Stream all users to a JSON Lines or CSV dump, optionally compressed.'
+
+    def add_arguments(self, parser):
+        """
+        コマンドライン引数を定義する。
+
+        :param parser: 引数のパーサー
+        :type parser: argparse.ArgumentParser
+        """
+        parser.add_argument(
+            'path', nargs='?', default='-',
+            help='Output file ("-" for stdout). The format and compression are inferred from the extension.'
+        )
+        parser.add_argument(
+            '--format', choices=dump.FORMATS, dest='format', default=None,
+            help='Output format (default: from the extension, otherwise jsonl).'
+        )
+        parser.add_argument(
+            '--compress', choices=sorted(dump.COMPRESSIONS), dest='compress', default=None,
+            help='Compression (default: from the extension, otherwise none).'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, dest='batch_size', default=2000,
+            help='Number of rows fetched from the database at a time.'
+        )
+        parser.add_argument(
+            '--database', dest='database', default=DEFAULT_DB_ALIAS,
+            help='Database to export from.'
+        )
+
+    def handle(self, *args, **options):
+        """
+        ユーザーを出力する。
+
+        :param args: 位置引数
+        :type args: tuple
+        :param options: コマンドラインオプション
+        :type options: dict
+        """
+        # 引数をチェックする
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be a positive integer.')
+        file_format, compression = dump.detect(options['path'])
+        file_format = options['format'] or file_format or 'jsonl'
+        compression = options['compress'] or compression
+
+        # 1件ずつ書き出す
+        exported = 0
+        with dump.open_dump(options['path'], 'w', compression) as f:
+            writer = dump.WRITERS[file_format](f)
+            for row in dump.iter_users(options['database'], batch_size):
+                writer.write(row)
+                exported += 1
+        self.stderr.write('%d users exported.' % exported)
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import io
+import sys
+
+from tweepy.error import TweepError
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, router, transaction
+
+from twingo2 import search
+from twingo2.backends import get_profile
+from twingo2.models import User, UserSearchToken
+from twingo2.twitter import LOOKUP_USERS_LIMIT, chunked, get_app_api
+
+
+class Command(BaseCommand):
+    """
+    Twitter IDまたはユーザー名の一覧からユーザーを一括登録するコマンド。
+    """
+
+    help = 'Import users from a list of Twitter IDs or screen names.'
+
+    def add_arguments(self, parser):
+        """
+        コマンドライン引数を定義する。
+
+        :param parser: 引数のパーサー
+        :type parser: argparse.ArgumentParser
+        """
+        parser.add_argument(
+            'path', nargs='?', default='-',
+            help='File containing one Twitter ID or screen name per line ("-" for stdin).'
+        )
+        parser.add_argument(
+            '--screen-name', action='store_true', dest='screen_name', default=False,
+            help='Treat each line as a screen name instead of a Twitter ID.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, dest='batch_size', default=1000,
+            help='Number of users written per bulk INSERT.'
+        )
+
+    def handle(self, *args, **options):
+        """
+        ユーザーを一括登録する。
+
+        :param args: 位置引数
+        :type args: tuple
+        :param options: コマンドラインオプション
+        :type options: dict
+        """
+        # 引数をチェックする
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be a positive integer.')
+
+        # 入力を100件ずつTwitterで解決し、未登録のユーザーを登録する
+        api = get_app_api()
+        admin_twitter_id = getattr(settings, 'ADMIN_TWITTER_ID', ())
+        seen_twitter_ids = set()
+        pending_users = []
+        imported = 0
+        with self._open(options['path']) as lines:
+            for keys in chunked(self._read_keys(lines, options['screen_name']), LOOKUP_USERS_LIMIT):
+                # 未登録のユーザーのみを抽出する
+                twitter_users = [u for u in self._lookup_users(api, keys, options['screen_name'])
+                                 if u.id not in seen_twitter_ids]
+                seen_twitter_ids.update(u.id for u in twitter_users)
+                registered = set(User.objects.filter(
+                    twitter_id__in=[u.id for u in twitter_users]
+                ).values_list('twitter_id', flat=True))
+
+                # 登録するユーザーを構築する
+                for twitter_user in twitter_users:
+                    if twitter_user.id in registered:
+                        continue
+                    is_superuser = twitter_user.id in admin_twitter_id
+                    pending_users.append(User.objects._build_user(
+                        twitter_user.id,
+                        is_superuser=is_superuser,
+                        is_staff=is_superuser,
+                        **get_profile(twitter_user)
+                    ))
+
+                # 一定件数ごとに登録する
+                while len(pending_users) >= batch_size:
+                    imported += self._save(pending_users[:batch_size])
+                    pending_users = pending_users[batch_size:]
+
+        # 残りのユーザーを登録する
+        if pending_users:
+            imported += self._save(pending_users)
+        self.stdout.write('%d users imported.' % imported)
+
+    def _open(self, path):
+        """
+        入力ファイルを開く。
+
+        :param path: ファイルパス("-"の場合は標準入力)
+        :type path: str
+        :return: 入力ファイル
+        :rtype: io.TextIOBase
+        """
+        # 標準入力はクローズしない
+        if path == '-':
+            return io.open(sys.stdin.fileno(), encoding='utf-8', closefd=False)
+        return io.open(path, encoding='utf-8')
+
+    def _read_keys(self, lines, screen_name):
+        """
+        入力からTwitter IDまたはユーザー名を読み込む。
+
+        :param lines: 入力ファイル
+        :type lines: io.TextIOBase
+        :param screen_name: ユーザー名として扱う場合はTrue
+        :type screen_name: bool
+        :return: Twitter IDまたはユーザー名を返すジェネレーター
+        :rtype: generator
+        """
+        for line in lines:
+            # 空行とコメントは読み飛ばす
+            key = line.strip()
+            if not key or key.startswith('#'):
+                continue
+
+            # 入力値を変換する
+            if screen_name:
+                yield key.lstrip('@')
+            else:
+                try:
+                    yield int(key)
+                except ValueError:
+                    raise CommandError('Invalid Twitter ID: %s' % key)
+
+    def _lookup_users(self, api, keys, screen_name):
+        """
+        Twitterからユーザー情報を一括取得する。
+
+        :param api: APIオブジェクト
+        :type api: tweepy.API
+        :param keys: Twitter IDまたはユーザー名のリスト
+        :type keys: list
+        :param screen_name: ユーザー名として扱う場合はTrue
+        :type screen_name: bool
+        :return: Twitterのユーザー情報のリスト
+        :rtype: list
+        """
+        try:
+            if screen_name:
+                return api.lookup_users(screen_names=keys)
+            else:
+                return api.lookup_users(user_ids=keys)
+        except TweepError as e:
+            # いずれのユーザーも存在しない場合は404が返却される
+            if e.response is not None and e.response.status_code == 404:
+                return []
+            raise CommandError('Failed to look up users: %s' % e)
+
+    def _save(self, users):
+        """
+        ユーザーを一括登録する。
+        並行して登録されたユーザーと衝突した場合は1件ずつ登録し直す。
+
+        :param users: 登録するユーザーのリスト
+        :type users: list
+        :return: 登録した件数
+        :rtype: int
+        """
+        # 一括登録する
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create(users)
+
+                # bulk_create()はシグナルを送信しないため、登録したユーザーのトークン索引を作成する
+                if search.uses_token_index(router.db_for_write(User)):
+                    UserSearchToken.objects.index_users(list(User.objects.filter(
+                        twitter_id__in=[user.twitter_id for user in users]
+                    ).only('pk', *search.SEARCH_FIELDS)))
+            return len(users)
+        except IntegrityError:
+            pass
+
+        # 1件ずつ登録する
+        imported = 0
+        for user in users:
+            extra_fields = {f: getattr(user, f) for f in User.PROFILE_FIELDS}
+            user, created = User.objects.create_or_get_user(
+                twitter_id=user.twitter_id,
+                is_superuser=user.is_superuser,
+                **extra_fields
+            )
+            if created:
+                imported += 1
+        return imported
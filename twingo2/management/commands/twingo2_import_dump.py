@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import csv
+import io
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connections, transaction
+
+from twingo2 import dump, search
+from twingo2.models import User, UserSearchToken, get_batch_size
+from twingo2.twitter import chunked
+
+
+class Command(BaseCommand):
+    """
+    twingo2_exportで出力したダンプファイルからユーザーを登録するコマンド。
+    """
+
+    help = 'Load users from a dump written by twingo2_export. Existing Twitter IDs are skipped.'
+
+    def add_arguments(self, parser):
+        """
+        コマンドライン引数を定義する。
+
+        :param parser: 引数のパーサー
+        :type parser: argparse.ArgumentParser
+        """
+        parser.add_argument(
+            'path', nargs='?', default='-',
+            help='Dump file ("-" for stdin). The format and compression are inferred from the extension.'
+        )
+        parser.add_argument(
+            '--format', choices=dump.FORMATS, dest='format', default=None,
+            help='Input format (default: from the extension, otherwise jsonl).'
+        )
+        parser.add_argument(
+            '--compress', choices=sorted(dump.COMPRESSIONS), dest='compress', default=None,
+            help='Compression (default: from the extension, otherwise none).'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, dest='batch_size', default=2000,
+            help='Number of rows loaded per COPY or INSERT batch. The whole import runs in a single transaction.'
+        )
+        parser.add_argument(
+            '--database', dest='database', default=DEFAULT_DB_ALIAS,
+            help='Database to load into.'
+        )
+
+    def handle(self, *args, **options):
+        """
+        ユーザーを登録する。
+
+        :param args: 位置引数
+        :type args: tuple
+        :param options: コマンドラインオプション
+        :type options: dict
+        """
+        # 引数をチェックする
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be a positive integer.')
+        file_format, compression = dump.detect(options['path'])
+        file_format = options['format'] or file_format or 'jsonl'
+        compression = options['compress'] or compression
+        using = options['database']
+
+        # batch_size件ずつ読み込んで登録する
+        with dump.open_dump(options['path'], 'r', compression) as f:
+            batches = chunked(self._read(dump.READERS[file_format](f)), batch_size)
+            try:
+                if connections[using].vendor == 'postgresql':
+                    imported = self._copy(using, batches)
+                else:
+                    # 途中の行で失敗した場合に先行するバッチのみが登録されないよう、全体を1つのトランザクションで登録する
+                    with transaction.atomic(using=using):
+                        imported = sum(self._insert(using, batch) for batch in batches)
+            except IntegrityError as e:
+                raise CommandError('Failed to load users: %s' % e)
+        self.stdout.write('%d users imported.' % imported)
+
+    def _read(self, rows):
+        """
+        読み込んだ値をUserのフィールドの型に変換する。
+
+        :param rows: フィールド名と値の辞書のイテレーター
+        :type rows: iterator
+        :return: フィールド名と変換後の値の辞書を返却するイテレーター
+        :rtype: iterator
+        """
+        for line_number, row in enumerate(rows, 1):
+            try:
+                yield dump.to_python(row)
+            except ValidationError as e:
+                raise CommandError('Invalid row %d: %s' % (line_number, '; '.join(e.messages)))
+
+    def _copy(self, using, batches):
+        """
+        PostgreSQLのCOPYで一時テーブルに読み込み、登録されていないTwitter IDのユーザーのみを登録する。
+
+        :param using: データベースのエイリアス
+        :type using: str
+        :param batches: 変換後の値の辞書のリストのイテレーター
+        :type batches: iterator
+        :return: 登録した件数
+        :rtype: int
+        """
+        connection = connections[using]
+        qn = connection.ops.quote_name
+        table = qn(User._meta.db_table)
+        columns = ', '.join(qn(User._meta.get_field(name).column) for name in dump.FIELDS)
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            # 一時テーブルにbatch_size件ずつCOPYする
+            cursor.execute(
+                'CREATE TEMPORARY TABLE twingo2_import_dump ON COMMIT DROP AS SELECT %s FROM %s WITH NO DATA' % (
+                    columns, table
+                )
+            )
+            for batch in batches:
+                buffer = io.StringIO()
+                writer = csv.writer(buffer, lineterminator='\n')
+                for values in batch:
+                    writer.writerow([self._to_copy_text(values[name]) for name in dump.FIELDS])
+                buffer.seek(0)
+                cursor.cursor.copy_expert(
+                    "COPY twingo2_import_dump (%s) FROM STDIN WITH (FORMAT csv, NULL '\\N')" % columns, buffer
+                )
+
+            # 登録されていないTwitter IDのみを1文で登録する
+            twitter_id = qn(User._meta.get_field('twitter_id').column)
+            cursor.execute(
+                'INSERT INTO %(table)s (%(columns)s) '
+                'SELECT DISTINCT ON (%(twitter_id)s) %(columns)s FROM twingo2_import_dump d '
+                'WHERE NOT EXISTS (SELECT 1 FROM %(table)s u WHERE u.%(twitter_id)s = d.%(twitter_id)s) '
+                'ORDER BY %(twitter_id)s' % {'table': table, 'columns': columns, 'twitter_id': twitter_id}
+            )
+            return cursor.rowcount
+
+    def _insert(self, using, batch):
+        """
+        登録されていないTwitter IDのユーザーのみを一括登録する。
+        auto_now/auto_now_addによる日時の上書きを避けるため、bulk_create()ではなくexecutemany()で挿入する。
+
+        :param using: データベースのエイリアス
+        :type using: str
+        :param batch: 変換後の値の辞書のリスト
+        :type batch: list
+        :return: 登録した件数
+        :rtype: int
+        """
+        # 登録済みのTwitter IDとバッチ内で重複したTwitter IDを除く
+        # (Twitter IDの検索はデータベースのパラメーター数の上限に収まるように分割する)
+        lookup_size = get_batch_size(using, 1, len(batch))
+        registered = set()
+        for twitter_ids in chunked([values['twitter_id'] for values in batch], lookup_size):
+            registered.update(User.objects.using(using).filter(
+                twitter_id__in=twitter_ids
+            ).values_list('twitter_id', flat=True))
+        rows = {}
+        for values in batch:
+            if values['twitter_id'] not in registered:
+                rows[values['twitter_id']] = values
+        if not rows:
+            return 0
+
+        # 一括登録する
+        connection = connections[using]
+        qn = connection.ops.quote_name
+        fields = [User._meta.get_field(name) for name in dump.FIELDS]
+        sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+            qn(User._meta.db_table), ', '.join(qn(f.column) for f in fields), ', '.join(['%s'] * len(fields))
+        )
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, [
+                [f.get_db_prep_save(values[f.name], connection=connection) for f in fields] for values in rows.values()
+            ])
+
+        # シグナルが送信されないため、登録したユーザーのトークン索引を作成する
+        if search.uses_token_index(using):
+            for twitter_ids in chunked(list(rows), lookup_size):
+                UserSearchToken.objects.db_manager(using).index_users(list(User.objects.using(using).filter(
+                    twitter_id__in=twitter_ids
+                ).only('pk', *search.SEARCH_FIELDS)))
+        return len(rows)
+
+    def _to_copy_text(self, value):
+        """
+        値をCOPYのCSVに出力する文字列に変換する。
+
+        :param value: 値
+        :type value: object
+        :return: 文字列(Noneの場合は\\N)
+        :rtype: str
+        """
+        if value is None:
+            return '\\N'
+        if isinstance(value, bool):
+            return 't' if value else 'f'
+        if hasattr(value, 'isoformat'):
+            return value.isoformat()
+        return str(value)
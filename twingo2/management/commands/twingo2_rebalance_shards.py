@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Max
+
+from twingo2 import sharding
+from twingo2.models import User
+
+
+class Command(BaseCommand):
+    """
+    Twitter IDに対応しないシャードに格納されているユーザーを、対応するシャードに移動するコマンド。
+    シャードを追加した後や、シャーディングを有効にする前のデータベースから移行する場合に使用する。
+    """
+
+    help = 'Move users to the shard that their Twitter ID maps to.'
+
+    def add_arguments(self, parser):
+        """
+        コマンドライン引数を定義する。
+
+        :param parser: 引数のパーサー
+        :type parser: argparse.ArgumentParser
+        """
+        parser.add_argument(
+            '--from', action='append', dest='sources', default=[],
+            help='Additional database to move every user out of (e.g. the database used before sharding). '
+                 'Can be given more than once.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, dest='batch_size', default=500,
+            help='Number of users checked per transaction.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true', dest='dry_run', default=False,
+            help='Only count the users that would be moved.'
+        )
+
+    def handle(self, *args, **options):
+        """
+        ユーザーを移動する。
+
+        :param args: 位置引数
+        :type args: tuple
+        :param options: コマンドラインオプション
+        :type options: dict
+        """
+        # 引数と設定をチェックする
+        batch_size = options['batch_size']
+        if batch_size <= 0:
+            raise CommandError('--batch-size must be a positive integer.')
+        if not sharding.is_enabled():
+            raise CommandError('USER_SHARD_DATABASES is not set.')
+        shards = sharding.get_shards()
+        for source in options['sources']:
+            if source not in connections:
+                raise CommandError('Unknown database: %s' % source)
+
+        # 移行前のシャード(USER_SHARD_PREVIOUS_DATABASES)も移動元とする
+        sources = list(shards)
+        for source in options['sources'] + list(sharding.get_previous_shards()):
+            if source not in sources:
+                sources.append(source)
+
+        # 移動したユーザーを再度処理しないよう、開始時点の主キーの最大値までを対象とする
+        max_pks = {source: User.objects.using(source).aggregate(max_pk=Max('pk'))['max_pk'] or 0 for source in sources}
+
+        # シャードと移行元のデータベースを主キー順に少しずつ処理する
+        checked = moved = 0
+        for source in sources:
+            last_pk = 0
+            while True:
+                # 次のバッチを取得する
+                users = list(User.objects.using(source).filter(pk__gt=last_pk, pk__lte=max_pks[source]).order_by(
+                    'pk'
+                )[:batch_size])
+                if not users:
+                    break
+                last_pk = users[-1].pk
+
+                # 対応しないシャードに格納されているユーザーを移動する
+                misplaced = [user for user in users if sharding.get_shard(user.twitter_id) != source]
+                if misplaced and not options['dry_run']:
+                    User.objects.db_manager(source).move_to_shards(misplaced)
+                checked += len(users)
+                moved += len(misplaced)
+
+        if options['dry_run']:
+            self.stdout.write('%d users checked, %d users would be moved.' % (checked, moved))
+        else:
+            self.stdout.write('%d users checked, %d users moved.' % (checked, moved))
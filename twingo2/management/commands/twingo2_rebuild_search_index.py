@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import router, transaction
+
+from twingo2 import search
+from twingo2.models import User, UserSearchToken
+
+
+class Command(BaseCommand):
+    """
+    登録済みユーザーの検索用のトークン索引を作成し直すコマンド。
+    """
+
+    help = 'Rebuild the token index used by User.objects.search().'
+
+    def add_arguments(self, parser):
+        """
+        コマンドライン引数を定義する。
+
+        :param parser: 引数のパーサー
+        :type parser: argparse.ArgumentParser
+        """
+        parser.add_argument(
+            '--batch-size', type=int, dest='batch_size', default=1000,
+            help='Number of users indexed per transaction.'
+        )
+
+    def handle(self, *args, **options):
+        """
+        トークン索引を作成し直す。
+
+        :param args: 位置引数
+        :type args: tuple
+        :param options: コマンドラインオプション
+        :type options: dict
+        """
+        # 引数と設定をチェックする
+        batch_size = options['batch_size']
+        if batch_size <= 0:
+            raise CommandError('--batch-size must be a positive integer.')
+        if not search.uses_token_index(router.db_for_write(UserSearchToken)):
+            raise CommandError(
+                'USER_SEARCH_INDEX_ENABLED is not set or the database provides native search indexes.'
+            )
+
+        # ユーザーを主キー順に少しずつ処理する
+        last_pk = 0
+        indexed = 0
+        while True:
+            # 次のバッチを取得する
+            users = list(User.objects.filter(pk__gt=last_pk).order_by('pk').only('pk', *search.SEARCH_FIELDS)[
+                :batch_size
+            ])
+            if not users:
+                break
+
+            # トークンを作成し直す
+            with transaction.atomic():
+                UserSearchToken.objects.index_users(users)
+            indexed += len(users)
+            last_pk = users[-1].pk
+
+        self.stdout.write('%d users indexed.' % indexed)
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from django.core.management.base import BaseCommand, CommandError
+
+from twingo2 import encryption
+from twingo2.models import AccessToken
+
+
+class Command(BaseCommand):
+    """
+    保存されたアクセストークンを現在の暗号鍵で暗号化し直すコマンド。
+    """
+
+    help = 'Re-encrypt stored access tokens with the first key of TOKEN_ENCRYPTION_KEYS.'
+
+    def add_arguments(self, parser):
+        """
+        コマンドライン引数を定義する。
+
+        :param parser: 引数のパーサー
+        :type parser: argparse.ArgumentParser
+        """
+        parser.add_argument(
+            '--batch-size', type=int, dest='batch_size', default=1000,
+            help='Number of tokens re-encrypted per batch. '
+                 'UPDATE statements are split to fit the parameter limit of the database.'
+        )
+
+    def handle(self, *args, **options):
+        """
+        アクセストークンを暗号化し直す。
+
+        :param args: 位置引数
+        :type args: tuple
+        :param options: コマンドラインオプション
+        :type options: dict
+        """
+        # 引数と設定をチェックする
+        batch_size = options['batch_size']
+        if batch_size <= 0:
+            raise CommandError('--batch-size must be a positive integer.')
+        if not encryption.is_enabled():
+            raise CommandError('TOKEN_ENCRYPTION_KEYS is not set.')
+
+        # 古い暗号鍵で暗号化されたレコードを主キー順に少しずつ処理する
+        # 1回のUPDATEで更新する件数を抑え、テーブルを長時間ロックしないようにする
+        key_id = encryption.get_primary_key_id()
+        last_pk = 0
+        rotated = 0
+        while True:
+            # 次のバッチを取得する
+            tokens = list(AccessToken.objects.filter(pk__gt=last_pk).exclude(key_id=key_id).order_by('pk').only(
+                'pk', 'encrypted_token', 'key_id'
+            )[:batch_size])
+            if not tokens:
+                break
+
+            # 現在の暗号鍵で暗号化し直す
+            previous = {token.pk: token.encrypted_token for token in tokens}
+            for token in tokens:
+                try:
+                    token.encrypted_token, token.key_id = encryption.rotate(token.encrypted_token)
+                except encryption.InvalidToken:
+                    raise CommandError('Failed to decrypt the access token of user %s.' % token.pk)
+
+            # 一括更新する(読み込んだ後にログインにより保存し直されたアクセストークンは上書きしない)
+            rotated += AccessToken.objects.bulk_update_tokens(tokens, previous)
+            last_pk = tokens[-1].pk
+
+        self.stdout.write('%d tokens re-encrypted.' % rotated)
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import io
+import os
+
+from tweepy.error import TweepError
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import router
+
+from twingo2 import search
+from twingo2.backends import get_profile
+from twingo2.cache import primary_pin_cache, screen_name_cache, user_cache
+from twingo2.models import User, UserSearchToken
+from twingo2.twitter import LOOKUP_USERS_LIMIT, RateLimiter, get_app_api
+
+
+class Command(BaseCommand):
+    """
+    登録済みユーザーのプロフィールをTwitterと一括で同期するコマンド。
+    """
+
+    help = 'Synchronise stored user profiles with Twitter.'
+
+    def add_arguments(self, parser):
+        """
+        コマンドライン引数を定義する。
+
+        :param parser: 引数のパーサー
+        :type parser: argparse.ArgumentParser
+        """
+        parser.add_argument(
+            '--checkpoint', dest='checkpoint', default=None,
+            help='File recording the last processed user ID so that an interrupted run can resume.'
+        )
+        parser.add_argument(
+            '--rate', type=float, dest='rate', default=300 / 900,
+            help='Maximum number of users/lookup requests per second (default: 300 per 15 minutes).'
+        )
+
+    def handle(self, *args, **options):
+        """
+        プロフィールを同期する。
+
+        :param args: 位置引数
+        :type args: tuple
+        :param options: コマンドラインオプション
+        :type options: dict
+        """
+        # 引数をチェックする
+        if options['rate'] <= 0:
+            raise CommandError('--rate must be a positive number.')
+
+        # 前回中断した位置から100件ずつ処理する
+        api = get_app_api()
+        rate_limiter = RateLimiter(options['rate'])
+        checkpoint = options['checkpoint']
+        last_pk = self._read_checkpoint(checkpoint)
+        checked = updated = 0
+        while True:
+            # 次の100件を取得する
+            users = list(User.objects.filter(pk__gt=last_pk).order_by('pk').only(
+                'pk', 'twitter_id', *User.PROFILE_FIELDS
+            )[:LOOKUP_USERS_LIMIT])
+            if not users:
+                break
+
+            # Twitterからプロフィールを取得して反映する
+            rate_limiter.wait()
+            twitter_users = self._lookup_users(api, [user.twitter_id for user in users])
+            checked_users = []
+            changed_users = []
+            changed_fields = set()
+            for user in users:
+                twitter_user = twitter_users.get(user.twitter_id)
+                if twitter_user is None:
+                    continue
+                checked_users.append(user)
+                fields = user.apply_profile(**get_profile(twitter_user))
+                if fields:
+                    changed_users.append(user)
+                    changed_fields.update(fields)
+
+            # 変更されたユーザーを一括更新し、あわせて比較したすべてのユーザーのプロフィール確認日時を記録する
+            User.objects.bulk_update_fields(changed_users, sorted(changed_fields), checked_users=checked_users)
+            for user in changed_users:
+                primary_pin_cache.pin(user.pk)
+                user_cache.invalidate(user.pk)
+                screen_name_cache.invalidate(user)
+            if search.uses_token_index(router.db_for_write(User)):
+                UserSearchToken.objects.index_users(changed_users)
+
+            # 処理済みの位置を記録する
+            checked += len(users)
+            updated += len(changed_users)
+            last_pk = users[-1].pk
+            self._write_checkpoint(checkpoint, last_pk)
+
+        # 完了した場合は次回を先頭から処理する
+        if checkpoint and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        self.stdout.write('%d users checked, %d users updated.' % (checked, updated))
+
+    def _lookup_users(self, api, twitter_ids):
+        """
+        Twitterからユーザー情報を一括取得する。
+
+        :param api: APIオブジェクト
+        :type api: tweepy.API
+        :param twitter_ids: Twitter IDのリスト
+        :type twitter_ids: list
+        :return: Twitter IDをキーとするTwitterのユーザー情報
+        :rtype: dict
+        """
+        try:
+            return {u.id: u for u in api.lookup_users(user_ids=twitter_ids)}
+        except TweepError as e:
+            # いずれのユーザーも存在しない場合は404が返却される
+            if e.response is not None and e.response.status_code == 404:
+                return {}
+            raise CommandError('Failed to look up users: %s' % e)
+
+    def _read_checkpoint(self, path):
+        """
+        処理済みの位置を読み込む。
+
+        :param path: チェックポイントファイルのパス
+        :type path: str
+        :return: 処理済みのユーザーのID(未処理の場合は0)
+        :rtype: int
+        """
+        # ファイルが存在しない場合は先頭から処理する
+        if not path or not os.path.exists(path):
+            return 0
+        with io.open(path, encoding='utf-8') as f:
+            return int(f.read().strip() or 0)
+
+    def _write_checkpoint(self, path, last_pk):
+        """
+        処理済みの位置を書き込む。
+
+        :param path: チェックポイントファイルのパス
+        :type path: str
+        :param last_pk: 処理済みのユーザーのID
+        :type last_pk: int
+        """
+        # 書き込み途中で中断されても壊れないように一時ファイルから置き換える
+        if not path:
+            return
+        temp_path = path + '.tmp'
+        with io.open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(str(last_pk))
+        os.replace(temp_path, path)
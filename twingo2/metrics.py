@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import bisect
+import threading
+import time
+
+from django.conf import settings
+
+from twingo2.signals import login_failed, login_phase_finished
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+"""ヒストグラムのデフォルトの区間(秒)"""
+
+
+def is_enabled():
+    """
+    ログイン処理の計測が有効であるかどうかを判定する。
+
+    :return: LOGIN_METRICS_ENABLEDが設定されていればTrue
+    :rtype: bool
+    """
+    return getattr(settings, 'LOGIN_METRICS_ENABLED', False)
+
+
+class Registry:
+    """
+    カウンターとヒストグラムを保持するクラス。
+    プロセス内のすべてのスレッドで共有する。
+    """
+
+    def __init__(self):
+        """
+        Registryを構築する。
+        """
+        # 内部状態を初期化する
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name, **labels):
+        """
+        カウンターを1増やす。
+
+        :param name: メトリクス名
+        :type name: str
+        :param labels: ラベル名とその値
+        :type labels: dict
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+
+    def observe(self, name, value, **labels):
+        """
+        ヒストグラムに値を記録する。
+
+        :param name: メトリクス名
+        :type name: str
+        :param value: 記録する値
+        :type value: float
+        :param labels: ラベル名とその値
+        :type labels: dict
+        """
+        key = (name, tuple(sorted(labels.items())))
+        buckets = self._get_buckets()
+        with self._lock:
+            # 区間ごとの件数、合計値、件数を更新する
+            histogram = self._histograms.get(key)
+            if histogram is None or histogram[0] != buckets:
+                histogram = self._histograms[key] = [buckets, [0] * len(buckets), 0.0, 0]
+            index = bisect.bisect_left(buckets, value)
+            if index < len(buckets):
+                histogram[1][index] += 1
+            histogram[2] += value
+            histogram[3] += 1
+
+    def get_counter(self, name, **labels):
+        """
+        カウンターの値を取得する。
+
+        :param name: メトリクス名
+        :type name: str
+        :param labels: ラベル名とその値
+        :type labels: dict
+        :return: カウンターの値
+        :rtype: int
+        """
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def render(self):
+        """
+        Prometheusのテキスト形式に変換する。
+
+        :return: Prometheusのテキスト形式の文字列
+        :rtype: str
+        """
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (v[0], list(v[1]), v[2], v[3])) for key, v in self._histograms.items())
+
+        # カウンターを出力する
+        lines = []
+        written = set()
+        for (name, labels), value in counters:
+            if name not in written:
+                lines.append('# TYPE %s counter' % name)
+                written.add(name)
+            lines.append('%s%s %d' % (name, _format_labels(labels), value))
+
+        # ヒストグラムを出力する(区間ごとの件数は累積値とする)
+        for (name, labels), (buckets, counts, total, count) in histograms:
+            if name not in written:
+                lines.append('# TYPE %s histogram' % name)
+                written.add(name)
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append('%s_bucket%s %d' % (name, _format_labels(labels + (('le', repr(bound)),)), cumulative))
+            lines.append('%s_bucket%s %d' % (name, _format_labels(labels + (('le', '+Inf'),)), count))
+            lines.append('%s_sum%s %r' % (name, _format_labels(labels), total))
+            lines.append('%s_count%s %d' % (name, _format_labels(labels), count))
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    def clear(self):
+        """
+        すべての値を破棄する。
+        """
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def _get_buckets(self):
+        """
+        ヒストグラムの区間を取得する。
+
+        :return: 区間の上限値のタプル
+        :rtype: tuple
+        """
+        return tuple(getattr(settings, 'LOGIN_METRICS_BUCKETS', DEFAULT_BUCKETS))
+
+
+def _format_labels(labels):
+    """
+    ラベルをPrometheusのテキスト形式に変換する。
+
+    :param labels: ラベル名とその値のタプル
+    :type labels: tuple
+    :return: ラベルを表す文字列
+    :rtype: str
+    """
+    if not labels:
+        return ''
+    values = ('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in labels)
+    return '{%s}' % ','.join(values)
+
+
+class _Timer:
+    """
+    ログイン処理の1段階の所要時間を計測するコンテキストマネージャー。
+    """
+
+    def __init__(self, phase):
+        """
+        _Timerを構築する。
+
+        :param phase: 段階の名前
+        :type phase: str
+        """
+        self._phase = phase
+        self._started_at = None
+
+    def __enter__(self):
+        """
+        計測を開始する。
+
+        :return: 当オブジェクト
+        :rtype: twingo2.metrics._Timer
+        """
+        self._started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """
+        計測を終了し、所要時間を記録する。
+
+        :param exc_type: 送出された例外の型
+        :type exc_type: type
+        :param exc_value: 送出された例外
+        :type exc_value: Exception
+        :param traceback: トレースバック
+        :type traceback: traceback
+        :return: 例外を抑止しないためFalse
+        :rtype: bool
+        """
+        # 例外が送出された場合も所要時間を記録する
+        duration = time.perf_counter() - self._started_at
+        registry.observe('twingo2_login_phase_seconds', duration, phase=self._phase)
+        login_phase_finished.send(sender=None, phase=self._phase, duration=duration)
+        return False
+
+
+class _NullTimer:
+    """
+    計測が無効な場合に使用する何もしないコンテキストマネージャー。
+    """
+
+    def __enter__(self):
+        """
+        何もしない。
+
+        :return: 当オブジェクト
+        :rtype: twingo2.metrics._NullTimer
+        """
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """
+        何もしない。
+
+        :param exc_type: 送出された例外の型
+        :type exc_type: type
+        :param exc_value: 送出された例外
+        :type exc_value: Exception
+        :param traceback: トレースバック
+        :type traceback: traceback
+        :return: 例外を抑止しないためFalse
+        :rtype: bool
+        """
+        return False
+
+
+_null_timer = _NullTimer()
+
+
+def timer(phase):
+    """
+    ログイン処理の1段階の所要時間を計測するコンテキストマネージャーを取得する。
+    計測が無効な場合は共有の何もしないオブジェクトを返却する。
+
+    :param phase: 段階の名前
+    :type phase: str
+    :return: コンテキストマネージャー
+    :rtype: object
+    """
+    return _Timer(phase) if is_enabled() else _null_timer
+
+
+def record_success():
+    """
+    ログインの成功を記録する。
+    """
+    if is_enabled():
+        registry.increment('twingo2_login_success_total')
+
+
+def record_failure(request, reason):
+    """
+    ログインの失敗を記録する。
+
+    :param request: リクエストオブジェクト
+    :type request: django.http.HttpRequest
+    :param reason: 失敗の原因
+    :type reason: str
+    """
+    if is_enabled():
+        registry.increment('twingo2_login_failures_total', reason=reason)
+        login_failed.send(sender=None, request=request, reason=reason)
+
+
+# プロセス内で共有するメトリクス
+registry = Registry()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from django.contrib.auth.models import AnonymousUser
+
+from twingo2 import tokens
+from twingo2.backends import TwitterBackend
+
+
+class SignedTokenMiddleware:
+    """
+    署名付きトークンからrequest.userを復元するミドルウェア。
+    トークンの再検証時を除き、セッションやデータベースにはアクセスしない。
+    AuthenticationMiddlewareより後に配置する。
+    """
+
+    def process_request(self, request):
+        """
+        リクエストのトークンを検証し、request.userを設定する。
+
+        :param request: リクエストオブジェクト
+        :type request: django.http.HttpRequest
+        """
+        # トークンを取得する
+        if not tokens.is_enabled():
+            return
+        token, from_cookie = self._get_token(request)
+        if token is None:
+            return
+
+        # トークンを検証し、一定時間が経過していればデータベースの内容で再発行する
+        payload = tokens.load_token(token)
+        if payload is not None and tokens.needs_refresh(payload):
+            payload = self._refresh(payload)
+            request._twingo2_token = (tokens.dump_token(payload) if payload else None, from_cookie)
+        elif payload is None:
+            request._twingo2_token = (None, from_cookie)
+
+        # ユーザー情報を設定する
+        if payload is not None:
+            request.user = tokens.TokenUser(payload)
+        elif not hasattr(request, 'user'):
+            request.user = AnonymousUser()
+
+    def process_response(self, request, response):
+        """
+        再発行したトークンをレスポンスに設定する。
+
+        :param request: リクエストオブジェクト
+        :type request: django.http.HttpRequest
+        :param response: レスポンスオブジェクト
+        :type response: django.http.HttpResponse
+        :return: レスポンスオブジェクト
+        :rtype: django.http.HttpResponse
+        """
+        # トークンに変更がない場合は何もしない
+        if not hasattr(request, '_twingo2_token'):
+            return response
+
+        # クッキーで受け取った場合はクッキー、ヘッダーで受け取った場合はヘッダーで返却する
+        token, from_cookie = request._twingo2_token
+        if from_cookie:
+            if token:
+                tokens.set_token_cookie(response, token)
+            else:
+                tokens.delete_token_cookie(response)
+        else:
+            response['X-Twingo2-Token'] = token or ''
+        return response
+
+    def _get_token(self, request):
+        """
+        リクエストからトークンを取得する。
+
+        :param request: リクエストオブジェクト
+        :type request: django.http.HttpRequest
+        :return: トークンと、クッキーから取得したかどうかのタプル
+        :rtype: tuple
+        """
+        # Authorizationヘッダーを優先する
+        authorization = request.META.get('HTTP_AUTHORIZATION', '')
+        if authorization.startswith('Bearer '):
+            return authorization[len('Bearer '):].strip(), False
+
+        # クッキーから取得する
+        return request.COOKIES.get(tokens.get_cookie_name()), True
+
+    def _refresh(self, payload):
+        """
+        データベースの内容をもとにトークンのユーザー情報を更新する。
+
+        :param payload: トークンに格納されたユーザー情報
+        :type payload: dict
+        :return: 更新したユーザー情報(無効化または削除されたユーザーの場合はNone)
+        :rtype: dict
+        """
+        # 有効なユーザーのみを取得する
+        user = TwitterBackend().get_user(payload['i'])
+        if user is None:
+            return None
+
+        # 最新のユーザー情報で置き換える
+        return tokens.make_payload(user)
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+# screen_name__iexactはPostgreSQLではUPPER("screen_name"::text)として比較されるため、同じ式でインデックスを作成する
+# (text_pattern_opsとし、前方一致の検索にも使用できるようにする)
+INDEX_NAME = 'twingo2_user_screen_name_upper'
+
+
+def create_upper_index(apps, schema_editor):
+    """
+    PostgreSQLの場合はユーザー名の大文字の関数インデックスを作成する。
+    MySQLは照合順序により大文字小文字を区別しないため、通常のインデックスで足りる。
+    """
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX %s ON twingo2_user (UPPER(screen_name::text) text_pattern_ops)' % INDEX_NAME
+        )
+
+
+def drop_upper_index(apps, schema_editor):
+    """
+    PostgreSQLの場合はユーザー名の大文字の関数インデックスを削除する。
+    """
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS %s' % INDEX_NAME)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('twingo2', '0003_profileimage'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='screen_name',
+            field=models.CharField(max_length=15, verbose_name='ユーザー名', db_index=True),
+        ),
+        migrations.RunPython(create_upper_index, drop_upper_index),
+    ]
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import models, migrations
+
+
+# icontainsはPostgreSQLではUPPER("フィールド"::text) LIKE UPPER(%s)として比較されるため、同じ式でトライグラムの索引を作成する
+SEARCH_FIELDS = ('screen_name', 'name', 'description')
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """
+    PostgreSQLでUSER_SEARCH_TRIGRAM_INDEXが設定されている場合はpg_trgmによる検索対象のフィールドの索引を作成する。
+    拡張機能の作成に権限が必要で、索引の作成中はテーブルへの書き込みが妨げられるため、既定では作成しない。
+    既存のデータベースにはtwingo2_create_trigram_indexesコマンドで作成する。
+    """
+    if schema_editor.connection.vendor == 'postgresql' and getattr(settings, 'USER_SEARCH_TRIGRAM_INDEX', False):
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for field_name in SEARCH_FIELDS:
+            schema_editor.execute(
+                'CREATE INDEX IF NOT EXISTS twingo2_user_%s_trgm ON twingo2_user USING gin (UPPER(%s::text) gin_trgm_ops)' % (
+                    field_name, field_name
+                )
+            )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    """
+    PostgreSQLの場合はpg_trgmによる検索対象のフィールドの索引を削除する。
+    """
+    if schema_editor.connection.vendor == 'postgresql':
+        for field_name in SEARCH_FIELDS:
+            schema_editor.execute('DROP INDEX IF EXISTS twingo2_user_%s_trgm' % field_name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('twingo2', '0004_user_screen_name_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSearchToken',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', primary_key=True, serialize=False, auto_created=True)),
+                ('token', models.CharField(verbose_name='トークン', max_length=30)),
+                ('user', models.ForeignKey(verbose_name='ユーザー', related_name='search_tokens', to='twingo2.User')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='usersearchtoken',
+            unique_together=set([('user', 'token')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='usersearchtoken',
+            index_together=set([('token', 'user')]),
+        ),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
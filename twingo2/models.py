@@ -16,10 +16,52 @@
 # limitations under the License.
 #
 
+from collections import defaultdict
 import datetime
+from functools import reduce
+import json
+import operator
 
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager
-from django.db import models
+from django.db import IntegrityError, connections, models, router, transaction
+from django.db.models import Case, F, Q, Value, When, signals
+from django.utils import timezone
+
+from twingo2 import encryption, search, sharding
+
+
+SQLITE_MAX_VARIABLE_NUMBER = 999
+"""SQLite(3.32未満)が1つのクエリにバインドできるパラメーターの数"""
+
+
+def get_batch_size(using, params_per_row, batch_size=None, extra_params=0):
+    """
+    1つのクエリにバインドするパラメーターの数がデータベースの上限を超えない件数を取得する。
+    SQLite(3.32未満)は1つのクエリに999個までしかパラメーターをバインドできない。
+
+    :param using: データベースのエイリアス
+    :type using: str
+    :param params_per_row: 1件あたりにバインドするパラメーターの数
+    :type params_per_row: int
+    :param batch_size: 希望する件数(Noneの場合は上限の件数)
+    :type batch_size: int
+    :param extra_params: 件数にかかわらずバインドするパラメーターの数
+    :type extra_params: int
+    :return: 1つのクエリで処理する件数(上限がなくbatch_sizeも指定しない場合はNone)
+    :rtype: int
+    """
+    # 上限がないデータベースでは希望する件数をそのまま使用する
+    # (Django 2.0より前はDatabaseFeatures.max_query_paramsがないため、SQLiteの上限を補う)
+    connection = connections[using]
+    max_query_params = getattr(connection.features, 'max_query_params', None)
+    if max_query_params is None and connection.vendor == 'sqlite':
+        max_query_params = SQLITE_MAX_VARIABLE_NUMBER
+    if max_query_params is None:
+        return batch_size
+
+    # 上限に収まる件数に制限する
+    limit = max((max_query_params - extra_params) // params_per_row, 1)
+    return limit if batch_size is None else min(batch_size, limit)
 
 
 class UserManager(BaseUserManager):
@@ -63,6 +105,288 @@ class UserManager(BaseUserManager):
         # 新規ユーザー(管理者)を作成する
         return self._create_user(twitter_id, screen_name, name, True, True, **extra_fields)
 
+    def create_or_get_user(self, twitter_id, screen_name, name, is_superuser=False, **extra_fields):
+        """
+        新規ユーザーを作成する。同一のTwitter IDのユーザーが既に存在する場合はそのユーザーを取得する。
+        同一ユーザーの作成が並行して実行された場合でもIntegrityErrorは発生しない。
+
+        :param twitter_id: Twitter ID
+        :type twitter_id: int
+        :param screen_name: ユーザー名
+        :type screen_name: str
+        :param name: 名前
+        :type name: str
+        :param is_superuser: 管理者として作成する場合はTrue
+        :type is_superuser: bool
+        :param extra_fields: 任意入力のフィールド
+        :type extra_fields: dict
+        :return: ユーザーと、新規に作成したかどうかのタプル
+        :rtype: tuple
+        """
+        # 新規ユーザーを作成する
+        user = self._build_user(twitter_id, screen_name, name, is_superuser, is_superuser, **extra_fields)
+        db = self._get_db_for_write(user)
+        if self._insert_if_not_exists(user, db):
+            return user, True
+
+        # 既存のユーザーを取得する
+        return self.using(db).get(twitter_id=twitter_id), False
+
+    def get_by_screen_name(self, screen_name):
+        """
+        ユーザー名(大文字小文字を区別しない)に対応するユーザーを取得する。
+        ユーザー名は変更できるため、同じユーザー名のユーザーが複数存在する場合は最後に更新されたユーザーを優先する。
+
+        :param screen_name: ユーザー名
+        :type screen_name: str
+        :return: ユーザー情報
+        :rtype: twingo2.models.User
+        :raises User.DoesNotExist: 対応するユーザーが存在しない場合
+        """
+        # 最後に更新されたユーザーを取得する(シャーディングが有効な場合はすべてのシャードから取得する)
+        users = [
+            user for user in (
+                queryset.filter(screen_name__iexact=screen_name).order_by('-updated_at', '-pk').first()
+                for queryset in self._get_querysets()
+            ) if user is not None
+        ]
+        if not users:
+            raise self.model.DoesNotExist('User matching screen_name %r does not exist.' % screen_name)
+        return max(users, key=lambda u: (u.updated_at, u.pk))
+
+    def in_bulk_by_screen_name(self, screen_names, batch_size=500):
+        """
+        複数のユーザー名(大文字小文字を区別しない)に対応するユーザーを取得する。
+        同じユーザー名のユーザーが複数存在する場合は最後に更新されたユーザーを優先する。
+
+        :param screen_names: ユーザー名のリスト
+        :type screen_names: list
+        :param batch_size: 1回のクエリで検索するユーザー名の数
+        :type batch_size: int
+        :return: 小文字のユーザー名をキー、ユーザー情報を値とする辞書
+        :rtype: dict
+        """
+        # 重複を除き、batch_size件ずつ検索する
+        names = sorted({screen_name.lower() for screen_name in screen_names})
+        users = {}
+        for i in range(0, len(names), batch_size):
+            condition = reduce(operator.or_, (Q(screen_name__iexact=name) for name in names[i:i + batch_size]))
+
+            # 更新日時の昇順に上書きし、最後に更新されたユーザーを残す
+            for queryset in self._get_querysets():
+                for user in queryset.filter(condition).order_by('updated_at', 'pk'):
+                    previous = users.get(user.screen_name.lower())
+                    if previous is None or previous.updated_at <= user.updated_at:
+                        users[user.screen_name.lower()] = user
+        return users
+
+    def search(self, q):
+        """
+        ユーザー名、名前、自己紹介からユーザーを検索する。
+        空白で区切られた語をすべて含むユーザーを返却する。
+        USER_SEARCH_INDEX_ENABLEDが設定されている場合(PostgreSQL以外)はトークン索引テーブルによる単語の前方一致、
+        それ以外の場合はicontainsによる部分一致(PostgreSQLではpg_trgmの索引を作成していれば索引を使用)で検索する。
+
+        :param q: 検索語
+        :type q: str
+        :return: 検索結果のクエリセット
+        :rtype: django.db.models.query.QuerySet
+        """
+        # 検索語をトークンに分割する
+        queryset = self.get_queryset()
+        terms = search.tokenize(q)
+        if not terms:
+            return queryset.none()
+
+        # トークン索引テーブルを使用する
+        db = self._db or router.db_for_read(self.model)
+        if search.uses_token_index(db):
+            for term in sorted(terms):
+                tokens = UserSearchToken.objects.using(db).filter(token__gte=term, token__lt=term + '\uffff')
+                queryset = queryset.filter(pk__in=tokens.values('user_id'))
+            return queryset
+
+        # すべてのフィールドを部分一致で検索する
+        for term in sorted(terms):
+            condition = reduce(operator.or_, (Q(**{f + '__icontains': term}) for f in search.SEARCH_FIELDS))
+            queryset = queryset.filter(condition)
+        return queryset
+
+    def bulk_update_fields(self, users, fields, checked_users=None):
+        """
+        複数のユーザーの指定されたフィールドを1回のUPDATEで更新する。
+        バインドするパラメーターの数がデータベースの上限を超える場合は複数のUPDATEに分割する。
+        シグナルは送信されない。
+
+        :param users: 更新するユーザーのリスト
+        :type users: list
+        :param fields: 更新するフィールド名のリスト
+        :type fields: list
+        :param checked_users: Twitterのプロフィールと比較したユーザーのリスト(usersを含む。指定した場合は変更の有無にかかわらずプロフィール確認日時を記録する)
+        :type checked_users: list
+        :return: 更新した件数
+        :rtype: int
+        """
+        # 更新対象が存在しない場合は何もしない
+        targets = users if checked_users is None else checked_users
+        if not targets or (not fields and checked_users is None):
+            return 0
+
+        # 1件あたり、フィールドごとのCASE式に2個、更新日時のCASE式と条件に1個ずつのパラメーターをバインドする
+        now = timezone.now()
+        changed_pks = set(user.pk for user in users)
+        batch_size = get_batch_size(
+            self._db or router.db_for_write(self.model), len(fields) * 2 + 2, extra_params=2
+        ) or len(targets)
+        updated = 0
+        for start in range(0, len(targets), batch_size):
+            batch = targets[start:start + batch_size]
+            changed = [user for user in batch if user.pk in changed_pks]
+
+            # ユーザーごとの値をCASE式で指定する(変更のないユーザーは現在の値を維持する)
+            updates = {}
+            for field_name in fields:
+                field = self.model._meta.get_field(field_name)
+                whens = [When(pk=user.pk, then=Value(getattr(user, field_name))) for user in changed]
+                updates[field_name] = Case(*whens, default=F(field_name), output_field=field) if whens else F(field_name)
+            if checked_users is None:
+                updates['updated_at'] = now
+            else:
+                updates['profile_checked_at'] = now
+                if changed:
+                    updates['updated_at'] = Case(
+                        When(pk__in=[user.pk for user in changed], then=Value(now)),
+                        default=F('updated_at'),
+                        output_field=self.model._meta.get_field('updated_at')
+                    )
+
+            # 一括更新する
+            updated += self.filter(pk__in=[user.pk for user in batch]).update(**updates)
+        return updated
+
+    def move_to_shards(self, users):
+        """
+        当マネージャーのデータベースのユーザーと関連するレコードを、Twitter IDに対応するシャードに移動する。
+        移動先へのコミットの後に移動元から削除するため、中断した場合も移動先に残ったユーザーは失われない。
+        移動先に同じTwitter IDのユーザーが存在する場合は、移動元のユーザーをそのユーザーに統合する。
+
+        :param users: 移動するユーザーのリスト
+        :type users: list
+        :return: Twitter IDをキーとする移動先のユーザーの辞書
+        :rtype: dict
+        """
+        # 関連するレコードをまとめて取得する(検索用のトークンは移動先で作成し直す)
+        source = self._db or router.db_for_write(self.model)
+        pks = [user.pk for user in users]
+        related = defaultdict(list)
+        for model in (AccessToken, ProfileImage):
+            for instance in model.objects.using(source).filter(pk__in=pks):
+                related[instance.pk].append(instance)
+
+        # 移動先のシャードごとに挿入または統合する
+        targets = defaultdict(list)
+        for user in users:
+            targets[sharding.get_shard(user.twitter_id)].append(user)
+        moved = {}
+        with transaction.atomic(using=source):
+            for target, target_users in targets.items():
+                with transaction.atomic(using=target):
+                    existing = {user.twitter_id: user for user in self.model.objects.using(target).filter(
+                        twitter_id__in=[user.twitter_id for user in target_users]
+                    )}
+                    for user in target_users:
+                        if user.twitter_id in existing:
+                            moved[user.twitter_id] = self._merge_user(user, related[user.pk], existing[user.twitter_id])
+                        else:
+                            moved[user.twitter_id] = self._copy_user(user, related[user.pk], target)
+
+            # 移動元から削除する(関連するレコードも削除され、シグナルによりキャッシュも破棄される)
+            self.model.objects.using(source).filter(pk__in=pks).delete()
+        return moved
+
+    def _copy_user(self, user, related, target):
+        """
+        ユーザーと関連するレコードを移動先のシャードに挿入する。
+        主キーは移動先で採番し、作成日時と更新日時は移動元の値を維持する。
+
+        :param user: 移動するユーザー
+        :type user: User
+        :param related: ユーザーを主キーとするレコードのリスト
+        :type related: list
+        :param target: 移動先のデータベースのエイリアス
+        :type target: str
+        :return: 移動先のユーザー
+        :rtype: User
+        """
+        # loaddataと同様にrawで保存し、auto_now/auto_now_addによる上書きを防ぐ
+        copied = self.model(**{
+            f.attname: getattr(user, f.attname) for f in self.model._meta.concrete_fields if not f.primary_key
+        })
+        copied.save_base(raw=True, force_insert=True, using=target)
+        self._copy_related(related, copied, target)
+        return copied
+
+    def _merge_user(self, user, related, existing):
+        """
+        移動元のユーザーを、移動先に存在する同じTwitter IDのユーザーに統合する。
+        移動先のユーザーが中断した移動で挿入されたもの(作成日時が一致する)であれば、移動先のユーザーをそのまま使用する。
+        移行中のログインで作成されたものであれば、無効化や権限などのアカウントの状態は移動元のユーザーを引き継ぎ、
+        プロフィールは後に更新された方を使用する。関連するレコードは移動先に存在しないもののみを引き継ぐ。
+
+        :param user: 移動元のユーザー
+        :type user: User
+        :param related: 移動元のユーザーを主キーとするレコードのリスト
+        :type related: list
+        :param existing: 移動先のユーザー
+        :type existing: User
+        :return: 統合した移動先のユーザー
+        :rtype: User
+        """
+        # 中断した移動で挿入されたユーザーであればそのまま使用する
+        if existing.created_at == user.created_at:
+            return existing
+
+        # アカウントの状態は移動元を引き継ぐ(どちらかで無効化されていれば無効とする)
+        existing.is_active = existing.is_active and user.is_active
+        existing.is_staff = user.is_staff
+        existing.is_superuser = user.is_superuser
+        existing.password = user.password
+        existing.created_at = min(existing.created_at, user.created_at)
+        last_logins = [d for d in (existing.last_login, user.last_login) if d is not None]
+        existing.last_login = max(last_logins) if last_logins else None
+
+        # プロフィールは後に更新された方を使用する
+        if user.updated_at > existing.updated_at:
+            for field_name in self.model.PROFILE_FIELDS:
+                setattr(existing, field_name, getattr(user, field_name))
+            existing.updated_at = user.updated_at
+
+        # rawで保存し、auto_nowによる上書きを防ぐ
+        existing.save_base(raw=True, using=existing._state.db)
+        self._copy_related(
+            [instance for instance in related if not type(instance).objects.using(existing._state.db).filter(
+                pk=existing.pk
+            ).exists()],
+            existing,
+            existing._state.db
+        )
+        return existing
+
+    def _copy_related(self, related, user, target):
+        """
+        ユーザーを主キーとするレコードを移動先のユーザーに関連付けて挿入する。
+
+        :param related: ユーザーを主キーとするレコードのリスト
+        :type related: list
+        :param user: 移動先のユーザー
+        :type user: User
+        :param target: 移動先のデータベースのエイリアス
+        :type target: str
+        """
+        for instance in related:
+            instance.user_id = user.pk
+            instance.save_base(raw=True, force_insert=True, using=target)
+
     def _create_user(self, twitter_id, screen_name, name, is_superuser, is_staff, **extra_fields):
         """
         新規ユーザーを作成する。
@@ -82,11 +406,65 @@ class UserManager(BaseUserManager):
         :return: 作成したユーザー
         :rtype: User
         """
+        # 新規ユーザーを作成する
+        user = self._build_user(twitter_id, screen_name, name, is_superuser, is_staff, **extra_fields)
+        user.save(using=self._get_db_for_write(user))
+        return user
+
+    def _get_db_for_write(self, user):
+        """
+        新規ユーザーを保存するデータベースを取得する。
+        シャーディングが有効な場合はTwitter IDに対応するシャードに保存する。
+
+        :param user: 保存前の新規ユーザー
+        :type user: User
+        :return: データベースのエイリアス
+        :rtype: str
+        """
+        if self._db:
+            return self._db
+        if sharding.is_enabled():
+            return sharding.get_shard(user.twitter_id)
+        return router.db_for_write(self.model, instance=user)
+
+    def _get_querysets(self):
+        """
+        読み込みに使用するクエリセットを取得する。
+        シャーディングが有効で、データベースが指定されていない場合はシャード(移行中は移行前のシャードを含む)ごとのクエリセットを返却する。
+
+        :return: クエリセットのリスト
+        :rtype: list
+        """
+        if self._db or not sharding.is_enabled():
+            return [self.get_queryset()]
+        databases = list(sharding.get_shards())
+        databases += [db for db in sharding.get_previous_shards() if db not in databases]
+        return [self.using(db) for db in databases]
+
+    def _build_user(self, twitter_id, screen_name, name, is_superuser, is_staff, **extra_fields):
+        """
+        保存前の新規ユーザーを構築する。
+
+        :param twitter_id: Twitter ID
+        :type twitter_id: int
+        :param screen_name: ユーザー名
+        :type screen_name: str
+        :param name: 名前
+        :type name: str
+        :param is_superuser: 管理者権限
+        :type is_superuser: bool
+        :param is_staff: 管理画面操作権限
+        :type is_staff: bool
+        :param extra_fields: 任意入力のフィールド
+        :type extra_fields: dict
+        :return: 構築したユーザー
+        :rtype: User
+        """
         # 引数をチェックする
         if not twitter_id or not screen_name or not name:
             raise ValueError('twitter_id and screen_name and name are required.')
 
-        # 新規ユーザーを作成する
+        # 新規ユーザーを構築する
         user = self.model(
             twitter_id=twitter_id,
             screen_name=screen_name,
@@ -98,9 +476,67 @@ class UserManager(BaseUserManager):
             **extra_fields
         )
         user.set_unusable_password()
-        user.save(using=self._db)
         return user
 
+    def _insert_if_not_exists(self, user, db):
+        """
+        同一のTwitter IDが登録されていない場合に限りユーザーを挿入する。
+        データベースがサポートしている場合は INSERT ... ON CONFLICT DO NOTHING の1文で処理し、
+        それ以外の場合はセーブポイント内での挿入にフォールバックする。
+
+        :param user: 挿入するユーザー
+        :type user: User
+        :param db: 挿入先のデータベースエイリアス
+        :type db: str
+        :return: 挿入した場合はTrue、登録済みだった場合はFalse
+        :rtype: bool
+        """
+        connection = connections[db]
+        vendor = connection.vendor
+        if vendor == 'postgresql':
+            native = connection.pg_version >= 90500
+        elif vendor == 'sqlite':
+            native = connection.Database.sqlite_version_info >= (3, 24, 0)
+        else:
+            native = False
+
+        # ON CONFLICTをサポートしていない場合はセーブポイント内で挿入する
+        if not native:
+            try:
+                with transaction.atomic(using=db):
+                    user.save(force_insert=True, using=db)
+                return True
+            except IntegrityError:
+                return False
+
+        # 挿入するSQLを構築する
+        opts = self.model._meta
+        qn = connection.ops.quote_name
+        fields = [f for f in opts.local_concrete_fields if f != opts.auto_field]
+        signals.pre_save.send(sender=self.model, instance=user, raw=False, using=db, update_fields=None)
+        values = [f.get_db_prep_save(f.pre_save(user, True), connection=connection) for f in fields]
+        sql = 'INSERT INTO %s (%s) VALUES (%s) ON CONFLICT (%s) DO NOTHING' % (
+            qn(opts.db_table),
+            ', '.join(qn(f.column) for f in fields),
+            ', '.join(['%s'] * len(fields)),
+            qn(opts.get_field('twitter_id').column)
+        )
+        if vendor == 'postgresql':
+            sql += ' RETURNING %s' % qn(opts.pk.column)
+
+        # ユーザーを挿入する
+        with connection.cursor() as cursor:
+            cursor.execute(sql, values)
+            if cursor.rowcount != 1:
+                return False
+            user.pk = cursor.fetchone()[0] if vendor == 'postgresql' else cursor.lastrowid
+
+        # 保存済みのモデルとして扱えるようにする
+        user._state.adding = False
+        user._state.db = db
+        signals.post_save.send(sender=self.model, instance=user, created=True, update_fields=None, raw=False, using=db)
+        return True
+
 
 class User(AbstractBaseUser):
     """
@@ -110,7 +546,7 @@ class User(AbstractBaseUser):
     twitter_id = models.IntegerField('Twitter ID', unique=True)
     """Twitter ID"""
 
-    screen_name = models.CharField('ユーザー名', max_length=15)
+    screen_name = models.CharField('ユーザー名', max_length=15, db_index=True)
     """ユーザー名"""
 
     name = models.CharField('名前', max_length=20)
@@ -143,12 +579,18 @@ class User(AbstractBaseUser):
     updated_at = models.DateTimeField('更新日時', auto_now=True)
     """更新日時"""
 
+    profile_checked_at = models.DateTimeField('プロフィール確認日時', null=True, blank=True)
+    """プロフィール確認日時(変更がない場合も含めてTwitterのプロフィールと比較した日時)"""
+
     objects = UserManager()
     """マネージャー"""
 
     USERNAME_FIELD = 'twitter_id'
     """Twitter IDをusernameとして使用する"""
 
+    PROFILE_FIELDS = ('screen_name', 'name', 'description', 'location', 'url', 'profile_image_url')
+    """Twitterのプロフィールと同期するフィールド"""
+
     def __str__(self):
         """
         当モデルの文字列表現を取得する。
@@ -178,3 +620,289 @@ class User(AbstractBaseUser):
         """
         # ユーザー名を返す
         return self.screen_name
+
+    def has_perm(self, perm, obj=None):
+        """
+        指定された権限を持っているかどうかを判定する。
+        権限は個別に管理せず、有効な管理者はすべての権限を、管理画面操作権限を持つユーザーはtwingo2の権限のみを持つものとする。
+
+        :param perm: 権限名
+        :type perm: str
+        :param obj: 対象のオブジェクト
+        :type obj: object
+        :return: 権限を持っている場合はTrue
+        :rtype: bool
+        """
+        return self.has_module_perms(perm.split('.', 1)[0])
+
+    def has_module_perms(self, app_label):
+        """
+        指定されたアプリケーションの権限を持っているかどうかを判定する。
+        管理画面操作権限のみを持つユーザーには、ホストプロジェクトの他のアプリケーションの権限を与えない。
+
+        :param app_label: アプリケーション名
+        :type app_label: str
+        :return: 権限を持っている場合はTrue
+        :rtype: bool
+        """
+        return self.is_active and (self.is_superuser or (self.is_staff and app_label == self._meta.app_label))
+
+    def update_profile(self, **profile):
+        """
+        Twitterのプロフィールと比較し、変更されたフィールドのみを更新する。
+        変更がない場合はプロフィール確認日時のみを更新する。
+
+        :param profile: PROFILE_FIELDSに含まれるフィールド名とその値
+        :type profile: dict
+        :return: 更新したフィールド名のリスト
+        :rtype: list
+        """
+        # 変更されたフィールドのみを更新する
+        changed_fields = self.apply_profile(**profile)
+        self.profile_checked_at = timezone.now()
+        if changed_fields:
+            self.save(update_fields=changed_fields + ['updated_at', 'profile_checked_at'])
+        else:
+            # 変更がない場合はシグナル(キャッシュの破棄)を発生させずに確認日時のみを記録する
+            type(self).objects.using(self._state.db).filter(pk=self.pk).update(
+                profile_checked_at=self.profile_checked_at
+            )
+        return changed_fields
+
+    def apply_profile(self, **profile):
+        """
+        Twitterのプロフィールと比較し、変更されたフィールドのみを当オブジェクトに反映する。
+        データベースへの保存は行わない。
+
+        :param profile: PROFILE_FIELDSに含まれるフィールド名とその値
+        :type profile: dict
+        :return: 変更されたフィールド名のリスト
+        :rtype: list
+        """
+        # 変更前のユーザー名をキャッシュの破棄のために保持する
+        if 'screen_name' in profile and self.screen_name != profile['screen_name']:
+            self._previous_screen_name = self.screen_name
+
+        # 変更されたフィールドを反映する
+        changed_fields = []
+        for field_name in self.PROFILE_FIELDS:
+            if field_name in profile and getattr(self, field_name) != profile[field_name]:
+                setattr(self, field_name, profile[field_name])
+                changed_fields.append(field_name)
+        return changed_fields
+
+
+class AccessTokenManager(models.Manager):
+    """
+    AccessTokenモデルを制御するマネージャー。
+    """
+
+    def save_token(self, user, access_token):
+        """
+        ユーザーのアクセストークンを暗号化して保存する。
+
+        :param user: ユーザー情報
+        :type user: twingo2.models.User
+        :param access_token: アクセストークン
+        :type access_token: tuple
+        """
+        # アクセストークンを暗号化する
+        encrypted_token, key_id = encryption.encrypt(json.dumps(list(access_token)))
+
+        # 既存のレコードを更新し、存在しなければ作成する(シャーディングが有効な場合はユーザーと同じシャードに保存する)
+        tokens = self.db_manager(self._db or sharding.get_database(user))
+        values = {'encrypted_token': encrypted_token, 'key_id': key_id, 'updated_at': timezone.now()}
+        if tokens.filter(user=user).update(**values):
+            return
+        try:
+            with transaction.atomic(using=tokens.db):
+                tokens.create(user=user, **values)
+        except IntegrityError:
+            # 並行して作成された場合は作成済みのレコードを更新する
+            tokens.filter(user=user).update(**values)
+
+    def bulk_update_tokens(self, tokens, previous):
+        """
+        複数のアクセストークンの暗号文を1回のUPDATEで更新する。
+        バインドするパラメーターの数がデータベースの上限を超える場合は複数のUPDATEに分割する。
+        読み込んだ後にsave_token()などで更新されたレコードは上書きしない。
+
+        :param tokens: 更新するAccessTokenのリスト
+        :type tokens: list
+        :param previous: 主キーをキー、読み込んだ時点の暗号文を値とする辞書
+        :type previous: dict
+        :return: 更新した件数
+        :rtype: int
+        """
+        # 更新対象が存在しない場合は何もしない
+        if not tokens:
+            return 0
+
+        # 1件あたり、2つのCASE式に2個ずつと、条件に2個のパラメーターをバインドする
+        batch_size = get_batch_size(self._db or router.db_for_write(self.model), 6) or len(tokens)
+        updated = 0
+        for start in range(0, len(tokens), batch_size):
+            batch = tokens[start:start + batch_size]
+
+            # レコードごとの値をCASE式で指定する
+            updates = {}
+            for field_name in ('encrypted_token', 'key_id'):
+                field = self.model._meta.get_field(field_name)
+                whens = [When(pk=token.pk, then=Value(getattr(token, field_name))) for token in batch]
+                updates[field_name] = Case(*whens, output_field=field)
+
+            # 読み込んだ時点から暗号文が変わっていないレコードのみを一括更新する
+            condition = reduce(operator.or_, (Q(pk=token.pk, encrypted_token=previous[token.pk]) for token in batch))
+            updated += self.filter(condition).update(**updates)
+        return updated
+
+
+class AccessToken(models.Model):
+    """
+    ユーザーのアクセストークンを暗号化して格納するモデル。
+    """
+
+    user = models.OneToOneField(User, verbose_name='ユーザー', primary_key=True, related_name='access_token')
+    """ユーザー"""
+
+    encrypted_token = models.TextField('暗号化されたアクセストークン')
+    """暗号化されたアクセストークン"""
+
+    key_id = models.CharField('暗号鍵ID', max_length=16, db_index=True)
+    """暗号化に使用した暗号鍵のID"""
+
+    updated_at = models.DateTimeField('更新日時', auto_now=True)
+    """更新日時"""
+
+    objects = AccessTokenManager()
+    """マネージャー"""
+
+    def __str__(self):
+        """
+        当モデルの文字列表現を取得する。
+
+        :return: モデルの文字列表現
+        :rtype: str
+        """
+        # ユーザーのIDを返す
+        return str(self.user_id)
+
+    def get_access_token(self):
+        """
+        復号したアクセストークンを取得する。
+
+        :return: アクセストークン
+        :rtype: tuple
+        """
+        # 復号してタプルに変換する
+        return tuple(json.loads(encryption.decrypt(self.encrypted_token)))
+
+
+class ProfileImage(models.Model):
+    """
+    ローカルに保存したプロフィール画像の情報を格納するモデル。
+    画像はハッシュ値をもとにした名前でストレージに保存する。
+    """
+
+    user = models.OneToOneField(User, verbose_name='ユーザー', primary_key=True, related_name='profile_image')
+    """ユーザー"""
+
+    source_url = models.URLField('取得元のURL')
+    """取得元のURL(User.profile_image_urlと異なる場合は再取得が必要)"""
+
+    digest = models.CharField('ハッシュ値', max_length=64)
+    """画像のSHA-256ハッシュ値"""
+
+    extension = models.CharField('拡張子', max_length=4)
+    """画像の拡張子"""
+
+    updated_at = models.DateTimeField('更新日時', auto_now=True)
+    """更新日時"""
+
+    def __str__(self):
+        """
+        当モデルの文字列表現を取得する。
+
+        :return: モデルの文字列表現
+        :rtype: str
+        """
+        # ハッシュ値を返す
+        return self.digest
+
+
+class UserSearchTokenManager(models.Manager):
+    """
+    UserSearchTokenモデルを制御するマネージャー。
+    """
+
+    def index_user(self, user, created=False):
+        """
+        ユーザーのトークンを更新する。
+        既存のトークンと比較し、差分のみを削除/追加する。
+
+        :param user: ユーザー情報
+        :type user: twingo2.models.User
+        :param created: ユーザーが作成された直後の場合はTrue(既存のトークンを取得しない)
+        :type created: bool
+        """
+        # 既存のトークンとの差分を求める
+        db = self._db or router.db_for_write(self.model, instance=user)
+        tokens = search.get_tokens(user)
+        existing = set() if created else set(self.using(db).filter(user=user).values_list('token', flat=True))
+
+        # 差分のみを更新する
+        removed = existing - tokens
+        if removed:
+            self.using(db).filter(user=user, token__in=removed).delete()
+        added = tokens - existing
+        if added:
+            self.using(db).bulk_create([self.model(user=user, token=token) for token in sorted(added)])
+
+    def index_users(self, users):
+        """
+        複数のユーザーのトークンを作成し直す。
+
+        :param users: ユーザー情報のリスト
+        :type users: list
+        """
+        # 既存のトークンを削除して一括登録する(削除はパラメーター数の上限に収まるように分割する)
+        if not users:
+            return
+        db = self._db or router.db_for_write(self.model)
+        user_ids = [user.pk for user in users]
+        batch_size = get_batch_size(db, 1) or len(user_ids)
+        for start in range(0, len(user_ids), batch_size):
+            self.using(db).filter(user__in=user_ids[start:start + batch_size]).delete()
+        self.using(db).bulk_create([
+            self.model(user_id=user.pk, token=token) for user in users for token in sorted(search.get_tokens(user))
+        ])
+
+
+class UserSearchToken(models.Model):
+    """
+    ユーザーの検索に使用するトークン索引を格納するモデル。
+    ネイティブな全文検索の索引を持たないデータベースで使用する。
+    """
+
+    user = models.ForeignKey(User, verbose_name='ユーザー', related_name='search_tokens')
+    """ユーザー"""
+
+    token = models.CharField('トークン', max_length=search.TOKEN_MAX_LENGTH)
+    """ユーザー名、名前、自己紹介に含まれる小文字の単語(かな、漢字、ハングルはn-gram)"""
+
+    objects = UserSearchTokenManager()
+    """マネージャー"""
+
+    class Meta:
+        unique_together = ('user', 'token')
+        index_together = ('token', 'user')
+
+    def __str__(self):
+        """
+        当モデルの文字列表現を取得する。
+
+        :return: モデルの文字列表現
+        :rtype: str
+        """
+        # トークンを返す
+        return self.token
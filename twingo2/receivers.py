@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from django.contrib.auth import SESSION_KEY
+from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from twingo2 import images, search, sharding
+from twingo2.cache import api_client_cache, primary_pin_cache, screen_name_cache, user_cache
+from twingo2.models import AccessToken, User, UserSearchToken
+
+
+@receiver(post_save, sender=User)
+def pin_user_to_primary(sender, instance, **kwargs):
+    """
+    Userの作成/更新時に、レプリカに反映されるまでの間はプライマリから読み込むよう記録する。
+    キャッシュの破棄より先に記録し、破棄後の読み込みで古い値がキャッシュされることを防ぐ。
+
+    :param sender: シグナルの送信元モデル
+    :type sender: type
+    :param instance: 作成/更新されたユーザー
+    :type instance: twingo2.models.User
+    :param kwargs: シグナルの引数
+    :type kwargs: dict
+    """
+    # プライマリに固定する
+    primary_pin_cache.pin(sharding.get_user_id(instance))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_cache(sender, instance, using, **kwargs):
+    """
+    Userの更新/削除時にキャッシュを破棄する。
+    トランザクション内の更新/削除はまだコミットされていないため、コミットまでの間に更新前の値がキャッシュされないようにする。
+
+    :param sender: シグナルの送信元モデル
+    :type sender: type
+    :param instance: 更新/削除されたユーザー
+    :type instance: twingo2.models.User
+    :param using: データベースのエイリアス
+    :type using: str
+    :param kwargs: シグナルの引数
+    :type kwargs: dict
+    """
+    # キャッシュを破棄する(作成時は更新前の値が存在しないためコミットを待たない)
+    pending = not kwargs.get('created') and transaction.get_connection(using).in_atomic_block
+    user_cache.invalidate(sharding.get_user_id(instance), pending=pending)
+    screen_name_cache.invalidate(instance)
+
+
+@receiver(post_delete, sender=AccessToken)
+def invalidate_api_client_cache(sender, instance, **kwargs):
+    """
+    AccessTokenの削除時にAPIオブジェクトのキャッシュを破棄する。
+
+    :param sender: シグナルの送信元モデル
+    :type sender: type
+    :param instance: 削除されたアクセストークン
+    :type instance: twingo2.models.AccessToken
+    :param kwargs: シグナルの引数
+    :type kwargs: dict
+    """
+    # キャッシュを破棄する
+    api_client_cache.invalidate(sharding.get_user_id(instance))
+
+
+@receiver(post_save, sender=User)
+def schedule_profile_image_refresh(sender, instance, created, update_fields, **kwargs):
+    """
+    Userの作成時、またはプロフィール画像のURLの更新時にプロフィール画像の取得を予約する。
+
+    :param sender: シグナルの送信元モデル
+    :type sender: type
+    :param instance: 作成/更新されたユーザー
+    :type instance: twingo2.models.User
+    :param created: 作成された場合はTrue
+    :type created: bool
+    :param update_fields: 更新されたフィールド名(すべてのフィールドを更新した場合はNone)
+    :type update_fields: frozenset
+    :param kwargs: シグナルの引数
+    :type kwargs: dict
+    """
+    # プロフィール画像のURLが変更された可能性がある場合のみ予約する
+    if not images.is_enabled() or not instance.profile_image_url:
+        return
+    if created or update_fields is None or 'profile_image_url' in update_fields:
+        images.pipeline.schedule(instance.pk, instance.profile_image_url)
+
+
+@receiver(post_save, sender=User)
+def update_search_index(sender, instance, created, update_fields, using, **kwargs):
+    """
+    Userの作成時、または検索対象のフィールドの更新時にトークン索引を更新する。
+
+    :param sender: シグナルの送信元モデル
+    :type sender: type
+    :param instance: 作成/更新されたユーザー
+    :type instance: twingo2.models.User
+    :param created: 作成された場合はTrue
+    :type created: bool
+    :param update_fields: 更新されたフィールド名(すべてのフィールドを更新した場合はNone)
+    :type update_fields: frozenset
+    :param using: データベースのエイリアス
+    :type using: str
+    :param kwargs: シグナルの引数
+    :type kwargs: dict
+    """
+    # 検索対象のフィールドが変更された可能性がある場合のみ更新する
+    if not search.uses_token_index(using):
+        return
+    if created or update_fields is None or set(update_fields) & set(search.SEARCH_FIELDS):
+        UserSearchToken.objects.db_manager(using).index_user(instance, created=created)
+
+
+@receiver(user_logged_in)
+def store_sharded_user_id(sender, request, user, **kwargs):
+    """
+    シャーディングが有効な場合、ログイン時にセッションに格納するユーザーIDをシャードを含む値に置き換える。
+    主キーはシャードごとに採番されるため、主キーのみではユーザーを特定できない。
+
+    :param sender: シグナルの送信元クラス
+    :type sender: type
+    :param request: リクエストオブジェクト
+    :type request: django.http.HttpRequest
+    :param user: ログインしたユーザー
+    :type user: twingo2.models.User
+    :param kwargs: シグナルの引数
+    :type kwargs: dict
+    """
+    # シャーディングが無効な場合は何もしない
+    if not sharding.is_enabled() or not isinstance(user, User):
+        return
+
+    # TwitterBackend.get_user()に渡されるユーザーIDを置き換える
+    request.session[SESSION_KEY] = str(sharding.get_user_id(user))
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from collections import namedtuple
+import re
+
+from twingo2.cache import screen_name_cache
+from twingo2.models import User
+
+
+SCREEN_NAME_PATTERN = re.compile(r'^[A-Za-z0-9_]{1,15}$')
+"""Twitterのユーザー名として有効な文字列"""
+
+MENTION_PATTERN = re.compile(r'(?<![A-Za-z0-9_!@＠#$%&*])[@＠]([A-Za-z0-9_]{1,15})(?![A-Za-z0-9_@＠]|://)')
+"""テキスト中の@ユーザー名(メールアドレスや16文字以上の文字列は除く)"""
+
+Mention = namedtuple('Mention', ('start', 'end', 'screen_name', 'user'))
+"""テキスト中の@ユーザー名の位置(@を含む)と対応するユーザー"""
+
+
+def resolve_screen_name(screen_name):
+    """
+    ユーザー名(大文字小文字を区別しない)に対応するユーザーを取得する。
+    SCREEN_NAME_CACHE_TIMEOUTが設定されている場合はキャッシュを使用する。
+
+    :param screen_name: ユーザー名(先頭の@は無視する)
+    :type screen_name: str
+    :return: ユーザー情報(存在しない場合はNone)
+    :rtype: twingo2.models.User
+    """
+    # 1件のみを一括取得する
+    screen_name = screen_name.lstrip('@')
+    return resolve_screen_names([screen_name]).get(screen_name.lower())
+
+
+def resolve_screen_names(screen_names):
+    """
+    複数のユーザー名(大文字小文字を区別しない)に対応するユーザーを取得する。
+    キャッシュへの問い合わせは1回、データベースへの問い合わせはキャッシュに存在しないユーザー名500件ごとに1回とする。
+
+    :param screen_names: ユーザー名のリスト
+    :type screen_names: list
+    :return: 小文字のユーザー名をキー、ユーザー情報を値とする辞書(存在しないユーザー名は含まない)
+    :rtype: dict
+    """
+    # ユーザー名として無効な文字列は問い合わせない
+    names = sorted({name.lower() for name in screen_names if SCREEN_NAME_PATTERN.match(name)})
+    if not names:
+        return {}
+    return screen_name_cache.get_many(names, User.objects.in_bulk_by_screen_name)
+
+
+def resolve_mentions(texts):
+    """
+    複数のテキストに含まれる@ユーザー名を抽出し、対応するユーザーをまとめて取得する。
+    すべてのテキストのユーザー名を1回の問い合わせで解決するため、テキストの数によらず問い合わせの回数は一定となる。
+
+    :param texts: テキストのリスト
+    :type texts: list
+    :return: テキストごとの、ユーザーが存在する@ユーザー名の位置(Mention)のリスト
+    :rtype: list
+    """
+    # すべてのテキストからユーザー名を抽出する
+    matches = [list(MENTION_PATTERN.finditer(text or '')) for text in texts]
+    users = resolve_screen_names([match.group(1) for text_matches in matches for match in text_matches])
+
+    # ユーザーが存在するユーザー名のみを位置とともに返却する
+    return [
+        [
+            Mention(match.start(), match.end(), match.group(1), users[match.group(1).lower()])
+            for match in text_matches if match.group(1).lower() in users
+        ]
+        for text_matches in matches
+    ]
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import random
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, router
+
+from twingo2.cache import primary_pin_cache
+
+
+APP_LABEL = 'twingo2'
+"""ReplicaRouterが振り分けるアプリケーション"""
+
+
+def get_read_databases():
+    """
+    読み込み専用のデータベース(レプリカ)のエイリアスを取得する。
+
+    :return: USER_READ_DATABASESに設定されたエイリアスのタプル
+    :rtype: tuple
+    """
+    return tuple(getattr(settings, 'USER_READ_DATABASES', ()))
+
+
+def get_read_database(model, user_id=None):
+    """
+    モデルを読み込むデータベースのエイリアスを取得する。
+    レプリカが設定されていない場合、または指定されたユーザーが書き込み直後である場合はプライマリを返却する。
+
+    :param model: モデルのクラス
+    :type model: type
+    :param user_id: 読み込むユーザーのID
+    :type user_id: int
+    :return: データベースのエイリアス
+    :rtype: str
+    """
+    # 書き込み直後のユーザーはレプリカに反映されていない可能性があるためプライマリから読み込む
+    databases = get_read_databases()
+    if not databases or (user_id is not None and primary_pin_cache.is_pinned(user_id)):
+        return router.db_for_write(model)
+
+    # いずれかのレプリカから読み込む
+    return random.choice(databases)
+
+
+class ReplicaRouter:
+    """
+    twingo2のモデルの読み込みをレプリカ、書き込みをプライマリに振り分けるデータベースルーター。
+    USER_READ_DATABASESを設定した場合はDATABASE_ROUTERSに追加すること。
+    """
+
+    def db_for_read(self, model, **hints):
+        """
+        読み込みに使用するデータベースを決定する。
+
+        :param model: モデルのクラス
+        :type model: type
+        :param hints: ヒント
+        :type hints: dict
+        :return: データベースのエイリアス(判断しない場合はNone)
+        :rtype: str
+        """
+        # twingo2のモデルのみをいずれかのレプリカに振り分ける
+        databases = get_read_databases()
+        if model._meta.app_label != APP_LABEL or not databases:
+            return None
+        return random.choice(databases)
+
+    def db_for_write(self, model, **hints):
+        """
+        書き込みに使用するデータベースを決定する。
+        レプリカから読み込んだインスタンスを保存した場合もプライマリに書き込む。
+
+        :param model: モデルのクラス
+        :type model: type
+        :param hints: ヒント
+        :type hints: dict
+        :return: データベースのエイリアス(判断しない場合はNone)
+        :rtype: str
+        """
+        # twingo2のモデルはプライマリに書き込む
+        if model._meta.app_label != APP_LABEL:
+            return None
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """
+        2つのインスタンスの間のリレーションを許可するかどうかを決定する。
+
+        :param obj1: インスタンス
+        :type obj1: django.db.models.Model
+        :param obj2: インスタンス
+        :type obj2: django.db.models.Model
+        :param hints: ヒント
+        :type hints: dict
+        :return: プライマリとレプリカの間のリレーションであればTrue(判断しない場合はNone)
+        :rtype: bool
+        """
+        # プライマリとレプリカは同じデータを持つため相互のリレーションを許可する
+        databases = {DEFAULT_DB_ALIAS} | set(get_read_databases())
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        """
+        マイグレーションを許可するかどうかを決定する。
+
+        :param db: データベースのエイリアス
+        :type db: str
+        :param app_label: アプリケーション名
+        :type app_label: str
+        :param model_name: モデル名
+        :type model_name: str
+        :param hints: ヒント
+        :type hints: dict
+        :return: レプリカへのtwingo2のマイグレーションであればFalse(判断しない場合はNone)
+        :rtype: bool
+        """
+        # レプリカにはプライマリから複製されるためマイグレーションしない
+        if app_label == APP_LABEL and db in get_read_databases():
+            return False
+        return None
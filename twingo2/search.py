@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import re
+
+from django.conf import settings
+from django.db import connections
+
+
+SEARCH_FIELDS = ('screen_name', 'name', 'description')
+"""検索対象のフィールド"""
+
+TOKEN_MAX_LENGTH = 30
+"""索引に格納するトークンの最大長"""
+
+TOKEN_PATTERN = re.compile(r'\w+')
+"""トークンとして切り出す文字列"""
+
+CJK_PATTERN = re.compile(
+    '([\u3040-\u30ff\u31f0-\u31ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\uff66-\uff9f]+)'
+)
+"""単語の区切りがないため、n-gramに分割する文字列(かな、漢字、ハングル)"""
+
+NGRAM_SIZE = 2
+"""かな、漢字、ハングルを分割するn-gramの文字数"""
+
+
+def is_index_enabled():
+    """
+    トークン索引テーブルの更新が有効であるかどうかを判定する。
+
+    :return: USER_SEARCH_INDEX_ENABLEDが設定されていればTrue
+    :rtype: bool
+    """
+    return getattr(settings, 'USER_SEARCH_INDEX_ENABLED', False)
+
+
+def is_native(using):
+    """
+    データベースのネイティブな索引(pg_trgm)で検索するかどうかを判定する。
+
+    :param using: データベースのエイリアス
+    :type using: str
+    :return: PostgreSQLの場合はTrue
+    :rtype: bool
+    """
+    return connections[using].vendor == 'postgresql'
+
+
+def uses_token_index(using):
+    """
+    トークン索引テーブルを更新/使用するかどうかを判定する。
+
+    :param using: データベースのエイリアス
+    :type using: str
+    :return: トークン索引テーブルの更新が有効で、ネイティブな索引を使用しない場合はTrue
+    :rtype: bool
+    """
+    return is_index_enabled() and not is_native(using)
+
+
+def tokenize(text):
+    """
+    テキストを小文字のトークンに分割する。
+    アンダースコアを含むトークンは、分割した各部分もトークンとする。
+    かな、漢字、ハングルの連続はNGRAM_SIZE文字ずつのn-gramに分割する(NGRAM_SIZE文字未満の場合はそのままトークンとする)。
+
+    :param text: テキスト
+    :type text: str
+    :return: トークンの集合
+    :rtype: set
+    """
+    tokens = set()
+    for word in TOKEN_PATTERN.findall((text or '').lower()):
+        for i, token in enumerate(CJK_PATTERN.split(word)):
+            # かな、漢字、ハングルの連続をn-gramに分割する
+            if i % 2:
+                count = max(len(token) - NGRAM_SIZE + 1, 1)
+                tokens.update(token[j:j + NGRAM_SIZE] for j in range(count))
+                continue
+
+            # それ以外はアンダースコアで分割した各部分もトークンとする
+            parts = token.split('_') if '_' in token else []
+            for part in [token] + parts:
+                if part.strip('_'):
+                    tokens.add(part[:TOKEN_MAX_LENGTH])
+    return tokens
+
+
+def get_tokens(user):
+    """
+    ユーザーの検索対象のフィールドからトークンを取得する。
+
+    :param user: ユーザー情報
+    :type user: twingo2.models.User
+    :return: トークンの集合
+    :rtype: set
+    """
+    tokens = set()
+    for field_name in SEARCH_FIELDS:
+        tokens.update(tokenize(getattr(user, field_name)))
+    return tokens
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import hashlib
+
+from django.conf import settings
+
+
+APP_LABEL = 'twingo2'
+"""ShardRouterが振り分けるアプリケーション"""
+
+MAX_SHARDS = 1000
+"""シャードの最大数(セッションに格納するユーザーIDの下3桁がシャードの番号となる)"""
+
+
+def is_enabled():
+    """
+    シャーディングが有効であるかどうかを判定する。
+
+    :return: USER_SHARD_DATABASESが設定されていればTrue
+    :rtype: bool
+    """
+    return bool(getattr(settings, 'USER_SHARD_DATABASES', ()))
+
+
+def get_shards():
+    """
+    シャードのデータベースのエイリアスを取得する。
+    シャードの番号はセッションに格納されるため、シャードを追加する場合は末尾に追加すること。
+
+    :return: USER_SHARD_DATABASESに設定されたエイリアスのタプル
+    :rtype: tuple
+    """
+    return tuple(getattr(settings, 'USER_SHARD_DATABASES', ()))
+
+
+def get_previous_shards():
+    """
+    移行前のシャードのデータベースのエイリアスを取得する。
+    シャードの追加やシャーディングの有効化の後、twingo2_rebalance_shardsによる移動が完了するまでの間に設定する。
+
+    :return: USER_SHARD_PREVIOUS_DATABASESに設定されたエイリアスのタプル
+    :rtype: tuple
+    """
+    return tuple(getattr(settings, 'USER_SHARD_PREVIOUS_DATABASES', ()))
+
+
+def get_shard(twitter_id):
+    """
+    Twitter IDに対応するシャードを取得する。
+    プロセスごとに値が変わるhash()ではなく、SHA-1による安定したハッシュ値で振り分ける。
+
+    :param twitter_id: Twitter ID
+    :type twitter_id: int
+    :return: データベースのエイリアス
+    :rtype: str
+    """
+    return _select_shard(get_shards(), twitter_id)
+
+
+def get_previous_shard(twitter_id):
+    """
+    移行前にTwitter IDが対応していたシャードを取得する。
+
+    :param twitter_id: Twitter ID
+    :type twitter_id: int
+    :return: データベースのエイリアス(移行中でない場合、または移行の前後で同じシャードの場合はNone)
+    :rtype: str
+    """
+    previous_shards = get_previous_shards()
+    if not previous_shards or not is_enabled():
+        return None
+    shard = _select_shard(previous_shards, twitter_id)
+    return shard if shard != get_shard(twitter_id) else None
+
+
+def _select_shard(shards, twitter_id):
+    """
+    Twitter IDのハッシュ値でシャードを選択する。
+
+    :param shards: シャードのデータベースのエイリアスのタプル
+    :type shards: tuple
+    :param twitter_id: Twitter ID
+    :type twitter_id: int
+    :return: データベースのエイリアス
+    :rtype: str
+    """
+    digest = hashlib.sha1(str(twitter_id).encode('ascii')).hexdigest()
+    return shards[int(digest, 16) % len(shards)]
+
+
+def get_database(instance):
+    """
+    シャーディングが有効な場合に、インスタンスが格納されているシャードを取得する。
+
+    :param instance: モデルのインスタンス
+    :type instance: django.db.models.Model
+    :return: データベースのエイリアス(無効な場合はNone)
+    :rtype: str
+    """
+    return instance._state.db if is_enabled() else None
+
+
+def get_user_id(instance):
+    """
+    セッションやキャッシュのキーとして使用するユーザーIDを取得する。
+    シャーディングが有効な場合は、シャードごとの主キーにシャードの番号を付加した値を返却する。
+
+    :param instance: ユーザー、またはユーザーを主キーとするモデルのインスタンス
+    :type instance: django.db.models.Model
+    :return: ユーザーID
+    :rtype: int
+    """
+    # 無効な場合、またはシャード以外のデータベースのインスタンスは主キーをそのまま使用する
+    shards = get_shards()
+    if instance._state.db not in shards:
+        return instance.pk
+
+    # 主キーの後ろにシャードの番号を付加する
+    return instance.pk * MAX_SHARDS + shards.index(instance._state.db)
+
+
+def split_user_id(user_id):
+    """
+    get_user_id()で取得したユーザーIDをシャードと主キーに分解する。
+
+    :param user_id: ユーザーID
+    :type user_id: int
+    :return: データベースのエイリアス(無効な場合はNone)と主キーのタプル
+    :rtype: tuple
+    :raises ValueError: 存在しないシャードを指すユーザーIDの場合
+    """
+    # 無効な場合は主キーとして扱う
+    if not is_enabled():
+        return None, user_id
+
+    # 下3桁をシャードの番号として分解する
+    shards = get_shards()
+    pk, index = divmod(int(user_id), MAX_SHARDS)
+    if index >= len(shards):
+        raise ValueError('User ID %s does not belong to any shard.' % user_id)
+    return shards[index], pk
+
+
+class ShardRouter:
+    """
+    Userを作成する際にTwitter IDに対応するシャードに振り分けるデータベースルーター。
+    USER_SHARD_DATABASESを設定した場合はDATABASE_ROUTERSに追加すること。
+    保存済みのインスタンスやユーザーに関連付けたインスタンスは、Djangoの標準の動作によりユーザーと同じシャードに書き込まれる。
+    """
+
+    def db_for_read(self, model, **hints):
+        """
+        読み込みに使用するデータベースを決定する。
+        シャードを特定できないため判断しない。
+
+        :param model: モデルのクラス
+        :type model: type
+        :param hints: ヒント
+        :type hints: dict
+        :return: None
+        :rtype: str
+        """
+        return None
+
+    def db_for_write(self, model, **hints):
+        """
+        書き込みに使用するデータベースを決定する。
+
+        :param model: モデルのクラス
+        :type model: type
+        :param hints: ヒント
+        :type hints: dict
+        :return: データベースのエイリアス(判断しない場合はNone)
+        :rtype: str
+        """
+        # 未保存のUserのみをTwitter IDに対応するシャードに振り分ける
+        instance = hints.get('instance')
+        if not is_enabled() or model._meta.app_label != APP_LABEL or model._meta.model_name != 'user':
+            return None
+        if instance is None or instance._state.db is not None or not instance.twitter_id:
+            return None
+        return get_shard(instance.twitter_id)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """
+        2つのインスタンスの間のリレーションを許可するかどうかを決定する。
+
+        :param obj1: インスタンス
+        :type obj1: django.db.models.Model
+        :param obj2: インスタンス
+        :type obj2: django.db.models.Model
+        :param hints: ヒント
+        :type hints: dict
+        :return: 同じシャードであればTrue、異なるシャードであればFalse(判断しない場合はNone)
+        :rtype: bool
+        """
+        # シャードをまたぐリレーションは許可しない
+        shards = get_shards()
+        if obj1._state.db in shards and obj2._state.db in shards:
+            return obj1._state.db == obj2._state.db
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        """
+        マイグレーションを許可するかどうかを決定する。
+        すべてのシャードが同じテーブルを持つため判断しない。
+
+        :param db: データベースのエイリアス
+        :type db: str
+        :param app_label: アプリケーション名
+        :type app_label: str
+        :param model_name: モデル名
+        :type model_name: str
+        :param hints: ヒント
+        :type hints: dict
+        :return: None
+        :rtype: bool
+        """
+        return None
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from django.dispatch import Signal
+
+
+login_phase_finished = Signal(providing_args=['phase', 'duration'])
+"""ログイン処理の各段階が完了した際に送信されるシグナル(LOGIN_METRICS_ENABLEDが有効な場合のみ)"""
+
+login_failed = Signal(providing_args=['request', 'reason'])
+"""ログインに失敗した際に送信されるシグナル(LOGIN_METRICS_ENABLEDが有効な場合のみ)"""
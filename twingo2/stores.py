@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.utils.crypto import constant_time_compare, get_random_string
+from django.utils.module_loading import import_string
+
+from twingo2 import encryption
+
+
+def get_pending_login_store():
+    """
+    PENDING_LOGIN_STOREで指定されたストアを取得する。
+
+    :return: ログイン処理中の情報を保管するストア
+    :rtype: SessionStore
+    """
+    # 指定されたクラスのインスタンスを返す
+    store_class = import_string(getattr(settings, 'PENDING_LOGIN_STORE', 'twingo2.stores.SessionStore'))
+    return store_class()
+
+
+def get_pending_login_timeout():
+    """
+    ログイン処理中の情報を保管する秒数を取得する。
+
+    :return: 保管する秒数
+    :rtype: int
+    """
+    return getattr(settings, 'PENDING_LOGIN_TIMEOUT', 600)
+
+
+def get_pending_login_cookie_name():
+    """
+    ログイン処理中の情報(またはその照合用の値)を保管するクッキーの名前を取得する。
+
+    :return: クッキーの名前
+    :rtype: str
+    """
+    return getattr(settings, 'PENDING_LOGIN_COOKIE_NAME', 'twingo2_login')
+
+
+def _set_pending_login_cookie(response, value):
+    """
+    ログイン処理中の情報を保管するクッキーを設定する。
+
+    :param response: レスポンスオブジェクト
+    :type response: django.http.HttpResponse
+    :param value: クッキーの値
+    :type value: str
+    """
+    response.set_cookie(
+        get_pending_login_cookie_name(),
+        value,
+        max_age=get_pending_login_timeout(),
+        domain=settings.SESSION_COOKIE_DOMAIN,
+        secure=settings.SESSION_COOKIE_SECURE or None,
+        httponly=True
+    )
+
+
+def _delete_pending_login_cookie(response):
+    """
+    ログイン処理中の情報を保管するクッキーを削除する。
+
+    :param response: レスポンスオブジェクト
+    :type response: django.http.HttpResponse
+    """
+    response.delete_cookie(get_pending_login_cookie_name(), domain=settings.SESSION_COOKIE_DOMAIN)
+
+
+class SessionStore:
+    """
+    ログイン処理中の情報をセッションに保管するストア。
+    """
+
+    def save(self, request, response, data):
+        """
+        ログイン処理中の情報を保管する。
+
+        :param request: リクエストオブジェクト
+        :type request: django.http.HttpRequest
+        :param response: レスポンスオブジェクト
+        :type response: django.http.HttpResponse
+        :param data: リクエストトークン(request_token)とログイン後の遷移先(next)
+        :type data: dict
+        """
+        # セッションに保存する
+        request.session['request_token'] = data['request_token']
+        if data.get('next'):
+            request.session['next'] = data['next']
+
+    def load(self, request):
+        """
+        ログイン処理中の情報を取得する。
+
+        :param request: リクエストオブジェクト
+        :type request: django.http.HttpRequest
+        :return: リクエストトークン(request_token)とログイン後の遷移先(next)
+        :rtype: dict
+        """
+        # セッションから取得する
+        request_token = request.session.get('request_token')
+        if not request_token:
+            return None
+        return {'request_token': request_token, 'next': request.session.get('next')}
+
+    def clear(self, request, response, failed=False):
+        """
+        ログイン処理中の情報を破棄する。
+        認証に失敗した場合は、ログイン処理中の情報以外も含めてセッションを空にする。
+
+        :param request: リクエストオブジェクト
+        :type request: django.http.HttpRequest
+        :param response: レスポンスオブジェクト
+        :type response: django.http.HttpResponse
+        :param failed: 認証に失敗した場合はTrue
+        :type failed: bool
+        """
+        # 認証に失敗した場合はセッションを空にする
+        if failed:
+            request.session.clear()
+            return
+
+        # セッションから削除する
+        request.session.pop('request_token', None)
+        request.session.pop('next', None)
+
+
+class CacheStore:
+    """
+    ログイン処理中の情報をキャッシュに保管するストア。
+    Twitterからのコールバックに含まれるoauth_tokenをキーとするため、セッションを使用しない。
+    共有キャッシュを使用すれば、どのノードでもコールバックを処理できる。
+    他人のブラウザに攻撃者のリクエストトークンでコールバックさせるログインCSRFを防ぐため、
+    ランダムな値を短期間のhttponlyクッキーに保存し、コールバック時にキャッシュの値と照合する。
+    """
+
+    def save(self, request, response, data):
+        """
+        ログイン処理中の情報を保管する。
+
+        :param request: リクエストオブジェクト
+        :type request: django.http.HttpRequest
+        :param response: レスポンスオブジェクト
+        :type response: django.http.HttpResponse
+        :param data: リクエストトークン(request_token)とログイン後の遷移先(next)
+        :type data: dict
+        """
+        # ログインを開始したブラウザを照合するための値をクッキーに保存する
+        nonce = get_random_string(32)
+        _set_pending_login_cookie(response, nonce)
+
+        # リクエストトークンをキーとしてキャッシュに保存する
+        key = self._make_key(data['request_token']['oauth_token'])
+        self._get_cache().set(key, dict(data, nonce=nonce), get_pending_login_timeout())
+
+    def load(self, request):
+        """
+        ログイン処理中の情報を取得する。
+
+        :param request: リクエストオブジェクト
+        :type request: django.http.HttpRequest
+        :return: リクエストトークン(request_token)とログイン後の遷移先(next)
+        :rtype: dict
+        """
+        # コールバックのoauth_tokenをキーとしてキャッシュから取得する
+        oauth_token = request.GET.get('oauth_token')
+        nonce = request.COOKIES.get(get_pending_login_cookie_name())
+        if not oauth_token or not nonce:
+            return None
+        data = self._get_cache().get(self._make_key(oauth_token))
+
+        # ログインを開始したブラウザからのコールバックでなければ取得しない
+        if not data or not constant_time_compare(data.pop('nonce', ''), nonce):
+            return None
+        return data
+
+    def clear(self, request, response, failed=False):
+        """
+        ログイン処理中の情報を破棄する。
+
+        :param request: リクエストオブジェクト
+        :type request: django.http.HttpRequest
+        :param response: レスポンスオブジェクト
+        :type response: django.http.HttpResponse
+        :param failed: 認証に失敗した場合はTrue(セッションを使用しないため区別しない)
+        :type failed: bool
+        """
+        # 同じリクエストトークンを再利用できないようにキャッシュから削除する
+        oauth_token = request.GET.get('oauth_token')
+        if oauth_token:
+            self._get_cache().delete(self._make_key(oauth_token))
+        _delete_pending_login_cookie(response)
+
+    def _make_key(self, oauth_token):
+        """
+        キャッシュのキーを生成する。
+
+        :param oauth_token: リクエストトークン
+        :type oauth_token: str
+        :return: キャッシュのキー
+        :rtype: str
+        """
+        # キーを生成する
+        return 'twingo2:pending_login:%s' % oauth_token
+
+    def _get_cache(self):
+        """
+        キャッシュを取得する。
+
+        :return: キャッシュ
+        :rtype: django.core.cache.backends.base.BaseCache
+        """
+        return caches[getattr(settings, 'PENDING_LOGIN_CACHE_ALIAS', 'default')]
+
+
+class SignedCookieStore:
+    """
+    ログイン処理中の情報を署名付きクッキーに保管するストア。
+    サーバー側には何も保存しない。
+    署名は暗号化ではないため、リクエストトークンのシークレットはTOKEN_ENCRYPTION_KEYSで暗号化してから保存する。
+    """
+
+    salt = 'twingo2.stores.SignedCookieStore'
+    """署名に使用するソルト"""
+
+    def save(self, request, response, data):
+        """
+        ログイン処理中の情報を保管する。
+
+        :param request: リクエストオブジェクト
+        :type request: django.http.HttpRequest
+        :param response: レスポンスオブジェクト
+        :type response: django.http.HttpResponse
+        :param data: リクエストトークン(request_token)とログイン後の遷移先(next)
+        :type data: dict
+        """
+        # ブラウザから参照できないようにシークレットを暗号化する
+        request_token = dict(data['request_token'])
+        if request_token.get('oauth_token_secret'):
+            request_token['oauth_token_secret'], _ = encryption.encrypt(request_token['oauth_token_secret'])
+
+        # 署名付きのクッキーに保存する
+        _set_pending_login_cookie(
+            response, signing.dumps(dict(data, request_token=request_token), salt=self.salt, compress=True)
+        )
+
+    def load(self, request):
+        """
+        ログイン処理中の情報を取得する。
+
+        :param request: リクエストオブジェクト
+        :type request: django.http.HttpRequest
+        :return: リクエストトークン(request_token)とログイン後の遷移先(next)
+        :rtype: dict
+        """
+        # 署名と有効期限を検証する
+        value = request.COOKIES.get(get_pending_login_cookie_name())
+        if not value:
+            return None
+        try:
+            data = signing.loads(value, salt=self.salt, max_age=get_pending_login_timeout())
+        except signing.BadSignature:
+            return None
+
+        # 暗号化したシークレットを復号する
+        request_token = data['request_token']
+        if request_token.get('oauth_token_secret'):
+            try:
+                request_token['oauth_token_secret'] = encryption.decrypt(request_token['oauth_token_secret'])
+            except encryption.InvalidToken:
+                return None
+        return data
+
+    def clear(self, request, response, failed=False):
+        """
+        ログイン処理中の情報を破棄する。
+
+        :param request: リクエストオブジェクト
+        :type request: django.http.HttpRequest
+        :param response: レスポンスオブジェクト
+        :type response: django.http.HttpResponse
+        :param failed: 認証に失敗した場合はTrue(セッションを使用しないため区別しない)
+        :type failed: bool
+        """
+        # クッキーを削除する
+        _delete_pending_login_cookie(response)
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from contextlib import contextmanager
+
+from requests.adapters import HTTPAdapter
+
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+
+class CaptureRequestsContext:
+    """
+    requestsによる外部へのHTTPリクエストを記録するコンテキストマネージャー。
+    tweepyとrequests_oauthlibによる通信はすべてHTTPAdapter.send()を経由するため、これを置き換えて記録する。
+    """
+
+    def __init__(self):
+        """
+        CaptureRequestsContextを構築する。
+        """
+        # 内部状態を初期化する
+        self.captured_requests = []
+        self._original_send = None
+
+    def __len__(self):
+        """
+        記録したリクエストの数を取得する。
+
+        :return: リクエストの数
+        :rtype: int
+        """
+        return len(self.captured_requests)
+
+    def __enter__(self):
+        """
+        記録を開始する。
+
+        :return: 当オブジェクト
+        :rtype: CaptureRequestsContext
+        """
+        # 送信前にメソッドとURLを記録する
+        original_send = self._original_send = HTTPAdapter.send
+        captured_requests = self.captured_requests
+
+        def send(adapter, request, *args, **kwargs):
+            captured_requests.append('%s %s' % (request.method, request.url))
+            return original_send(adapter, request, *args, **kwargs)
+
+        HTTPAdapter.send = send
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """
+        記録を終了する。
+
+        :param exc_type: 送出された例外の型
+        :type exc_type: type
+        :param exc_value: 送出された例外
+        :type exc_value: Exception
+        :param traceback: トレースバック
+        :type traceback: traceback
+        """
+        # 元のメソッドに戻す
+        HTTPAdapter.send = self._original_send
+
+
+class BudgetTestMixin:
+    """
+    データベースへのクエリ数と外部へのHTTPリクエスト数を検証するアサーションを提供するMixin。
+    django.test.TestCaseと組み合わせて使用する。
+    """
+
+    @contextmanager
+    def assertBudget(self, queries=None, requests=None, using='default'):
+        """
+        ブロック内で実行されたクエリ数とHTTPリクエスト数が指定された数と一致することを検証する。
+        Noneを指定した項目は検証しない。
+
+        :param queries: 期待するクエリ数
+        :type queries: int
+        :param requests: 期待するHTTPリクエスト数
+        :type requests: int
+        :param using: クエリ数を検証するデータベースのエイリアス
+        :type using: str
+        """
+        with CaptureQueriesContext(connections[using]) as captured_queries, \
+                CaptureRequestsContext() as captured_requests:
+            yield
+
+        # 一致しない場合は実行された内容を出力する
+        if queries is not None:
+            self.assertEqual(
+                queries, len(captured_queries),
+                '%d queries executed, %d expected\nCaptured queries were:\n%s' % (
+                    len(captured_queries), queries,
+                    '\n'.join(query['sql'] for query in captured_queries.captured_queries)
+                )
+            )
+        if requests is not None:
+            self.assertEqual(
+                requests, len(captured_requests),
+                '%d HTTP requests sent, %d expected\nCaptured requests were:\n%s' % (
+                    len(captured_requests), requests, '\n'.join(captured_requests.captured_requests)
+                )
+            )
+
+    def assertNumRequests(self, num):
+        """
+        ブロック内で送信されたHTTPリクエスト数が指定された数と一致することを検証する。
+
+        :param num: 期待するHTTPリクエスト数
+        :type num: int
+        :return: コンテキストマネージャー
+        :rtype: contextlib._GeneratorContextManager
+        """
+        return self.assertBudget(requests=num)
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import time
+
+from django.conf import settings
+from django.core import signing
+
+from twingo2 import sharding
+
+
+SALT = 'twingo2.tokens'
+"""署名に使用するソルト"""
+
+
+class TokenUser:
+    """
+    署名付きトークンから復元したユーザー情報。
+    データベースにアクセスせずにrequest.userとして使用する。
+    """
+
+    is_active = True
+    """有効"""
+
+    is_superuser = False
+    """管理者権限(トークンには含まれないため常にFalse)"""
+
+    def __init__(self, payload):
+        """
+        TokenUserを構築する。
+
+        :param payload: トークンに格納されたユーザー情報
+        :type payload: dict
+        """
+        # ユーザー情報を設定する
+        self.id = self.pk = payload['i']
+        self.screen_name = payload['s']
+        self.is_staff = payload['t']
+
+    def __str__(self):
+        """
+        当オブジェクトの文字列表現を取得する。
+
+        :return: ユーザー名
+        :rtype: str
+        """
+        # ユーザー名を返す
+        return self.screen_name
+
+    def __eq__(self, other):
+        """
+        他のユーザーと同一であるかどうかを判定する。
+
+        :param other: 比較対象
+        :type other: object
+        :return: 同一のユーザーであればTrue
+        :rtype: bool
+        """
+        # IDで比較する
+        return isinstance(other, self.__class__) and self.pk == other.pk
+
+    def __hash__(self):
+        """
+        ハッシュ値を取得する。
+
+        :return: ハッシュ値
+        :rtype: int
+        """
+        # IDのハッシュ値を返す
+        return hash(self.pk)
+
+    def is_anonymous(self):
+        """
+        匿名ユーザーであるかどうか。
+
+        :return: 常にFalse
+        :rtype: bool
+        """
+        return False
+
+    def is_authenticated(self):
+        """
+        認証済みユーザーであるかどうか。
+
+        :return: 常にTrue
+        :rtype: bool
+        """
+        return True
+
+    def get_short_name(self):
+        """
+        短縮名を取得する。
+
+        :return: 短縮名
+        :rtype: str
+        """
+        # ユーザー名を返す
+        return self.screen_name
+
+    def get_username(self):
+        """
+        ユーザー名を取得する。
+
+        :return: ユーザー名
+        :rtype: str
+        """
+        # ユーザー名を返す
+        return self.screen_name
+
+    def has_perm(self, perm, obj=None):
+        """
+        指定された権限を持っているかどうかを判定する。
+        User.has_perm()と同様に、管理画面操作権限を持つユーザーはtwingo2の権限のみを持つものとする。
+
+        :param perm: 権限名
+        :type perm: str
+        :param obj: 対象のオブジェクト
+        :type obj: object
+        :return: 権限を持っている場合はTrue
+        :rtype: bool
+        """
+        return self.has_module_perms(perm.split('.', 1)[0])
+
+    def has_perms(self, perm_list, obj=None):
+        """
+        指定されたすべての権限を持っているかどうかを判定する。
+
+        :param perm_list: 権限名のリスト
+        :type perm_list: list
+        :param obj: 対象のオブジェクト
+        :type obj: object
+        :return: すべての権限を持っている場合はTrue
+        :rtype: bool
+        """
+        return all(self.has_perm(perm, obj) for perm in perm_list)
+
+    def has_module_perms(self, app_label):
+        """
+        指定されたアプリケーションの権限を持っているかどうかを判定する。
+
+        :param app_label: アプリケーション名
+        :type app_label: str
+        :return: 権限を持っている場合はTrue
+        :rtype: bool
+        """
+        return self.is_staff and app_label == 'twingo2'
+
+
+def is_enabled():
+    """
+    署名付きトークンによる認証が有効であるかどうか。
+
+    :return: SIGNED_TOKEN_MAX_AGEが設定されていればTrue
+    :rtype: bool
+    """
+    return bool(getattr(settings, 'SIGNED_TOKEN_MAX_AGE', None))
+
+
+def make_payload(user):
+    """
+    トークンに格納するユーザー情報を生成する。
+
+    :param user: ユーザー情報
+    :type user: twingo2.models.User
+    :return: トークンに格納するユーザー情報
+    :rtype: dict
+    """
+    # 必要最小限の情報を短いキーで格納する
+    return {
+        'i': sharding.get_user_id(user),
+        's': user.screen_name,
+        't': user.is_staff,
+        'a': int(time.time()),
+    }
+
+
+def issue_token(user):
+    """
+    ユーザー情報を格納した署名付きトークンを発行する。
+
+    :param user: ユーザー情報
+    :type user: twingo2.models.User
+    :return: トークン
+    :rtype: str
+    """
+    # ユーザー情報を格納する
+    return dump_token(make_payload(user))
+
+
+def dump_token(payload):
+    """
+    ユーザー情報を署名付きトークンに変換する。
+
+    :param payload: トークンに格納するユーザー情報
+    :type payload: dict
+    :return: トークン
+    :rtype: str
+    """
+    # 署名を付与して圧縮する
+    return signing.dumps(payload, salt=SALT, compress=True)
+
+
+def load_token(token):
+    """
+    署名付きトークンを検証し、格納されたユーザー情報を取得する。
+
+    :param token: トークン
+    :type token: str
+    :return: ユーザー情報(不正なトークンまたは有効期限切れの場合はNone)
+    :rtype: dict
+    """
+    # 署名と有効期限を検証する
+    try:
+        return signing.loads(token, salt=SALT, max_age=settings.SIGNED_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+
+
+def needs_refresh(payload):
+    """
+    トークンの再検証が必要であるかどうかを判定する。
+
+    :param payload: トークンに格納されたユーザー情報
+    :type payload: dict
+    :return: 発行からSIGNED_TOKEN_REFRESH_INTERVALで指定された秒数が経過していればTrue
+    :rtype: bool
+    """
+    # 発行からの経過時間をチェックする
+    refresh_interval = getattr(settings, 'SIGNED_TOKEN_REFRESH_INTERVAL', 300)
+    return time.time() - payload['a'] >= refresh_interval
+
+
+def get_cookie_name():
+    """
+    トークンを格納するクッキーの名前を取得する。
+
+    :return: クッキーの名前
+    :rtype: str
+    """
+    return getattr(settings, 'SIGNED_TOKEN_COOKIE_NAME', 'twingo2_token')
+
+
+def set_token_cookie(response, token):
+    """
+    トークンをクッキーに設定する。
+
+    :param response: レスポンスオブジェクト
+    :type response: django.http.HttpResponse
+    :param token: トークン
+    :type token: str
+    """
+    # セッションクッキーと同じ属性で設定する
+    response.set_cookie(
+        get_cookie_name(),
+        token,
+        max_age=settings.SIGNED_TOKEN_MAX_AGE,
+        domain=settings.SESSION_COOKIE_DOMAIN,
+        secure=settings.SESSION_COOKIE_SECURE or None,
+        httponly=True
+    )
+
+
+def delete_token_cookie(response):
+    """
+    トークンをクッキーから削除する。
+
+    :param response: レスポンスオブジェクト
+    :type response: django.http.HttpResponse
+    """
+    response.delete_cookie(get_cookie_name(), domain=settings.SESSION_COOKIE_DOMAIN)
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+import tweepy.binder
+
+from django.conf import settings
+
+
+DEFAULT_TIMEOUT = 10
+"""TWITTER_TIMEOUTが設定されていない場合のタイムアウト(秒)"""
+
+
+def get_timeout():
+    """
+    Twitterとの通信のタイムアウトを取得する。
+    応答しないTwitterへの通信がワーカーを占有し続けないよう、設定されていない場合もDEFAULT_TIMEOUTを適用する。
+
+    :return: タイムアウト(秒。TWITTER_TIMEOUTにNoneを設定した場合はNone)
+    :rtype: float
+    """
+    return getattr(settings, 'TWITTER_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """
+    タイムアウトが指定されていないリクエストにTWITTER_TIMEOUTを適用するHTTPアダプター。
+    """
+
+    def send(self, request, timeout=None, **kwargs):
+        """
+        リクエストを送信する。
+        タイムアウトが指定されていない場合はTWITTER_TIMEOUTを適用する。
+
+        :param request: リクエスト
+        :type request: requests.PreparedRequest
+        :param timeout: タイムアウト(秒)
+        :type timeout: float
+        :param kwargs: HTTPAdapter.send()の引数
+        :type kwargs: dict
+        :return: レスポンス
+        :rtype: requests.Response
+        """
+        # タイムアウトを補完して送信する
+        if timeout is None:
+            timeout = get_timeout()
+        return super().send(request, timeout=timeout, **kwargs)
+
+
+class SharedHTTPAdapter(TimeoutHTTPAdapter):
+    """
+    複数のセッションで共有するHTTPアダプター。
+    個々のセッションが閉じられてもコネクションプールは維持する。
+    """
+
+    def close(self):
+        """
+        セッションから閉じられた場合は何もしない。
+        """
+        pass
+
+    def shutdown(self):
+        """
+        コネクションプールを破棄する。
+        """
+        super().close()
+
+
+class Transport:
+    """
+    twingo2によるTwitterへの通信で共有するコネクションプール。
+    """
+
+    def __init__(self, pool_connections, pool_maxsize, pool_block, shared=True):
+        """
+        Transportを構築する。
+
+        :param pool_connections: 保持するホストごとのプールの数
+        :type pool_connections: int
+        :param pool_maxsize: ホストごとに保持するコネクションの最大数
+        :type pool_maxsize: int
+        :param pool_block: 最大数に達した場合に空きを待つ場合はTrue
+        :type pool_block: bool
+        :param shared: コネクションプールを共有せずタイムアウトのみを適用する場合はFalse
+        :type shared: bool
+        """
+        # 共有するアダプターを構築する
+        self.shared = shared
+        self.adapter = SharedHTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block
+        )
+
+    def mount(self, session):
+        """
+        セッションに共有のアダプターを設定する。
+
+        :param session: セッション
+        :type session: requests.Session
+        :return: 設定したセッション
+        :rtype: requests.Session
+        """
+        # HTTPとHTTPSの両方に設定する(共有しない場合はセッションごとにアダプターを生成する)
+        adapter = self.adapter if self.shared else TimeoutHTTPAdapter()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def session(self):
+        """
+        共有のアダプターを設定したセッションを生成する。
+        ヘッダーなどのセッションの状態は共有されないため、スレッド間で安全に使用できる。
+
+        :return: セッション
+        :rtype: requests.Session
+        """
+        return self.mount(requests.Session())
+
+    def get_stats(self):
+        """
+        コネクションプールの統計情報を取得する。
+
+        :return: ホストごとの統計情報のリスト
+        :rtype: list
+        """
+        # ホストごとに集計する
+        stats = []
+        pools = self.adapter.poolmanager.pools
+        for (scheme, host, port) in pools.keys():
+            pool = pools.get((scheme, host, port))
+            if pool is None:
+                continue
+            stats.append({
+                'scheme': scheme,
+                'host': host,
+                'port': port,
+                'connections': pool.num_connections,
+                'requests': pool.num_requests,
+                'idle': sum(1 for conn in list(pool.pool.queue) if conn is not None),
+            })
+        return stats
+
+
+class _PooledRequests:
+    """
+    tweepyから参照されるrequestsモジュールの代替。
+    セッションの生成とrequests.post()を共有のコネクションプール経由に置き換える。
+    """
+
+    def __getattr__(self, name):
+        """
+        置き換えない属性はrequestsモジュールのものを返す。
+
+        :param name: 属性名
+        :type name: str
+        :return: 属性値
+        :rtype: object
+        """
+        return getattr(requests, name)
+
+    def Session(self):
+        """
+        共有のアダプターを設定したセッションを生成する。
+
+        :return: セッション
+        :rtype: requests.Session
+        """
+        return get_transport().session()
+
+    def post(self, url, **kwargs):
+        """
+        共有のコネクションプールを使用してPOSTリクエストを送信する。
+
+        :param url: URL
+        :type url: str
+        :param kwargs: requests.post()の引数
+        :type kwargs: dict
+        :return: レスポンス
+        :rtype: requests.Response
+        """
+        return get_transport().session().post(url, **kwargs)
+
+
+_transport = None
+_lock = threading.Lock()
+
+
+def get_transport():
+    """
+    プロセス内で共有するTransportを取得する。
+
+    :return: Transport
+    :rtype: Transport
+    """
+    global _transport
+    with _lock:
+        if _transport is None:
+            _transport = Transport(
+                getattr(settings, 'TWITTER_POOL_CONNECTIONS', 4),
+                getattr(settings, 'TWITTER_POOL_MAXSIZE', None) or 10,
+                getattr(settings, 'TWITTER_POOL_BLOCK', False),
+                bool(getattr(settings, 'TWITTER_POOL_MAXSIZE', None))
+            )
+        return _transport
+
+
+def install():
+    """
+    tweepyによるAPIの呼び出しが共有のコネクションプールを使用するように設定する。
+    tweepyはAPIの呼び出しごとにセッションを生成し、差し替える手段を提供していないため、
+    tweepyが参照するrequestsモジュールを置き換える。
+    プロセス内のtwingo2以外によるtweepyの呼び出しにも適用されるため、TWITTER_POOL_MAXSIZEを設定した場合のみ呼び出す。
+    OAuthのトークン取得はtwingo2.twitterのOAuthHandlerとAppAuthHandlerが個別に共有のアダプターを設定する。
+    """
+    # tweepyが参照する名前を置き換える
+    tweepy.binder.requests = _PooledRequests()
+
+
+def get_pool_stats():
+    """
+    共有のコネクションプールの統計情報を取得する。
+
+    :return: ホストごとの統計情報のリスト
+    :rtype: list
+    """
+    return get_transport().get_stats()
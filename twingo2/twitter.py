@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright 2015-2019 HASEBA Junya
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import time
+
+from tweepy import API, auth
+from tweepy.error import TweepError
+
+from django.conf import settings
+
+from twingo2 import sharding, transport
+from twingo2.cache import api_client_cache
+from twingo2.models import AccessToken
+
+
+LOOKUP_USERS_LIMIT = 100
+"""users/lookupで一度に取得できるユーザー数の上限"""
+
+
+def get_app_api():
+    """
+    アプリケーション認証によるAPIオブジェクトを取得する。
+    ユーザーのアクセストークンを必要としない一括処理で使用する。
+
+    :return: APIオブジェクト
+    :rtype: tweepy.API
+    """
+    # APIオブジェクトを構築する
+    auth_handler = AppAuthHandler(settings.CONSUMER_KEY, settings.CONSUMER_SECRET)
+    return API(auth_handler, timeout=transport.get_timeout())
+
+
+def get_api(user):
+    """
+    ユーザーのアクセストークンによるAPIオブジェクトを取得する。
+    構築したAPIオブジェクトはAPI_CLIENT_CACHE_SIZE件まで再利用される。
+
+    :param user: ユーザー情報
+    :type user: twingo2.models.User
+    :return: APIオブジェクト(アクセストークンが保存されていない場合はNone)
+    :rtype: tweepy.API
+    """
+    # キャッシュを経由してAPIオブジェクトを取得する
+    return api_client_cache.get(sharding.get_user_id(user), _build_user_api)
+
+
+def _build_user_api(user_id):
+    """
+    保存されたアクセストークンからAPIオブジェクトを構築する。
+
+    :param user_id: UserのID(シャーディングが有効な場合はsharding.get_user_id()で取得した値)
+    :type user_id: int
+    :return: APIオブジェクト(アクセストークンが保存されていない場合はNone)
+    :rtype: tweepy.API
+    """
+    # 保存されたアクセストークンを取得する
+    db, pk = sharding.split_user_id(user_id)
+    try:
+        access_token = AccessToken.objects.db_manager(db).get(pk=pk).get_access_token()
+    except AccessToken.DoesNotExist:
+        return None
+
+    # APIオブジェクトを構築する
+    oauth_handler = auth.OAuthHandler(settings.CONSUMER_KEY, settings.CONSUMER_SECRET)
+    oauth_handler.set_access_token(access_token[0], access_token[1])
+    return API(oauth_handler, timeout=transport.get_timeout())
+
+
+class AppAuthHandler(auth.AppAuthHandler):
+    """
+    ベアラートークンの取得にTWITTER_TIMEOUTと共有のコネクションプールを使用するAppAuthHandler。
+    """
+
+    def __init__(self, consumer_key, consumer_secret):
+        """
+        ベアラートークンを取得してAppAuthHandlerを構築する。
+
+        :param consumer_key: Consumer Key
+        :type consumer_key: str
+        :param consumer_secret: Consumer Secret
+        :type consumer_secret: str
+        """
+        # tweepyはrequests.post()で取得するため、twingo2のセッションで取得し直す
+        self.consumer_key = consumer_key
+        self.consumer_secret = consumer_secret
+        self._bearer_token = ''
+        with transport.get_transport().session() as session:
+            resp = session.post(
+                self._get_oauth_url('token'),
+                auth=(self.consumer_key, self.consumer_secret),
+                data={'grant_type': 'client_credentials'}
+            )
+        data = resp.json()
+        if data.get('token_type') != 'bearer':
+            raise TweepError('Expected token_type to equal "bearer", but got %s instead' % data.get('token_type'))
+        self._bearer_token = data['access_token']
+
+
+class OAuthHandler(auth.OAuthHandler):
+    """
+    アクセストークンの取得時に返却されたユーザー情報を保持するOAuthHandler。
+    アクセストークンの応答にはuser_idとscreen_nameが含まれるため、
+    認証時にverify_credentialsを呼び出さずにユーザーを特定できる。
+    リクエストトークンとアクセストークンの取得にはTWITTER_TIMEOUTと共有のコネクションプールを使用する。
+    """
+
+    user_id = None
+    """アクセストークンの取得時に返却されたTwitter ID"""
+
+    screen_name = None
+    """アクセストークンの取得時に返却されたスクリーンネーム"""
+
+    def __init__(self, *args, **kwargs):
+        """
+        OAuthHandlerを構築する。
+
+        :param args: tweepy.OAuthHandlerの位置引数
+        :type args: tuple
+        :param kwargs: tweepy.OAuthHandlerのキーワード引数
+        :type kwargs: dict
+        """
+        # リクエストトークンの取得に使用するセッションにアダプターを設定する
+        super().__init__(*args, **kwargs)
+        transport.get_transport().mount(self.oauth)
+
+    def get_access_token(self, verifier=None):
+        """
+        アクセストークンを取得する。
+
+        :param verifier: Twitterから返却されたoauth_verifier
+        :type verifier: str
+        :return: アクセストークン
+        :rtype: tuple
+        """
+        # アダプターを設定したセッションで取得する
+        try:
+            url = self._get_oauth_url('access_token')
+            self.oauth = transport.get_transport().mount(auth.OAuth1Session(
+                self.consumer_key,
+                client_secret=self.consumer_secret,
+                resource_owner_key=self.request_token['oauth_token'],
+                resource_owner_secret=self.request_token['oauth_token_secret'],
+                verifier=verifier,
+                callback_uri=self.callback
+            ))
+            resp = self.oauth.fetch_access_token(url)
+            self.access_token = resp['oauth_token']
+            self.access_token_secret = resp['oauth_token_secret']
+        except Exception as e:
+            raise TweepError(e)
+
+        # 応答に含まれるユーザー情報を保持する
+        user_id = resp.get('user_id')
+        self.user_id = int(user_id) if user_id and str(user_id).isdigit() else None
+        self.screen_name = resp.get('screen_name')
+        return self.access_token, self.access_token_secret
+
+
+class RateLimiter:
+    """
+    一定時間あたりのリクエスト数を上限以下に抑えるためのクラス。
+    """
+
+    def __init__(self, rate):
+        """
+        RateLimiterを構築する。
+
+        :param rate: 1秒あたりのリクエスト数の上限
+        :type rate: float
+        """
+        # 内部状態を初期化する
+        self._interval = 1.0 / rate
+        self._next_time = None
+
+    def wait(self):
+        """
+        次のリクエストを送信できるまで待機する。
+        """
+        # 前回のリクエストから一定時間が経過するまで待機する
+        now = time.monotonic()
+        if self._next_time is not None and now < self._next_time:
+            time.sleep(self._next_time - now)
+            now = self._next_time
+        self._next_time = now + self._interval
+
+
+def chunked(iterable, size):
+    """
+    イテラブルを指定された件数ごとのリストに分割する。
+
+    :param iterable: 分割対象のイテラブル
+    :type iterable: iterable
+    :param size: 1リストあたりの件数
+    :type size: int
+    :return: 分割したリストを返すジェネレーター
+    :rtype: generator
+    """
+    # 指定された件数ごとにリストを返す
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
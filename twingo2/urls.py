@@ -28,4 +28,10 @@ urlpatterns = patterns('twingo2.views',
 
     # ログアウト
     url(r'^logout/$', 'twitter_logout', name='twingo2_logout'),
+
+    # ローカルに保存したプロフィール画像
+    url(
+        r'^profile_images/(?P<name>[0-9a-f]{64}(?:_\d+)?\.(?:jpg|png|gif|webp))$',
+        'twitter_profile_image', name='twingo2_profile_image'
+    ),
 )
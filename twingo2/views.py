@@ -16,12 +16,18 @@
 # limitations under the License.
 #
 
-from tweepy import OAuthHandler
+import mimetypes
 
 from django.conf import settings
 from django.contrib.auth import authenticate, login, logout
 from django.core.urlresolvers import reverse
-from django.http import HttpResponse, HttpResponseRedirect
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, HttpResponseRedirect
+from django.utils.module_loading import import_string
+
+from twingo2 import images, metrics, tokens
+from twingo2.circuit import CircuitOpenError, is_unavailable_error, twitter_breaker
+from twingo2.stores import get_pending_login_store
+from twingo2.twitter import OAuthHandler
 
 
 def twitter_login(request):
@@ -39,17 +45,25 @@ def twitter_login(request):
         settings.CONSUMER_SECRET,
         request.build_absolute_uri(reverse(twitter_callback))
     )
-    authorization_url = oauth_handler.get_authorization_url()
-
-    # リクエストトークンをセッションに保存する
-    request.session['request_token'] = oauth_handler.request_token
+    try:
+        with metrics.timer('get_authorization_url'), twitter_breaker:
+            authorization_url = oauth_handler.get_authorization_url()
+    except Exception as e:
+        # Twitterが応答できない場合は503を返却する
+        if isinstance(e, CircuitOpenError) or is_unavailable_error(e):
+            return _service_unavailable(request)
+        metrics.record_failure(request, 'authorization_url_error')
+        raise
 
-    # ログイン完了後のリダイレクト先URLをセッションに保存する
-    if 'next' in request.GET:
-        request.session['next'] = request.GET['next']
+    # リクエストトークンとログイン完了後のリダイレクト先URLを保管する
+    response = HttpResponseRedirect(authorization_url)
+    get_pending_login_store().save(request, response, {
+        'request_token': oauth_handler.request_token,
+        'next': request.GET.get('next'),
+    })
 
     # 認証URLにリダイレクトする
-    return HttpResponseRedirect(authorization_url)
+    return response
 
 
 def twitter_callback(request):
@@ -61,37 +75,110 @@ def twitter_callback(request):
     :return: 遷移先を示すレスポンスオブジェクト
     :rtype: django.http.HttpResponse
     """
-    # セッションからリクエストトークンを取得する
-    request_token = request.session.get('request_token')
-    if not request_token:
-        request.session.clear()
-        return HttpResponse('Unauthorized', status=401)
+    # コールバック全体の所要時間を計測する
+    with metrics.timer('callback'):
+        return _twitter_callback(request)
+
+
+def _twitter_callback(request):
+    """
+    Twitterからのコールバックを処理する。
+
+    :param request: リクエストオブジェクト
+    :type request: django.http.HttpRequest
+    :return: 遷移先を示すレスポンスオブジェクト
+    :rtype: django.http.HttpResponse
+    """
+    # 保管しておいたリクエストトークンを取得する
+    store = get_pending_login_store()
+    pending_login = store.load(request)
+    if not pending_login:
+        return _unauthorized(request, store, 'missing_request_token')
+    request_token = pending_login['request_token']
 
     # Twitterからの返却値を取得する
     oauth_token = request.GET.get('oauth_token')
     oauth_verifier = request.GET.get('oauth_verifier')
 
-    # セッションの値とTwitterからの返却値が一致しない場合は処理を中断する
+    # 保管しておいた値とTwitterからの返却値が一致しない場合は処理を中断する
     if request_token.get('oauth_token') != oauth_token:
-        request.session.clear()
-        return HttpResponse('Unauthorized', status=401)
+        return _unauthorized(request, store, 'token_mismatch')
 
     # アクセストークンを取得する
     oauth_handler = OAuthHandler(settings.CONSUMER_KEY, settings.CONSUMER_SECRET)
     oauth_handler.request_token = request_token
-    access_token = oauth_handler.get_access_token(oauth_verifier)
+    try:
+        with metrics.timer('get_access_token'), twitter_breaker:
+            access_token = oauth_handler.get_access_token(oauth_verifier)
+    except Exception as e:
+        # Twitterが応答できない場合は503を返却する
+        if isinstance(e, CircuitOpenError) or is_unavailable_error(e):
+            return _service_unavailable(request)
+        metrics.record_failure(request, 'access_token_error')
+        raise
 
     # 認証処理を実行する
-    authenticated_user = authenticate(access_token=access_token)
+    # アクセストークンとともに返却されたTwitter IDを渡し、既知のユーザーであれば問い合わせを省略させる
+    with metrics.timer('authenticate'):
+        authenticated_user = authenticate(access_token=access_token, twitter_id=oauth_handler.user_id)
     if authenticated_user:
         login(request, authenticated_user)
+        metrics.record_success()
     else:
-        request.session.clear()
-        return HttpResponse('Unauthorized', status=401)
+        return _unauthorized(request, store, 'authentication_failed')
 
     # ログイン後に遷移すべき画面にリダイレクトする
-    url = request.session.get('next', getattr(settings, 'AFTER_LOGIN_URL', '/'))
-    return HttpResponseRedirect(url)
+    url = pending_login.get('next') or getattr(settings, 'AFTER_LOGIN_URL', '/')
+    response = HttpResponseRedirect(url)
+    store.clear(request, response)
+
+    # 署名付きトークンを発行する
+    if tokens.is_enabled():
+        tokens.set_token_cookie(response, tokens.issue_token(authenticated_user))
+    return response
+
+
+def _unauthorized(request, store, reason):
+    """
+    認証に失敗したことを示すレスポンスを生成する。
+
+    :param request: リクエストオブジェクト
+    :type request: django.http.HttpRequest
+    :param store: ログイン処理中の情報を保管するストア
+    :type store: twingo2.stores.SessionStore
+    :param reason: 失敗の原因
+    :type reason: str
+    :return: 401を示すレスポンスオブジェクト
+    :rtype: django.http.HttpResponse
+    """
+    # 失敗を記録し、ログイン処理中の情報を破棄する(SessionStoreの場合はセッションを空にする)
+    metrics.record_failure(request, reason)
+    response = HttpResponse('Unauthorized', status=401)
+    store.clear(request, response, failed=True)
+    return response
+
+
+def _service_unavailable(request):
+    """
+    Twitterが応答できないことを示すレスポンスを生成する。
+    TWITTER_UNAVAILABLE_VIEWが設定されている場合はそのビューに処理を委ねる。
+
+    :param request: リクエストオブジェクト
+    :type request: django.http.HttpRequest
+    :return: 503を示すレスポンスオブジェクト
+    :rtype: django.http.HttpResponse
+    """
+    # 失敗を記録し、指定されたビューに処理を委ねる
+    metrics.record_failure(request, 'twitter_unavailable')
+    view = getattr(settings, 'TWITTER_UNAVAILABLE_VIEW', None)
+    if view:
+        return import_string(view)(request)
+
+    # 遮断が解除されるまでの秒数を付与する
+    response = HttpResponse('Service Unavailable', status=503)
+    if twitter_breaker.retry_after:
+        response['Retry-After'] = str(twitter_breaker.retry_after)
+    return response
 
 
 def twitter_logout(request):
@@ -108,4 +195,65 @@ def twitter_logout(request):
 
     # ログアウト後に遷移すべき画面にリダイレクトする
     url = getattr(settings, 'AFTER_LOGOUT_URL', '/')
-    return HttpResponseRedirect(url)
+    response = HttpResponseRedirect(url)
+
+    # 署名付きトークンを削除する
+    if tokens.is_enabled():
+        tokens.delete_token_cookie(response)
+    return response
+
+
+def twitter_metrics(request):
+    """
+    ログイン処理のメトリクスをPrometheusのテキスト形式で返却する。
+    LOGIN_METRICS_ENABLEDが有効でない場合は404を返却する。
+
+    :param request: リクエストオブジェクト
+    :type request: django.http.HttpRequest
+    :return: メトリクスを格納したレスポンスオブジェクト
+    :rtype: django.http.HttpResponse
+    """
+    # 計測が無効な場合は存在しないものとする
+    if not metrics.is_enabled():
+        raise Http404
+
+    # メトリクスを返却する
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def twitter_profile_image(request, name):
+    """
+    ローカルに保存したプロフィール画像を返却する。
+    画像の名前は内容のハッシュ値であり変更されないため、長期間キャッシュさせる。
+    PROFILE_IMAGE_CACHE_ENABLEDが有効でない場合は404を返却する。
+
+    :param request: リクエストオブジェクト
+    :type request: django.http.HttpRequest
+    :param name: 画像の名前
+    :type name: str
+    :return: 画像を格納したレスポンスオブジェクト
+    :rtype: django.http.HttpResponse
+    """
+    # 無効な場合は存在しないものとする
+    if not images.is_enabled():
+        raise Http404
+
+    # ブラウザーが保持している画像と同じ場合は304を返却する
+    etag = '"%s"' % name.rsplit('.', 1)[0]
+    if etag in [t.strip() for t in request.META.get('HTTP_IF_NONE_MATCH', '').split(',')]:
+        response = HttpResponseNotModified()
+    else:
+        # ストレージから読み込んで返却する
+        storage = images.get_storage()
+        try:
+            f = storage.open(images.get_path(name))
+        except (IOError, OSError):
+            raise Http404
+        # FileResponseはレスポンスの送信後にファイルを閉じる
+        response = FileResponse(f, content_type=mimetypes.guess_type(name)[0])
+        response['Content-Length'] = f.size
+    response['ETag'] = etag
+    response['Cache-Control'] = 'public, max-age=%d, immutable' % getattr(
+        settings, 'PROFILE_IMAGE_MAX_AGE', 365 * 24 * 60 * 60
+    )
+    return response